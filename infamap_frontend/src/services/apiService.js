@@ -1,5 +1,6 @@
 import axios from 'axios';
 import { getMockFacilities, isFacilityTypeSupported, MOCK_ANALYTICS } from './mockData.js';
+import { decodePackedPoints, POINTS_MEDIA_TYPE } from './pointsDecoder.js';
 
 // Определяем базовый URL в зависимости от окружения
 // Временно используем прямое подключение для отладки
@@ -37,6 +38,17 @@ api.interceptors.response.use(
   }
 );
 
+// Запрос в компактном двоичном формате точек: в разы меньше JSON и быстрее
+// разбирается на мобильных. Результат — тот же объект, что и у JSON-версии.
+const getPoints = async (url, params = {}) => {
+  const response = await api.get(url, {
+    params: { ...params, format: 'points' },
+    headers: { Accept: POINTS_MEDIA_TYPE },
+    responseType: 'arraybuffer',
+  });
+  return { ...response, data: decodePackedPoints(response.data) };
+};
+
 export const apiService = {
   // Получить список школ
   async getSchools() {
@@ -44,7 +56,7 @@ export const apiService = {
       console.log('Запрашиваем школы с API...');
       console.log('Полный URL:', `${API_BASE_URL}/get-schools/`);
       
-      const response = await api.get('/get-schools/');
+      const response = await getPoints('/get-schools/');
       console.log('Ответ API успешен:', response.status);
       console.log('Заголовки ответа:', response.headers);
       console.log('Данные от API:', response.data);
@@ -62,7 +74,7 @@ export const apiService = {
       console.log('Запрашиваем клиники с API...');
       console.log('Полный URL:', `${API_BASE_URL}/get-clinics/`);
       
-      const response = await api.get('/get-clinics/');
+      const response = await getPoints('/get-clinics/');
       console.log('Ответ API успешен:', response.status);
       console.log('Заголовки ответа:', response.headers);
       console.log('Данные от API:', response.data);
@@ -74,6 +86,12 @@ export const apiService = {
     }
   },
 
+  // Шаблон URL тайлов покрытия для L.tileLayer: зелёным — зона охвата, красным — провалы.
+  // Тайлы строятся по предрасчитанному полю расстояний, смена радиуса не требует пересчёта.
+  getCoverageTileUrl(facilityType = 'schools', radius = 1500) {
+    return `${API_BASE_URL}coverage-tiles/${facilityType}/{z}/{x}/{y}.png?radius=${radius}`;
+  },
+
   // Универсальная функция для парсинга данных районов
   parseDistrictsData(data, defaultType) {
     let facilitiesData = data;
@@ -233,7 +251,7 @@ export const apiService = {
 
       // Получаем школы
       console.log('📡 Запрос школ...');
-      const schoolsResponse = await api.get('/get-schools/');
+      const schoolsResponse = await getPoints('/get-schools/');
       console.log('📊 Ответ школ:');
       console.log('  - Status:', schoolsResponse.status);
       console.log('  - StatusText:', schoolsResponse.statusText);
@@ -246,7 +264,7 @@ export const apiService = {
 
       // Получаем клиники
       console.log('📡 Запрос клиник...');
-      const clinicsResponse = await api.get('/get-clinics/');
+      const clinicsResponse = await getPoints('/get-clinics/');
       console.log('📊 Ответ клиник:');
       console.log('  - Status:', clinicsResponse.status);
       console.log('  - StatusText:', clinicsResponse.statusText);
@@ -716,10 +734,8 @@ export const apiService = {
       console.log(`Запрашиваем координаты для новых ${apiType} с API...`);
       console.log('Полный URL:', `${API_BASE_URL}/find-gaps/?type=${apiType}`);
       
-      const response = await api.get('/find-gaps/', {
-        params: {
-          type: apiType
-        }
+      const response = await getPoints('/find-gaps/', {
+        type: apiType
       });
       console.log('Ответ API успешен:', response.status);
       console.log(`Данные о новых ${apiType} по районам:`, response.data);
@@ -0,0 +1,66 @@
+// Декодер компактного двоичного формата точек (?format=points, см. buildings/renderers.py).
+//
+// Разметка ответа:
+//   "IMP1"            сигнатура и версия
+//   uint32 LE         длина JSON-заголовка
+//   заголовок         JSON: ответ, где наборы точек заменены на
+//                     {"$points": i, "count": n, "offset": o, "fields": {имя: [значения]}}
+//   выравнивание      до 4 байт
+//   тело              на набор: int32 LE lat[n], int32 LE lon[n] — микроградусы,
+//                     дельта-кодирование (первое значение абсолютное)
+//
+// Возвращает тот же объект, что и JSON-версия эндпоинта: наборы точек
+// разворачиваются в массивы {lat, lon, ...}, остальной код не меняется.
+
+export const POINTS_MEDIA_TYPE = 'application/x-inframap-points';
+
+const MAGIC = 'IMP1';
+const COORDINATE_SCALE = 1e6;
+
+function decodeDeltas(view, offset, count) {
+  const values = new Float64Array(count);
+  let current = 0;
+  for (let i = 0; i < count; i++) {
+    current += view.getInt32(offset + i * 4, true);
+    values[i] = current / COORDINATE_SCALE;
+  }
+  return values;
+}
+
+export function decodePackedPoints(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC) {
+    throw new Error(`Неизвестный формат ответа: ${magic}`);
+  }
+
+  const headerLength = view.getUint32(4, true);
+  const header = JSON.parse(new TextDecoder('utf-8').decode(new Uint8Array(buffer, 8, headerLength)));
+  const bodyStart = Math.ceil((8 + headerLength) / 4) * 4;
+
+  const expand = (value) => {
+    if (Array.isArray(value)) {
+      return value.map(expand);
+    }
+    if (value === null || typeof value !== 'object') {
+      return value;
+    }
+    if ('$points' in value) {
+      const { count, offset, fields } = value;
+      const lat = decodeDeltas(view, bodyStart + offset, count);
+      const lon = decodeDeltas(view, bodyStart + offset + count * 4, count);
+      const points = new Array(count);
+      for (let i = 0; i < count; i++) {
+        const point = { lat: lat[i], lon: lon[i] };
+        for (const name of Object.keys(fields)) {
+          point[name] = fields[name][i];
+        }
+        points[i] = point;
+      }
+      return points;
+    }
+    return Object.fromEntries(Object.entries(value).map(([key, item]) => [key, expand(item)]));
+  };
+
+  return expand(header);
+}
@@ -0,0 +1,84 @@
+"""
+Сравнение старого перебора geodesic() и CoverageEngine (KD-дерево в UTM).
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_coverage
+    python -m benchmarks.bench_coverage --sizes 10000 100000 1000000 --facilities 60
+
+Перебор geodesic() на больших сетках идёт часами, поэтому он меряется
+на подвыборке (--naive-sample точек) и экстраполируется линейно —
+его стоимость строго O(сетка × объекты).
+"""
+import argparse
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+from buildings.coverage_service import CoverageEngine
+
+# Примерные границы Бишкека
+LAT_RANGE = (42.80, 42.93)
+LON_RANGE = (74.50, 74.70)
+RADIUS_METERS = 1500
+
+
+def synthetic_points(n, rng):
+    lat = rng.uniform(*LAT_RANGE, size=n)
+    lon = rng.uniform(*LON_RANGE, size=n)
+    return lat, lon
+
+
+def naive_uncovered(grid_lat, grid_lon, facilities):
+    uncovered = 0
+    for point in zip(grid_lat, grid_lon):
+        if all(geodesic(point, f).meters > RADIUS_METERS for f in facilities):
+            uncovered += 1
+    return uncovered
+
+
+def run(sizes, n_facilities, naive_sample, seed=0):
+    rng = np.random.default_rng(seed)
+    fac_lat, fac_lon = synthetic_points(n_facilities, rng)
+    facilities = list(zip(fac_lat, fac_lon))
+
+    rows = []
+    for size in sizes:
+        grid_lat, grid_lon = synthetic_points(size, rng)
+
+        start = time.perf_counter()
+        engine = CoverageEngine(fac_lat, fac_lon)
+        mask = engine.uncovered_mask(grid_lat, grid_lon, RADIUS_METERS)
+        fast = time.perf_counter() - start
+
+        sample = min(size, naive_sample)
+        start = time.perf_counter()
+        naive_uncovered(grid_lat[:sample], grid_lon[:sample], facilities)
+        naive = (time.perf_counter() - start) * size / sample
+
+        rows.append({
+            "grid_points": size,
+            "facilities": n_facilities,
+            "uncovered": int(mask.sum()),
+            "kdtree_s": fast,
+            "geodesic_s": naive,
+            "speedup": naive / fast if fast else float("inf"),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--facilities", type=int, default=60)
+    parser.add_argument("--naive-sample", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'точек':>10} {'KD-дерево, с':>14} {'geodesic, с':>14} {'ускорение':>10}")
+    for row in run(args.sizes, args.facilities, args.naive_sample):
+        print(f"{row['grid_points']:>10} {row['kdtree_s']:>14.3f} "
+              f"{row['geodesic_s']:>14.1f} {row['speedup']:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
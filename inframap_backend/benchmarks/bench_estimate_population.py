@@ -0,0 +1,102 @@
+"""
+Подсчёт жилых зданий по районам для estimate_population: прежний путь
+(геокодирование границы и gpd.clip по всем зданиям) против предикатного
+запроса к STRtree с пересечением только пограничных зданий и границы,
+закэшированной в реестре регионов.
+
+Здания — синтетический город (benchmarks.fixtures), --districts районов
+по --per-district зданий; у срезанного угла и краёв района часть зданий
+выходит за границу. Районы считаются по очереди, чтобы сравнивать сам
+расчёт, а не пул потоков; «только геометрия» — на уже загруженных данных.
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_estimate_population
+    python -m benchmarks.bench_estimate_population --districts 80 --per-district 5000
+"""
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+
+import geopandas as gpd  # noqa: E402
+import shapely  # noqa: E402
+
+from benchmarks.fixtures import CITY, SyntheticCity, installed  # noqa: E402
+from buildings.feature_store import features_from_place, geocode_to_gdf  # noqa: E402
+from buildings.population_service import RESIDENTIAL_TAGS, _count_buildings, shares_within  # noqa: E402
+from buildings.regions import Region, RegionRegistry, set_default_registry  # noqa: E402
+
+
+def clip_count(district):
+    # Прежний _count_buildings
+    boundary = geocode_to_gdf(district)
+    buildings = features_from_place(district, RESIDENTIAL_TAGS)
+    return {"num_buildings": len(gpd.clip(buildings, boundary))}
+
+
+def timed_loop(func, districts):
+    started = time.perf_counter()
+    result = {district: func(district) for district in districts}
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--districts", type=int, default=40)
+    parser.add_argument("--per-district", type=int, default=5_000)
+    args = parser.parse_args()
+
+    city = SyntheticCity(args.districts, buildings_per_district=args.per_district)
+    with installed(city):
+        # Реестр без заранее заданных границ — как без REGIONS_FILE: граница
+        # геокодируется при первом обращении и дальше берётся из памяти
+        set_default_registry(RegionRegistry([Region("synthetic", city.districts, name=CITY, city=CITY)]))
+        districts = city.districts
+        for district in districts:
+            # Прогрев дискового кэша выгрузок — оба пути читают одни и те же parquet
+            features_from_place(district, RESIDENTIAL_TAGS)
+            geocode_to_gdf(district)
+
+        clipped, clip_s = timed_loop(clip_count, districts)
+        cold, cold_s = timed_loop(_count_buildings, districts)
+        warm, warm_s = timed_loop(_count_buildings, districts)
+
+        buildings = {d: features_from_place(d, RESIDENTIAL_TAGS) for d in districts}
+        boundaries = {d: geocode_to_gdf(d) for d in districts}
+        started = time.perf_counter()
+        for district in districts:
+            gpd.clip(buildings[district], boundaries[district])
+        clip_geometry_s = time.perf_counter() - started
+        started = time.perf_counter()
+        for district in districts:
+            polygon = shapely.union_all(boundaries[district].geometry.values)
+            shapely.prepare(polygon)
+            shares_within(buildings[district], polygon)
+        shares_geometry_s = time.perf_counter() - started
+
+    total = sum(len(b) for b in buildings.values())
+    counted = sum(c["num_buildings"] for c in warm.values())
+    effective = sum(c["effective_buildings"] for c in warm.values())
+    border = sum(int((c["buildings"].fields["share"] < 1).sum()) for c in warm.values())
+    mismatched = sum(clipped[d]["num_buildings"] != warm[d]["num_buildings"] for d in districts)
+    print(f"районов: {len(districts)}, зданий: {total}, пересекают границу: {border} "
+          f"(с долями площади — {effective:,.0f} зданий из {counted})")
+    print(f"расхождений числа зданий с gpd.clip: {mismatched}")
+    print(f"{'':28} {'всего, с':>9} {'на район, мс':>13} {'ускорение':>10}")
+    for label, seconds in (
+        ("gpd.clip + геокодер", clip_s),
+        ("STRtree, граница из кэша", warm_s),
+        ("STRtree, первый вызов", cold_s),
+        ("только геометрия: clip", clip_geometry_s),
+        ("только геометрия: STRtree", shares_geometry_s),
+    ):
+        base = clip_geometry_s if label.startswith("только") else clip_s
+        print(f"{label:28} {seconds:>9.2f} {seconds / len(districts) * 1000:>13.1f} {base / seconds:>9.1f}×")
+
+
+if __name__ == "__main__":
+    main()
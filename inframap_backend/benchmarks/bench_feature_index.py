@@ -0,0 +1,119 @@
+"""
+Пространственный индекс результатов (buildings.feature_index): запросы
+окна карты по миллионам точек — кластеры на мелком масштабе, R-tree на крупном.
+
+Точки — синтетические «города» (гауссовы облака) и редкий фон по
+территории размером с Киргизию, по --districts районов на слой. База —
+временный SQLite-файл (SQLITE_PATH), схема — миграциями buildings.
+Окно — экран 1920×1080 на масштабе zoom с центром в случайной точке
+данных, первая страница по --limit точек; «кластеры» — доля окон,
+где вместо точек отданы кластеры (мелкий масштаб или слишком плотное окно).
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_feature_index
+    python -m benchmarks.bench_feature_index --points 5000000 --zooms 6 10 13 15 17
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="inframap-features-")
+os.environ["SQLITE_PATH"] = os.path.join(_tmp, "features.sqlite3")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+from buildings.feature_index import rebuild_clusters, replace_layer, viewport  # noqa: E402
+
+LAYER = "gaps_schools"
+BOUNDS = (69.2, 39.2, 80.2, 43.2)
+SCREEN = (1920, 1080)
+
+
+def synthetic_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(BOUNDS[:2], BOUNDS[2:], size=(40, 2))
+    sizes = rng.pareto(1.5, len(centers)) + 1
+    urban = int(n * 0.9)
+    which = rng.choice(len(centers), urban, p=sizes / sizes.sum())
+    spread = 0.02 + 0.08 * sizes[which] / sizes.max()
+    lon = np.concatenate([centers[which, 0] + rng.normal(0, spread), rng.uniform(BOUNDS[0], BOUNDS[2], n - urban)])
+    lat = np.concatenate([centers[which, 1] + rng.normal(0, spread), rng.uniform(BOUNDS[1], BOUNDS[3], n - urban)])
+    return lat, lon, rng.uniform(0, 500, n)
+
+
+def screen_bbox(lat, lon, zoom):
+    # Экран в пикселях → градусы на этом масштабе (Web Mercator у центра)
+    degrees_per_pixel = 360.0 / (256 * 2 ** zoom)
+    half_w = SCREEN[0] / 2 * degrees_per_pixel
+    half_h = SCREEN[1] / 2 * degrees_per_pixel * np.cos(np.radians(lat))
+    return (max(lon - half_w, -180), max(lat - half_h, -85), min(lon + half_w, 180), min(lat + half_h, 85))
+
+
+def load(n_points, n_districts):
+    lat, lon, weight = synthetic_points(n_points)
+    started = time.perf_counter()
+    for index, part in enumerate(np.array_split(np.arange(n_points), n_districts)):
+        replace_layer(LAYER, f"Район {index:03d}", lat[part], lon[part], weight[part])
+    insert = time.perf_counter() - started
+
+    started = time.perf_counter()
+    clusters = rebuild_clusters(LAYER)
+    return lat, lon, insert, time.perf_counter() - started, clusters
+
+
+def run(zooms, lat, lon, n_queries, limit, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for zoom in zooms:
+        timings, counts, clustered = [], [], 0
+        for i in rng.integers(0, len(lat), n_queries):
+            bbox = screen_bbox(lat[i], lon[i], zoom)
+            started = time.perf_counter()
+            features, _, is_clustered = viewport(LAYER, bbox, zoom, limit=limit)
+            timings.append((time.perf_counter() - started) * 1000)
+            counts.append(len(features))
+            clustered += is_clustered
+        rows.append({
+            "zoom": zoom,
+            "clustered": clustered / n_queries,
+            "rows": int(np.mean(counts)),
+            "p50": float(np.percentile(timings, 50)),
+            "p95": float(np.percentile(timings, 95)),
+            "max": float(np.max(timings)),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=2_000_000)
+    parser.add_argument("--districts", type=int, default=200)
+    parser.add_argument("--zooms", type=int, nargs="+", default=[5, 8, 11, 13, 14, 16])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    try:
+        call_command("migrate", verbosity=0)
+        lat, lon, insert, clustering, clusters = load(args.points, args.districts)
+        print(f"{args.points} точек: запись {insert:.1f} с ({args.points / insert:,.0f} точек/с), "
+              f"кластеры {clustering:.1f} с ({clusters} на всех масштабах), "
+              f"база {os.path.getsize(os.environ['SQLITE_PATH']) / 2 ** 20:.0f} МБ")
+
+        print(f"{'zoom':>5} {'кластеры':>9} {'строк':>6} {'p50, мс':>8} {'p95, мс':>8} {'max, мс':>8}")
+        for row in run(args.zooms, lat, lon, args.queries, args.limit):
+            print(f"{row['zoom']:>5} {row['clustered']:>9.0%} {row['rows']:>6} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['max']:>8.2f}")
+    finally:
+        shutil.rmtree(_tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
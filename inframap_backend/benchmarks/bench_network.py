@@ -0,0 +1,80 @@
+"""
+Покрытие по пешеходной сети (buildings.network_service) на синтетическом
+графе-решётке: один проход Дейкстры от виртуального источника против
+отдельного прохода от каждого объекта.
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_network --side 372 --facilities 60
+(решётка 372×372 узла ≈ 500k направленных рёбер)
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from buildings.network_service import StreetNetwork
+
+BLOCK_METERS = 80
+RADIUS_METERS = 1500
+
+
+def grid_network(side, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(side * side).reshape(side, side)
+    flat = ids.ravel()
+    x = (flat % side) * BLOCK_METERS + rng.uniform(-10, 10, flat.size)
+    y = (flat // side) * BLOCK_METERS + rng.uniform(-10, 10, flat.size)
+
+    u = np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()])
+    v = np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()])
+    # Часть кварталов "закрыта" — как реки, железные дороги, заборы
+    keep = rng.random(len(u)) > 0.1
+    u, v = u[keep], v[keep]
+    length = np.hypot(x[u] - x[v], y[u] - y[v])
+    return StreetNetwork.from_arrays(
+        x, y,
+        np.concatenate([u, v]), np.concatenate([v, u]), np.concatenate([length, length]),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--side", type=int, default=372)
+    parser.add_argument("--facilities", type=int, default=60)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    network = grid_network(args.side)
+    build_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(1)
+    extent = args.side * BLOCK_METERS
+    fx = rng.uniform(0, extent, args.facilities)
+    fy = rng.uniform(0, extent, args.facilities)
+
+    start = time.perf_counter()
+    multi = network.node_distances(fx, fy)
+    multi_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    limited = network.node_distances(fx, fy, limit=RADIUS_METERS)
+    limited_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    nodes, approach = network.snap(fx, fy)
+    per_source = dijkstra(network.adjacency, directed=True, indices=nodes)
+    naive = (per_source + approach[:, None]).min(axis=0)
+    naive_s = time.perf_counter() - start
+
+    assert np.allclose(multi, naive)
+
+    print(f"узлов: {len(network)}, рёбер: {network.edges}, объектов: {args.facilities}")
+    print(f"построение CSR:                 {build_s:7.3f} с")
+    print(f"Дейкстра от каждого объекта:    {naive_s:7.3f} с")
+    print(f"один проход, все источники:     {multi_s:7.3f} с  ({naive_s / multi_s:.0f}x)")
+    print(f"то же с limit={RADIUS_METERS} м:         {limited_s:7.3f} с  ({naive_s / limited_s:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Время работы жадного max-coverage (buildings.placement_service) на
+синтетической решётке провальных клеток с шагом 500 м.
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_placement --cells 10000 50000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from buildings.placement_service import greedy_placement
+
+STEP_METERS = 500
+RADIUS_METERS = 1500
+
+
+def lattice(n_cells):
+    side = int(np.ceil(np.sqrt(n_cells)))
+    xs, ys = np.meshgrid(np.arange(side) * STEP_METERS, np.arange(side) * STEP_METERS)
+    return np.column_stack([xs.ravel(), ys.ravel()])[:n_cells]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cells", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--max-new", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"{'клеток':>8} {'объектов':>9} {'время, с':>9}")
+    for n in args.cells:
+        xy = lattice(n)
+        start = time.perf_counter()
+        result = greedy_placement(xy, xy, RADIUS_METERS, max_new=args.max_new)
+        elapsed = time.perf_counter() - start
+        print(f"{n:>8} {len(result['placements']):>9} {elapsed:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Поверхность населения для анализа провалов: веса ~100k синтетических
+зданий и раскладка по решётке района (buildings.population_service).
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_population_surface --buildings 100000
+"""
+import argparse
+import time
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from buildings.grid_service import build_grid
+from buildings.population_service import PopulationPoints, bin_to_grid, building_weights
+
+# Район ~15×10 км в метрах UTM
+DISTRICT = shapely.box(500_000, 4_740_000, 515_000, 4_750_000)
+
+
+def synthetic_buildings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(500_000, 515_000, n)
+    y = rng.uniform(4_740_000, 4_750_000, n)
+    size = rng.uniform(8, 40, n)
+    geoms = shapely.box(x, y, x + size, y + size)
+    levels = rng.choice(["1", "2", "5", "9", "12", None], n).astype(object)
+    return gpd.GeoDataFrame({"building:levels": levels}, geometry=geoms, crs="EPSG:32643")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--buildings", type=int, default=100_000)
+    parser.add_argument("--step", type=float, default=500)
+    args = parser.parse_args()
+
+    buildings = synthetic_buildings(args.buildings)
+    grid = build_grid(DISTRICT, args.step)
+
+    start = time.perf_counter()
+    weights = building_weights(buildings)
+    points = shapely.point_on_surface(np.asarray(buildings.geometry.values, dtype=object))
+    population = PopulationPoints(shapely.get_x(points), shapely.get_y(points), weights / weights.sum() * 1_300_000)
+    weights_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    residents = bin_to_grid(grid, population)
+    bin_s = time.perf_counter() - start
+
+    print(f"зданий: {args.buildings}, клеток: {len(grid)}, жителей: {residents.sum():,.0f}")
+    print(f"веса зданий:  {weights_s:.3f} с")
+    print(f"раскладка:    {bin_s:.3f} с")
+
+
+if __name__ == "__main__":
+    main()
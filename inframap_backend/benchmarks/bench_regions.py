@@ -0,0 +1,112 @@
+"""
+Реестр регионов размером со страну: поиск района для точек и районов
+в рамке через STRtree (RegionRegistry) против перебора полигонов.
+
+Районы — прямоугольники синтетической раскладки (benchmarks.fixtures),
+по --per-region районов на регион, границы заданы заранее (как из REGIONS_FILE).
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_regions
+    python -m benchmarks.bench_regions --districts 100 1000 5000 --points 1000000
+"""
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+
+import numpy as np  # noqa: E402
+import shapely  # noqa: E402
+
+from benchmarks.fixtures import SyntheticCity  # noqa: E402
+from buildings.coverage_service import to_geographic  # noqa: E402
+from buildings.regions import Region, RegionRegistry  # noqa: E402
+
+
+def synthetic_registry(n_districts, per_region):
+    city = SyntheticCity(n_districts)
+    polygons = shapely.transform(
+        np.array([city.polygon(i) for i in range(n_districts)], dtype=object),
+        lambda xy: np.column_stack(to_geographic(xy[:, 0], xy[:, 1])[::-1]),
+    )
+    boundaries = dict(zip(city.districts, polygons))
+    regions = [
+        Region(f"region-{start // per_region}", city.districts[start:start + per_region])
+        for start in range(0, n_districts, per_region)
+    ]
+    return RegionRegistry(regions, boundaries=boundaries), polygons
+
+
+def naive_locate(polygons, names, lon, lat):
+    result = np.full(len(lon), None, dtype=object)
+    for name, polygon in zip(names, polygons):
+        inside = shapely.contains_xy(polygon, lon, lat) & (result == None)  # noqa: E711
+        result[inside] = name
+    return result
+
+
+def run(sizes, n_points, per_region, n_boxes, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for size in sizes:
+        started = time.perf_counter()
+        registry, polygons = synthetic_registry(size, per_region)
+        registry.in_bbox((-180, -90, 180, 90))
+        build = time.perf_counter() - started
+
+        xmin, ymin, xmax, ymax = shapely.total_bounds(polygons)
+        lon = rng.uniform(xmin, xmax, n_points)
+        lat = rng.uniform(ymin, ymax, n_points)
+
+        started = time.perf_counter()
+        located = registry.locate(lon, lat)
+        tree = time.perf_counter() - started
+
+        # Перебор на подвыборке, экстраполяция линейно по числу точек
+        sample = min(n_points, 20_000)
+        started = time.perf_counter()
+        naive = naive_locate(polygons, registry._names, lon[:sample], lat[:sample])
+        naive_s = (time.perf_counter() - started) * n_points / sample
+        assert (naive == located[:sample]).all()
+
+        width, height = (xmax - xmin) / 20, (ymax - ymin) / 20
+        boxes = [
+            (x, y, x + width, y + height)
+            for x, y in zip(rng.uniform(xmin, xmax - width, n_boxes), rng.uniform(ymin, ymax - height, n_boxes))
+        ]
+        started = time.perf_counter()
+        for box in boxes:
+            registry.in_bbox(box)
+        bbox_ms = (time.perf_counter() - started) / n_boxes * 1000
+
+        rows.append({
+            "districts": size,
+            "regions": len(registry.regions),
+            "build_s": build,
+            "locate_s": tree,
+            "naive_s": naive_s,
+            "bbox_ms": bbox_ms,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--districts", type=int, nargs="+", default=[100, 1_000, 5_000])
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--per-region", type=int, default=10)
+    parser.add_argument("--boxes", type=int, default=1_000)
+    args = parser.parse_args()
+
+    print(f"{'районов':>8} {'регионов':>9} {'индекс, с':>10} {'STRtree, с':>11} "
+          f"{'перебор, с':>11} {'ускорение':>10} {'bbox, мс':>9}")
+    for row in run(args.districts, args.points, args.per_region, args.boxes):
+        print(f"{row['districts']:>8} {row['regions']:>9} {row['build_s']:>10.3f} {row['locate_s']:>11.3f} "
+              f"{row['naive_s']:>11.1f} {row['naive_s'] / row['locate_s']:>9.0f}x {row['bbox_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Сериализация объектов в ответ get-schools/get-clinics: прежний цикл по
+iterrows() против колоночного пути buildings.facility_service, затем
+размер и время рендеринга ответа в JSON, двоичном формате точек и NDJSON
+(buildings.renderers), с gzip и без.
+
+Запуск из inframap_backend:
+    python -m benchmarks.bench_serialization --features 100000
+"""
+import argparse
+import gzip
+import os
+import time
+
+import django
+import geopandas as gpd
+import numpy as np
+import shapely
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+
+from buildings.facility_service import _extract_points, coordinates_payload  # noqa: E402
+from buildings.renderers import NDJSONRenderer, PackedPointsRenderer, PayloadJSONRenderer  # noqa: E402
+
+
+def synthetic_features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(74.50, 74.70, n)
+    lat = rng.uniform(42.80, 42.93, n)
+    # Примерно половина объектов — полигоны зданий, как в выгрузках OSM
+    geoms = shapely.points(lon, lat)
+    polygons = rng.random(n) < 0.5
+    geoms[polygons] = shapely.buffer(geoms[polygons], 0.0003, quad_segs=2)
+    names = np.where(rng.random(n) < 0.2, None, np.char.add("Школа №", np.arange(n).astype(str)))
+    return gpd.GeoDataFrame({"name": names.astype(object)}, geometry=geoms, crs="EPSG:4326")
+
+
+def legacy_payload(gdf):
+    coords = []
+    for _, row in gdf.iterrows():
+        try:
+            point = row.geometry.centroid
+            lat, lon = point.y, point.x
+
+            if np.isnan(lat) or np.isnan(lon):
+                continue
+
+            name = row.get('name')
+            if name is None or isinstance(name, float) and np.isnan(name):
+                name = "Без названия"
+
+            coords.append({
+                'lat': lat,
+                'lon': lon,
+                'name': name
+            })
+        except Exception:
+            continue
+    return coords
+
+
+def columnar_payload(gdf):
+    return coordinates_payload(_extract_points(gdf))
+
+
+def timed(func, gdf):
+    start = time.perf_counter()
+    payload = func(gdf)
+    return payload, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--features", type=int, default=100_000)
+    args = parser.parse_args()
+
+    gdf = synthetic_features(args.features)
+    legacy, legacy_s = timed(legacy_payload, gdf)
+    columnar, columnar_s = timed(columnar_payload, gdf)
+    assert legacy == columnar.to_list()
+
+    print(f"объектов: {args.features}")
+    print(f"iterrows:    {legacy_s:8.3f} с")
+    print(f"колоночно:   {columnar_s:8.3f} с  ({legacy_s / columnar_s:.0f}x)")
+
+    data = {"total_count": len(columnar), "districts": {"район": {"count": len(columnar), "coordinates": columnar}}}
+    print()
+    print(f"{'формат':<8} {'рендер, с':>10} {'байт':>12} {'gzip, байт':>12}")
+    for name, renderer in (
+        ("json", PayloadJSONRenderer()),
+        ("points", PackedPointsRenderer()),
+        ("ndjson", NDJSONRenderer()),
+    ):
+        body, seconds = timed(renderer.render, data)
+        print(f"{name:<8} {seconds:10.3f} {len(body):12d} {len(gzip.compress(body, 6)):12d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Синтетический город для бенчмарков: районы-полигоны, школы и поликлиники
+с заданной плотностью, жилые здания с этажностью.
+
+Данные отдаются через FeatureStore с подменёнными fetcher/geocoder, так что
+весь код buildings работает как с OSM, но без сети. Район i всегда лежит
+в одной и той же клетке раскладки, поэтому наборы разного размера
+согласованы между собой (1 район ⊂ 4 района ⊂ ...).
+"""
+import tempfile
+from contextlib import contextmanager
+from unittest import mock
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from buildings import feature_store, regions
+from buildings.city_service import tags_mask
+from buildings.coverage_service import METRIC_CRS
+from buildings.feature_store import FeatureStore
+from buildings.regions import Region, RegionRegistry
+
+# Левый нижний угол раскладки — примерно Бишкек, метры UTM
+ORIGIN = (480_000, 4_730_000)
+DISTRICT_WIDTH = 6_000
+DISTRICT_HEIGHT = 5_000
+COLUMNS = 8
+CITY = "Синтетический город"
+
+
+def district_name(index):
+    return f"Район {index:03d}, {CITY}"
+
+
+class SyntheticCity:
+    def __init__(self, districts, schools_per_km2=0.5, clinics_per_km2=0.15,
+                 buildings_per_district=5_000, seed=0):
+        self.districts = [district_name(i) for i in range(districts)]
+        self.schools_per_km2 = schools_per_km2
+        self.clinics_per_km2 = clinics_per_km2
+        self.buildings_per_district = buildings_per_district
+        self.seed = seed
+        self._features = {}
+
+    def polygon(self, index):
+        """Прямоугольник со срезанным углом — чтобы решётка реально обрезалась границей."""
+        row, col = divmod(index, COLUMNS)
+        x0 = ORIGIN[0] + col * DISTRICT_WIDTH
+        y0 = ORIGIN[1] + row * DISTRICT_HEIGHT
+        cut = 0.3 * DISTRICT_WIDTH
+        return shapely.Polygon([
+            (x0, y0), (x0 + DISTRICT_WIDTH - cut, y0), (x0 + DISTRICT_WIDTH, y0 + cut),
+            (x0 + DISTRICT_WIDTH, y0 + DISTRICT_HEIGHT), (x0, y0 + DISTRICT_HEIGHT),
+        ])
+
+    def _random_points(self, rng, polygon, n):
+        xmin, ymin, xmax, ymax = polygon.bounds
+        # С запасом: часть точек отсеется срезанным углом
+        x = rng.uniform(xmin, xmax, int(n * 1.2) + 10)
+        y = rng.uniform(ymin, ymax, x.size)
+        inside = shapely.contains_xy(polygon, x, y)
+        return x[inside][:n], y[inside][:n]
+
+    def features(self, index):
+        """Все объекты района i в EPSG:4326 (один GeoDataFrame с колонками тегов)."""
+        if index in self._features:
+            return self._features[index]
+        rng = np.random.default_rng([self.seed, index])
+        polygon = self.polygon(index)
+        area_km2 = polygon.area / 1e6
+
+        frames = []
+        for amenity, label, density in (
+            ("school", "Школа", self.schools_per_km2),
+            ("clinic", "Поликлиника", self.clinics_per_km2),
+        ):
+            x, y = self._random_points(rng, polygon, max(1, int(round(area_km2 * density))))
+            frames.append(gpd.GeoDataFrame({
+                "amenity": amenity,
+                "name": [f"{label} №{index}-{k}" for k in range(x.size)],
+            }, geometry=shapely.points(x, y), crs=METRIC_CRS))
+
+        x, y = self._random_points(rng, polygon, self.buildings_per_district)
+        side = rng.uniform(10, 30, x.size)
+        frames.append(gpd.GeoDataFrame({
+            "building": "residential",
+            "building:levels": rng.integers(1, 16, x.size).astype(str),
+        }, geometry=shapely.box(x, y, x + side, y + side), crs=METRIC_CRS))
+
+        gdf = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=METRIC_CRS).to_crs("EPSG:4326")
+        self._features[index] = gdf
+        return gdf
+
+    def _index(self, place):
+        return self.districts.index(place)
+
+    def fetch(self, place, tags):
+        if place == CITY:
+            gdf = pd.concat([self.features(i) for i in range(len(self.districts))], ignore_index=True)
+            gdf = gpd.GeoDataFrame(gdf, crs="EPSG:4326")
+        else:
+            gdf = self.features(self._index(place))
+        return gdf[tags_mask(gdf, tags)]
+
+    def registry(self):
+        """Реестр из одного региона — синтетического города с границами районов."""
+        boundaries = {
+            name: shapely.union_all(self.geocode(name).geometry.values)
+            for name in self.districts
+        }
+        region = Region("synthetic", self.districts, name=CITY, city=CITY)
+        return RegionRegistry([region], boundaries=boundaries)
+
+    def geocode(self, place):
+        if place == CITY:
+            polygon = shapely.union_all([self.polygon(i) for i in range(len(self.districts))])
+        else:
+            polygon = self.polygon(self._index(place))
+        return gpd.GeoDataFrame(geometry=[polygon], crs=METRIC_CRS).to_crs("EPSG:4326")
+
+
+def _offline(*args, **kwargs):
+    raise RuntimeError("Бенчмарки работают без сети: обращение к osmnx запрещено")
+
+
+@contextmanager
+def installed(city):
+    """
+    Подключает синтетический город ко всему buildings: хранилище выгрузок
+    во временном каталоге, реестр регионов (его регион — регион по
+    умолчанию), запрет на вызовы osmnx. Всё через mock.patch: на выходе,
+    в том числе по исключению, возвращается прежнее состояние.
+    """
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch("osmnx.features_from_place", _offline), \
+            mock.patch("osmnx.geocode_to_gdf", _offline), \
+            mock.patch("osmnx.graph_from_place", _offline), \
+            mock.patch.object(feature_store, "_override", FeatureStore(tmp, fetcher=city.fetch, geocoder=city.geocode)), \
+            mock.patch.object(regions, "_override", city.registry()):
+        yield city
@@ -0,0 +1,185 @@
+"""
+Набор бенчмарков горячих путей на синтетическом городе (benchmarks.fixtures):
+find-gaps, выдача школ/поликлиник (JSON и двоичный формат),
+estimate_population и сценарии покрытия — от одного района до
+"национального" масштаба.
+
+Каждый случай прогревается один раз (заполняется дисковый кэш выгрузок),
+затем выполняется --repeat раз; в JSON сохраняются min/median/mean.
+С --compare результаты сравниваются с сохранённой базой: медиана хуже
+базы больше чем в --threshold раз отмечается как замедление, а код
+возврата становится 1. benchmarks/baselines/main.json — база, снятая на
+машине из её поля machine; на другом железе сравнивать имеет смысл
+только со своей базой (--save в отдельный файл до изменений).
+
+Запуск из inframap_backend:
+    python -m benchmarks.suite --save benchmarks/baselines/main.json
+    python -m benchmarks.suite --compare benchmarks/baselines/main.json
+    python -m benchmarks.suite --sizes district city --cases find_gaps
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from benchmarks.fixtures import SyntheticCity, installed  # noqa: E402
+from buildings import views  # noqa: E402
+from buildings.population_service import estimate_population  # noqa: E402
+
+SIZES = {
+    "district": 1,
+    "city": 4,
+    "region": 16,
+    "national": 64,
+}
+# Медленнее базы меньше чем на столько — шум, даже если отношение велико
+MIN_SLOWDOWN_SECONDS = 0.005
+
+factory = APIRequestFactory()
+
+
+def _view(view_class, path):
+    view = view_class.as_view()
+
+    def run(city):
+        response = view(factory.get(path))
+        response.render()
+        assert response.status_code == 200, response.content[:200]
+        return response
+
+    return run
+
+
+@lru_cache(maxsize=None)
+def scenario_body(city, count=10):
+    """По сценарию на район: новая школа в его центре и закрытие одной из существующих."""
+    scenarios = []
+    for name in city.districts[:count]:
+        center = city.geocode(name).geometry.iloc[0].representative_point()
+        school = city.fetch(name, {"amenity": "school"}).geometry.iloc[0]
+        scenarios.append({
+            "name": name,
+            "add": [{"type": "schools", "lat": center.y, "lon": center.x}],
+            "remove": [{"type": "schools", "lat": school.y, "lon": school.x}],
+        })
+    return {"types": ["schools"], "radii": [1000, 1500, 2000], "scenarios": scenarios}
+
+
+def _scenarios(city):
+    response = views.CoverageScenarioView.as_view()(
+        factory.post("/api/v1/scenarios/", scenario_body(city), format="json")
+    )
+    response.render()
+    assert response.status_code == 200, response.content[:200]
+    return response
+
+
+CASES = {
+    "find_gaps": _view(views.FindGapZones, "/api/v1/find-gaps/?type=schools"),
+    "find_gaps_cells": _view(views.FindGapZones, "/api/v1/find-gaps/?type=clinics&weight=cells&max_new=10"),
+    "schools_json": _view(views.GetSchools, "/api/v1/get-schools/"),
+    "schools_points": _view(views.GetSchools, "/api/v1/get-schools/?format=points"),
+    "clinics_json": _view(views.ClinicsByDistrictAPI, "/api/v1/get-clinics/"),
+    "estimate_population": lambda city: estimate_population(city.districts),
+    # Первый (прогревочный) вызов строит исходное покрытие, дальше — только пересчёт
+    "scenarios": _scenarios,
+}
+
+
+def measure(func, city, repeat):
+    func(city)
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(city)
+        runs.append(time.perf_counter() - started)
+    return {
+        "min_s": min(runs),
+        "median_s": statistics.median(runs),
+        "mean_s": statistics.fmean(runs),
+        "runs": runs,
+    }
+
+
+def run_suite(sizes, cases, repeat, buildings_per_district):
+    results = {}
+    # Без кэша ответов и снимка: меряется сам расчёт
+    with tempfile.TemporaryDirectory() as snapshots, override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+        SNAPSHOT_DIR=snapshots,
+    ):
+        for size in sizes:
+            city = SyntheticCity(SIZES[size], buildings_per_district=buildings_per_district)
+            with installed(city):
+                for case in cases:
+                    key = f"{case}/{size}"
+                    results[key] = measure(CASES[case], city, repeat)
+                    print(f"{key:<32} {results[key]['median_s'] * 1000:10.1f} мс", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Случаи, где медиана выросла больше чем в threshold раз."""
+    slower = []
+    for key, result in results.items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        ratio = result["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        if ratio > threshold and result["median_s"] - base["median_s"] > MIN_SLOWDOWN_SECONDS:
+            slower.append((key, base["median_s"], result["median_s"], ratio))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--buildings", type=int, default=5_000, help="Жилых зданий на район")
+    parser.add_argument("--save", type=Path, help="Сохранить результаты как базу (JSON)")
+    parser.add_argument("--compare", type=Path, help="Сравнить с базой (JSON)")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Допустимое отношение медиан")
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.cases, args.repeat, args.buildings)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "config": {"repeat": args.repeat, "buildings_per_district": args.buildings},
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"База сохранена: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.threshold)
+        for key, base, current, ratio in slower:
+            print(f"ЗАМЕДЛЕНИЕ {key}: {base * 1000:.1f} -> {current * 1000:.1f} мс ({ratio:.2f}x)")
+        if slower:
+            sys.exit(1)
+        print(f"Замедлений нет (порог {args.threshold}x)")
+
+
+if __name__ == "__main__":
+    main()
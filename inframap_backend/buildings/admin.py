@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AnalysisJob
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "progress_done", "progress_total", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    readonly_fields = ("key", "heartbeat_at", "started_at", "finished_at")
@@ -4,3 +4,5 @@ from django.apps import AppConfig
 class BuildingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'buildings'
+    # Снимок и геостек здесь не загружаются: ready() выполняется и для
+    # manage.py. Серверы делают это в buildings.warmup
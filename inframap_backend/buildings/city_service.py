@@ -0,0 +1,100 @@
+import geopandas as gpd
+import pandas as pd
+from django.conf import settings
+
+from .constants import REGIONS
+from .feature_store import features_from_place, geocode_to_gdf
+
+CITY = REGIONS["bishkek"]["city"]
+
+# Всё, что нужно эндпоинтам, выкачивается одним запросом к Overpass
+CITY_TAG_SETS = [
+    {'amenity': 'school'},
+    {'amenity': 'clinic'},
+    {'building': 'residential'},
+]
+
+
+def fetch_mode(request=None):
+    """'district' — отдельный запрос на каждый район, 'city' — один запрос на весь город."""
+    mode = request.query_params.get("fetch") if request is not None else None
+    mode = mode or settings.OSM_FETCH_MODE
+    if mode not in ("district", "city"):
+        raise ValueError("Недопустимый режим загрузки. Используйте 'district' или 'city'.")
+    return mode
+
+
+def merge_tags(tag_sets):
+    """Объединяет наборы тегов в один запрос osmnx (теги внутри запроса работают как ИЛИ)."""
+    merged = {}
+    for tags in tag_sets:
+        for key, value in tags.items():
+            values = merged.setdefault(key, [])
+            if values is True:
+                continue
+            if value is True:
+                merged[key] = True
+                continue
+            for v in value if isinstance(value, list) else [value]:
+                if v not in values:
+                    values.append(v)
+    return {k: v[0] if isinstance(v, list) and len(v) == 1 else v for k, v in merged.items()}
+
+
+def tags_mask(gdf, tags):
+    mask = pd.Series(False, index=gdf.index)
+    for key, value in tags.items():
+        if key not in gdf.columns:
+            continue
+        column = gdf[key]
+        if value is True:
+            mask |= column.notna()
+        elif isinstance(value, list):
+            mask |= column.isin(value)
+        else:
+            mask |= column == value
+    return mask
+
+
+def district_boundaries(districts):
+    frames = []
+    for district in districts:
+        boundary = geocode_to_gdf(district)[["geometry"]].to_crs("EPSG:4326")
+        boundary["district"] = district
+        frames.append(boundary)
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs="EPSG:4326")
+
+
+def assign_districts(gdf, boundaries):
+    """
+    Серия "объект -> район": по одной внутренней точке на объект, один sjoin.
+    Объект на границе районов попадает ровно в один район — первый по
+    порядку boundaries; объекты вне всех районов отбрасываются.
+    """
+    points = gpd.GeoDataFrame(geometry=gdf.geometry.representative_point(), crs=gdf.crs)
+    # intersects, а не within: точка ровно на общей границе не лежит строго внутри ни одного района
+    joined = gpd.sjoin(points.to_crs(boundaries.crs), boundaries, how="inner", predicate="intersects")
+    joined = joined.sort_values("index_right", kind="stable")
+    district = joined[~joined.index.duplicated(keep="first")]["district"]
+    return district.reindex(points.index[points.index.isin(district.index)])
+
+
+def city_features_by_district(tags, districts, city=CITY, tag_sets=CITY_TAG_SETS):
+    """
+    {район: GeoDataFrame объектов с тегами tags} по одной выгрузке на весь город.
+
+    Город выкачивается сразу по всем tag_sets, так что запросы разных
+    эндпоинтов переиспользуют одну и ту же запись дискового кэша.
+    """
+    if tags not in tag_sets:
+        tag_sets = [*tag_sets, tags]
+    features = features_from_place(city, merge_tags(tag_sets))
+    features = features[tags_mask(features, tags)]
+
+    district_of = assign_districts(features, district_boundaries(districts))
+    features = features.loc[district_of.index]
+    return {
+        district: features[district_of == district]
+        for district in districts
+    }
+
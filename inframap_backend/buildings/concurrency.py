@@ -0,0 +1,88 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+
+
+@lru_cache(maxsize=1)
+def _executor():
+    # Один пул на процесс: ограничивает число одновременных запросов к OSM
+    # суммарно по всем входящим HTTP-запросам, а не по каждому в отдельности
+    return ThreadPoolExecutor(
+        max_workers=settings.DISTRICT_FETCH_WORKERS,
+        thread_name_prefix="district-fetch",
+    )
+
+
+def map_districts(func, districts, timeout=None):
+    """
+    Выполняет func(district) для всех районов параллельно.
+
+    Возвращает {район: результат} в исходном порядке. Если func упала или
+    не уложилась в timeout секунд, вместо результата будет {'error': ...};
+    остальные районы от этого не страдают. Время района отсчитывается с
+    момента, когда его взял поток пула: очередь общего пула в него не входит.
+    Очередь ограничена отдельно — район, не дождавшийся потока за timeout,
+    снимается с очереди. Уже идущий расчёт прервать нельзя: он доработает
+    в пуле, но результат не ждут.
+    """
+    if timeout is None:
+        timeout = settings.DISTRICT_FETCH_TIMEOUT
+
+    started = {}
+
+    def run(district):
+        started[district] = time.monotonic()
+        return func(district)
+
+    # Контекст запроса (замеры этапов для Server-Timing) переносится в потоки пула
+    pending = {
+        _executor().submit(contextvars.copy_context().run, run, district): district
+        for district in districts
+    }
+    submitted = time.monotonic()
+
+    def deadline(district):
+        return started.get(district, submitted) + timeout
+
+    result = {}
+    while pending:
+        nearest = min(deadline(district) for district in pending.values())
+        wait(pending, timeout=max(0.0, nearest - time.monotonic()), return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        for future, district in list(pending.items()):
+            if future.done():
+                try:
+                    result[district] = future.result()
+                except Exception as e:
+                    result[district] = {'error': str(e)}
+            elif deadline(district) > now:
+                continue
+            elif district in started:
+                result[district] = {'error': f"Превышено время ожидания ({timeout:g} с)"}
+            elif future.cancel():
+                result[district] = {'error': f"Нет свободного потока за {timeout:g} с"}
+            else:
+                # Поток взял район между проверками — теперь его срок от старта
+                continue
+            del pending[future]
+    return {district: result[district] for district in districts}
+
+
+@lru_cache(maxsize=1)
+def _upstream_slots():
+    return threading.BoundedSemaphore(settings.UPSTREAM_CONCURRENCY)
+
+
+@contextmanager
+def upstream_slot():
+    """
+    Ограничивает число одновременных обращений к внешним сервисам
+    (Overpass, Nominatim) в процессе — сколько бы запросов ни пришло.
+    """
+    with _upstream_slots():
+        yield
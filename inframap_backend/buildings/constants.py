@@ -0,0 +1,25 @@
+# Константы buildings без тяжёлых зависимостей: их импортируют views и urls,
+# а геостек (numpy, geopandas, osmnx, scipy, shapely) грузится при первом расчёте
+
+DISTRICTS = [
+    "Октябрьский район, город Бишкек, Киргизия",
+    "Свердловский район, город Бишкек, Киргизия",
+    "Ленинский район, город Бишкек, Киргизия",
+    "Первомайский район, город Бишкек, Киргизия"
+]
+
+# Встроенный реестр регионов (buildings.regions); страну целиком задаёт REGIONS_FILE
+REGIONS = {
+    "bishkek": {
+        "name": "Бишкек",
+        "city": "город Бишкек, Киргизия",
+        "population": 1_300_000,
+        "districts": DISTRICTS,
+    },
+}
+
+OBJECT_TYPES = ("schools", "clinics")
+
+RADIUS_METERS = 1500  # Радиус охвата
+
+METRICS = ("euclidean", "network")
@@ -0,0 +1,51 @@
+import numpy as np
+from pyproj import Transformer
+from scipy.spatial import KDTree
+
+# Метрическая проекция для Бишкека (UTM zone 43N), как в main.py
+METRIC_CRS = "EPSG:32643"
+
+_to_metric = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+_to_geographic = Transformer.from_crs(METRIC_CRS, "EPSG:4326", always_xy=True)
+
+
+def to_metric(lat, lon):
+    """Переводит массивы широт/долгот в метры (x, y) одной векторной операцией."""
+    x, y = _to_metric.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+    return np.asarray(x), np.asarray(y)
+
+
+def to_geographic(x, y):
+    """Обратное преобразование: метры -> (lat, lon)."""
+    lon, lat = _to_geographic.transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return np.asarray(lat), np.asarray(lon)
+
+
+class CoverageEngine:
+    """
+    Отвечает на вопрос "как далеко до ближайшего объекта" сразу для всей сетки:
+    объекты проецируются в метры один раз, дальше один батч-запрос к KD-дереву.
+    """
+
+    def __init__(self, lat, lon):
+        x, y = to_metric(lat, lon)
+        self.facility_xy = np.column_stack([x, y])
+        self.tree = KDTree(self.facility_xy) if len(self.facility_xy) else None
+
+    def __len__(self):
+        return len(self.facility_xy)
+
+    def nearest_distance_xy(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if self.tree is None:
+            return np.full(x.shape, np.inf)
+        distances, _ = self.tree.query(np.column_stack([x.ravel(), y.ravel()]))
+        return distances.reshape(x.shape)
+
+    def nearest_distance(self, lat, lon):
+        x, y = to_metric(lat, lon)
+        return self.nearest_distance_xy(x, y)
+
+    def uncovered_mask(self, lat, lon, radius):
+        return self.nearest_distance(lat, lon) > radius
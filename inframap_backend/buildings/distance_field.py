@@ -0,0 +1,261 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from django.conf import settings
+from PIL import Image
+
+from .concurrency import map_districts
+from .coverage_service import METRIC_CRS, CoverageEngine, to_metric
+from .facility_service import facilities_by_district
+from .regions import default_registry
+from .response_cache import data_version
+
+TILE_SIZE = 256
+# Запас вокруг границы региона, чтобы у края поле не обрывалось
+PADDING_METERS = 2000
+# Сколько строк растра считается за один запрос к KD-дереву
+ROWS_PER_CHUNK = 256
+
+COVERED_RGBA = (34, 197, 94, 90)
+UNCOVERED_RGBA = (239, 68, 68, 140)
+NODATA_UINT16 = 65535
+
+_build_lock = threading.Lock()
+
+
+class DistanceField:
+    """
+    Растр "расстояние до ближайшего объекта" в метрах (UTM), float32.
+
+    Данные лежат в .npy и открываются через memmap, поэтому одно поле
+    разделяется всеми воркерами через page cache, а не копируется в каждый.
+    Ячейка (row, col) — центр в (x0 + col * res, y0 + row * res).
+    mask — ячейки внутри границы региона (без запаса PADDING_METERS).
+    """
+
+    def __init__(self, data, x0, y0, resolution, version, mask=None, data_version=None):
+        self.data = data
+        self.x0 = x0
+        self.y0 = y0
+        self.resolution = resolution
+        self.version = version
+        self.mask = mask
+        self.data_version = data_version
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def sample_xy(self, x, y):
+        """Расстояние в ближайшей ячейке; за пределами растра — NaN."""
+        col = np.rint((np.asarray(x) - self.x0) / self.resolution).astype(np.int64)
+        row = np.rint((np.asarray(y) - self.y0) / self.resolution).astype(np.int64)
+        rows, cols = self.shape
+        inside = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+        out = np.full(col.shape, np.nan, dtype=np.float32)
+        out[inside] = self.data[row[inside], col[inside]]
+        return out
+
+    def sample(self, lat, lon):
+        return self.sample_xy(*to_metric(lat, lon))
+
+    def coverage_summary(self, radius):
+        """Доля покрытой площади региона для любого радиуса — просто порог по полю."""
+        if self.mask is None:
+            covered = int(np.count_nonzero(self.data <= radius))
+            total = self.data.size
+        else:
+            covered = int(np.count_nonzero((self.data <= radius) & self.mask))
+            total = int(np.count_nonzero(self.mask))
+        cell_km2 = (self.resolution / 1000) ** 2
+        return {
+            "radius_m": radius,
+            "covered_km2": round(covered * cell_km2, 3),
+            "uncovered_km2": round((total - covered) * cell_km2, 3),
+            "covered_share": round(covered / total, 4) if total else 0.0,
+        }
+
+
+def _paths(object_type, region, resolution):
+    root = Path(settings.DISTANCE_FIELD_DIR)
+    stem = f"{object_type}_{region}_{int(resolution)}m"
+    return root / f"{stem}.npy", root / f"{stem}.mask.npy", root / f"{stem}.json"
+
+
+def _region_boundary(region):
+    """Граница региона в метрах UTM; RuntimeError — не удалось получить границы районов."""
+    boundaries = map_districts(default_registry().boundary, region.districts)
+    failed = [f"{name}: {polygon['error']}" for name, polygon in boundaries.items() if isinstance(polygon, dict)]
+    if failed:
+        raise RuntimeError(f"Не удалось получить границы районов: {'; '.join(failed)}")
+    polygons = gpd.GeoSeries(list(boundaries.values()), crs="EPSG:4326").to_crs(METRIC_CRS)
+    return shapely.union_all(polygons.values)
+
+
+def _facility_coordinates(object_type, region):
+    # Поле по части районов покрытие только занизит, а закэшируется до новой версии данных
+    by_district = facilities_by_district(object_type, region.districts, mode=settings.OSM_FETCH_MODE)
+    failed = [f"{name}: {facilities['error']}" for name, facilities in by_district.items() if 'error' in facilities]
+    if failed:
+        raise RuntimeError(f"Не удалось получить объекты: {'; '.join(failed)}")
+    if not by_district:
+        return np.empty(0), np.empty(0)
+    return (
+        np.concatenate([facilities["lat"] for facilities in by_district.values()]),
+        np.concatenate([facilities["lon"] for facilities in by_district.values()]),
+    )
+
+
+def build_distance_field(object_type, resolution, region=None, bounds=None, facilities=None, boundary=None):
+    """
+    Считает поле расстояний по региону и сохраняет его на диск.
+
+    region — Region из реестра (по умолчанию — регион по умолчанию);
+    bounds — (xmin, ymin, xmax, ymax) в метрах UTM, facilities — (lat, lon),
+    boundary — полигон в метрах для маски; по умолчанию берутся граница
+    региона с запасом и объекты его районов. RuntimeError — нет исходных данных.
+    """
+    registry = default_registry()
+    region = region or registry.region(registry.default)
+    version = data_version()
+    if bounds is None:
+        boundary = _region_boundary(region)
+        xmin, ymin, xmax, ymax = boundary.bounds
+        bounds = xmin - PADDING_METERS, ymin - PADDING_METERS, xmax + PADDING_METERS, ymax + PADDING_METERS
+    if facilities is None:
+        facilities = _facility_coordinates(object_type, region)
+    lat, lon = facilities
+    engine = CoverageEngine(lat, lon)
+    if boundary is not None:
+        shapely.prepare(boundary)
+
+    xmin, ymin, xmax, ymax = bounds
+    cols = int(math.ceil((xmax - xmin) / resolution)) + 1
+    rows = int(math.ceil((ymax - ymin) / resolution)) + 1
+    xs = xmin + np.arange(cols) * resolution
+
+    data_path, mask_path, meta_path = _paths(object_type, region.key, resolution)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_data = data_path.with_name(f"{data_path.name}.{os.getpid()}.tmp.npy")
+    tmp_mask = mask_path.with_name(f"{mask_path.name}.{os.getpid()}.tmp.npy")
+    data = np.lib.format.open_memmap(tmp_data, mode="w+", dtype=np.float32, shape=(rows, cols))
+    mask = np.lib.format.open_memmap(tmp_mask, mode="w+", dtype=np.bool_, shape=(rows, cols))
+
+    # По блокам строк, чтобы память не росла вместе с разрешением
+    for start in range(0, rows, ROWS_PER_CHUNK):
+        stop = min(rows, start + ROWS_PER_CHUNK)
+        ys = ymin + np.arange(start, stop) * resolution
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        data[start:stop] = engine.nearest_distance_xy(grid_x, grid_y)
+        mask[start:stop] = True if boundary is None else shapely.contains_xy(boundary, grid_x, grid_y)
+    data.flush()
+    mask.flush()
+    del data, mask
+    os.replace(tmp_data, data_path)
+    os.replace(tmp_mask, mask_path)
+
+    digest = hashlib.sha1(np.column_stack([lat, lon]).astype(np.float64).tobytes()).hexdigest()
+    meta = {
+        "object_type": object_type,
+        "region": region.key,
+        "x0": xmin,
+        "y0": ymin,
+        "resolution": resolution,
+        "shape": [rows, cols],
+        "facilities": len(engine),
+        # Поле действительно, пока не сменилась версия данных (новая выгрузка OSM, снимок)
+        "data_version": version,
+        "version": f"{version}-{digest[:12]}",
+        "built_at": time.time(),
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    load_distance_field.cache_clear()
+    return load_distance_field(object_type, region.key, resolution)
+
+
+@lru_cache(maxsize=16)
+def load_distance_field(object_type, region, resolution):
+    data_path, mask_path, meta_path = _paths(object_type, region, resolution)
+    if not (data_path.exists() and mask_path.exists() and meta_path.exists()):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    data = np.load(data_path, mmap_mode="r")
+    mask = np.load(mask_path, mmap_mode="r")
+    if data.shape != tuple(meta["shape"]) or mask.shape != data.shape:
+        # Другой процесс как раз перестраивает поле
+        return None
+    return DistanceField(
+        data, meta["x0"], meta["y0"], meta["resolution"], meta["version"],
+        mask=mask, data_version=meta.get("data_version"),
+    )
+
+
+def get_distance_field(object_type, region=None, resolution=None):
+    """
+    Поле региона (ключ реестра, по умолчанию — регион по умолчанию) с диска.
+    Если его нет или оно посчитано по прежней версии данных — строится
+    заново, один раз (параллельные запросы ждут). ValueError — неизвестный
+    регион, RuntimeError — нет границ или объектов.
+    """
+    registry = default_registry()
+    region = registry.region(region or registry.default)
+    resolution = resolution or settings.DISTANCE_FIELD_RESOLUTION
+    version = data_version()
+    field = load_distance_field(object_type, region.key, resolution)
+    if field is not None and field.data_version == version:
+        return field
+    with _build_lock:
+        # Поле мог уже перестроить другой поток или процесс
+        load_distance_field.cache_clear()
+        field = load_distance_field(object_type, region.key, resolution)
+        if field is None or field.data_version != version:
+            field = build_distance_field(object_type, resolution, region=region)
+    return field
+
+
+def tile_lat_lon(z, x, y, size=TILE_SIZE):
+    """Широты/долготы центров пикселей XYZ-тайла (Web Mercator), массивы size×size."""
+    n = 2 ** z
+    px = (x + (np.arange(size) + 0.5) / size) / n
+    py = (y + (np.arange(size) + 0.5) / size) / n
+    lon = px * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * py))))
+    return np.meshgrid(lat, lon, indexing="ij")
+
+
+def render_png_tile(field, z, x, y, radius):
+    lat, lon = tile_lat_lon(z, x, y)
+    distances = field.sample(lat.ravel(), lon.ravel()).reshape(lat.shape)
+
+    rgba = np.zeros(lat.shape + (4,), dtype=np.uint8)
+    rgba[distances <= radius] = COVERED_RGBA
+    rgba[distances > radius] = UNCOVERED_RGBA
+
+    buffer = BytesIO()
+    Image.fromarray(rgba).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def render_binary_tile(field, z, x, y):
+    """
+    Сырые расстояния тайла: 256×256 uint16 little-endian, метры по строкам
+    сверху вниз; 65535 — нет данных. Порог по радиусу применяет клиент.
+    """
+    lat, lon = tile_lat_lon(z, x, y)
+    distances = field.sample(lat.ravel(), lon.ravel())
+    out = np.full(distances.shape, NODATA_UINT16, dtype="<u2")
+    valid = ~np.isnan(distances)
+    out[valid] = np.clip(np.rint(distances[valid]), 0, NODATA_UINT16 - 1)
+    return out.tobytes()
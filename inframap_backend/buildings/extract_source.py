@@ -0,0 +1,271 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+import pyogrio
+from django.conf import settings
+from pyproj import Transformer
+
+from .city_service import tags_mask
+from .feature_store import FeatureStore
+
+# Сколько объектов читается из файла за раз: память ограничена пачкой, а не выгрузкой
+BATCH_SIZE = 50_000
+
+# Слои драйвера GDAL OSM (.osm.pbf/.osm): точки и площадные объекты.
+# Линии не нужны — школы, поликлиники и здания либо точки, либо полигоны
+OSM_LAYERS = ("points", "multipolygons")
+# Колонки тегов, по которым фильтруют запросы: в GeoPackage из .osm.pbf по ним строятся индексы
+INDEXED_COLUMNS = ("amenity", "building", "boundary")
+
+# Один поток на процесс конвертирует выгрузку, остальные ждут готовый файл
+_convert_lock = threading.Lock()
+
+# Теги, которые не попали в отдельные колонки osmconf.ini, GDAL складывает
+# в other_tags в формате hstore: "ключ"=>"значение","ключ2"=>"значение2"
+OTHER_TAGS = "other_tags"
+_HSTORE_PAIR = re.compile(r'"((?:[^"\\]|\\.)*)"=>"((?:[^"\\]|\\.)*)"')
+
+
+def _is_osm(path):
+    name = Path(path).name.lower()
+    return name.endswith(".pbf") or name.endswith(".osm")
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _where(tags, columns):
+    """
+    SQL-фильтр OGR по тегам (условия через ИЛИ, как у osmnx).
+
+    Ключ с отдельной колонкой фильтруется точно, остальные — через LIKE по
+    other_tags; это лишь предфильтр, точная проверка идёт после чтения.
+    """
+    clauses = []
+    for key, value in tags.items():
+        values = value if isinstance(value, list) else [value]
+        if key in columns:
+            column = f'"{key}"'
+            if value is True:
+                clauses.append(f"{column} IS NOT NULL")
+            else:
+                clauses.append(f"{column} IN ({', '.join(_quote(v) for v in values)})")
+        elif OTHER_TAGS in columns:
+            patterns = [f'%"{key}"=>%'] if value is True else [f'%"{key}"=>"{v}"%' for v in values]
+            clauses.extend(f"{OTHER_TAGS} LIKE {_quote(pattern)}" for pattern in patterns)
+    # Ни одного ключа в слое нет — из него ничего не нужно
+    if not clauses:
+        return "1 = 0"
+    return " OR ".join(f"({clause})" for clause in clauses)
+
+
+def _expand_other_tags(gdf):
+    """Разворачивает other_tags в обычные колонки — как в выдаче osmnx."""
+    if OTHER_TAGS not in gdf.columns:
+        return gdf
+    parsed = gdf[OTHER_TAGS].map(
+        lambda raw: dict(_HSTORE_PAIR.findall(raw)) if isinstance(raw, str) else {}
+    )
+    extra = pd.DataFrame(parsed.tolist(), index=gdf.index)
+    extra = extra[[column for column in extra.columns if column not in gdf.columns]]
+    return pd.concat([gdf.drop(columns=OTHER_TAGS), extra], axis=1)
+
+
+def _batches(path, layer, **filters):
+    """GeoDataFrame по пачкам BATCH_SIZE из слоя layer (filters — where/bbox для pyogrio)."""
+    with pyogrio.open_arrow(path, layer=layer, batch_size=BATCH_SIZE, use_pyarrow=True, **filters) as (meta, reader):
+        for batch in reader:
+            if not batch.num_rows:
+                continue
+            table = batch.to_pandas()
+            geometry = gpd.GeoSeries.from_wkb(table.pop(meta["geometry_name"] or "wkb_geometry"))
+            yield gpd.GeoDataFrame(table, geometry=geometry.values, crs=meta["crs"] or "EPSG:4326")
+
+
+def convert_osm(source, target):
+    """
+    .osm.pbf/.osm -> GeoPackage: слои OSM_LAYERS переписываются потоком,
+    пачками по BATCH_SIZE, с R-tree по геометриям (по умолчанию в GPKG)
+    и индексами по INDEXED_COLUMNS. Файл появляется атомарно, целиком.
+    """
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp.gpkg")
+    layers = []
+    try:
+        for layer in OSM_LAYERS:
+            for gdf in _batches(str(source), layer):
+                pyogrio.write_dataframe(gdf, tmp, layer=layer, driver="GPKG", append=layer in layers)
+                if layer not in layers:
+                    layers.append(layer)
+        if not layers:
+            pyogrio.write_dataframe(gpd.GeoDataFrame(geometry=[], crs="EPSG:4326"), tmp, layer=OSM_LAYERS[0], driver="GPKG")
+
+        db = sqlite3.connect(tmp)
+        try:
+            for layer in layers:
+                columns = {row[1] for row in db.execute(f'PRAGMA table_info("{layer}")')}
+                for column in INDEXED_COLUMNS:
+                    if column in columns:
+                        db.execute(f'CREATE INDEX "{layer}_{column}" ON "{layer}" ("{column}")')
+            db.commit()
+        finally:
+            db.close()
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _names_match(name, part):
+    # "Бишкек" — родитель для части "город Бишкек": совпадение целыми словами
+    if not isinstance(name, str):
+        return False
+    return name == part or re.search(rf"(?:^|\s){re.escape(name)}(?:$|\s)", part) is not None
+
+
+def _inside_any(row, parents):
+    """Лежит ли граница row внутри одной из parents уровнем выше (admin_level меньше)."""
+    point = row.geometry.representative_point()
+    for parent in parents.itertuples():
+        if parent.Index == row.Index:
+            continue
+        if not (pd.isna(parent.admin_level) or pd.isna(row.admin_level) or parent.admin_level < row.admin_level):
+            continue
+        if parent.geometry.contains(point):
+            return True
+    return False
+
+
+class ExtractSource:
+    """
+    Локальная выгрузка OSM вместо Overpass/Nominatim — для работы без сети.
+
+    Поддерживаются .osm.pbf/.osm (драйвер GDAL OSM) и любые векторные
+    форматы GDAL: GeoJSON, FlatGeobuf, GeoPackage. Файл не загружается
+    целиком: каждый запрос читается потоком пачками по BATCH_SIZE
+    с bbox-фильтром по границе места и SQL-фильтром по тегам.
+    .osm.pbf/.osm при первом запросе переводятся в GeoPackage в workdir
+    (convert_osm), дальше запросы идут по его индексам.
+
+    Границы районов ищутся в boundary_path (по умолчанию в той же выгрузке):
+    объекты с boundary=administrative, у которых name совпадает с первой
+    частью названия места ("Ленинский район, город Бишкек, ..." -> "Ленинский район").
+    Одноимённые районы разных городов различаются по остальным частям
+    названия: район должен лежать внутри найденной в выгрузке границы
+    родителя ("город Бишкек" -> граница "Бишкек") с меньшим admin_level.
+    Если кандидатов всё равно несколько — ошибка, а не их объединение.
+    """
+
+    def __init__(self, path, boundary_path=None, workdir=None):
+        self.path = str(path)
+        self.boundary_path = str(boundary_path or path)
+        # Сюда кладутся проиндексированные копии .osm.pbf (см. _indexed)
+        self.workdir = Path(workdir) if workdir is not None else Path(settings.OSM_CACHE_DIR) / "extracts"
+        self._boundaries = None
+
+    def _layers(self, path):
+        if _is_osm(path):
+            return list(OSM_LAYERS)
+        return [name for name, geometry_type in pyogrio.list_layers(path)]
+
+    def _indexed(self, path):
+        """
+        Файл, из которого читаются запросы: .osm.pbf/.osm один раз (на время
+        изменения файла) переводятся в GeoPackage с R-tree и индексами по
+        тегам, иначе драйвер OSM разбирал бы выгрузку целиком на каждый слой
+        и каждый запрос. Остальные форматы читаются как есть.
+        """
+        if not _is_osm(path):
+            return path
+        source = Path(path)
+        stat = source.stat()
+        raw = f"{source.resolve()}:{stat.st_mtime_ns}:{stat.st_size}"
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+        target = self.workdir / f"{source.name.split('.')[0]}-{digest}.gpkg"
+        if not target.exists():
+            with _convert_lock:
+                if not target.exists():
+                    convert_osm(source, target)
+        return str(target)
+
+    def _read(self, path, tags, bbox=None):
+        """Объекты с тегами tags из всех слоев файла, пачками, в EPSG:4326."""
+        path = self._indexed(path)
+        frames = []
+        for layer in self._layers(path):
+            info = pyogrio.read_info(path, layer=layer)
+            columns = set(info["fields"])
+            layer_bbox = bbox
+            if bbox is not None and info["crs"] and info["crs"] not in ("EPSG:4326", "OGC:CRS84"):
+                to_layer = Transformer.from_crs("EPSG:4326", info["crs"], always_xy=True)
+                layer_bbox = to_layer.transform_bounds(*bbox)
+            for gdf in _batches(path, layer, where=_where(tags, columns), bbox=layer_bbox):
+                gdf = _expand_other_tags(gdf)
+                frames.append(gdf[tags_mask(gdf, tags)].to_crs("EPSG:4326"))
+        if not frames:
+            return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+        return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs="EPSG:4326")
+
+    def _admin_boundaries(self):
+        if self._boundaries is None:
+            # Административных границ в выгрузке немного — читаем их один раз
+            found = self._read(self.boundary_path, {"boundary": "administrative"})
+            found = found[found.geometry.geom_type.isin(["Polygon", "MultiPolygon"])]
+            for column in ("name", "admin_level"):
+                if column not in found.columns:
+                    found = found.assign(**{column: None})
+            found = found.assign(admin_level=pd.to_numeric(found["admin_level"], errors="coerce"))
+            self._boundaries = found[["name", "admin_level", "geometry"]].reset_index(drop=True)
+        return self._boundaries
+
+    def boundary(self, place):
+        boundaries = self._admin_boundaries()
+        parts = [part.strip() for part in place.split(",") if part.strip()]
+        name = parts[0]
+        found = boundaries[boundaries["name"] == name]
+        if found.empty:
+            raise ValueError(f"Граница '{name}' не найдена в выгрузке {self.boundary_path}")
+
+        for parent in parts[1:]:
+            parents = boundaries[[_names_match(candidate, parent) for candidate in boundaries["name"]]]
+            if parents.empty:
+                # Родителя ("Киргизия") в выгрузке может не быть — он ничего не уточняет
+                continue
+            found = found[[_inside_any(row, parents) for row in found.itertuples()]]
+            if found.empty:
+                raise ValueError(f"Граница '{name}' внутри '{parent}' не найдена в выгрузке {self.boundary_path}")
+
+        if len(found) > 1:
+            raise ValueError(
+                f"В выгрузке {self.boundary_path} {len(found)} границ '{name}': "
+                f"уточните место родителем (\"{name}, город ...\")"
+            )
+        return found[["geometry"]].reset_index(drop=True)
+
+    def features(self, place, tags):
+        polygon = self.boundary(place).union_all()
+        features = self._read(self.path, tags, bbox=tuple(polygon.bounds))
+        return features[features.intersects(polygon)].reset_index(drop=True)
+
+
+def extract_store(path, boundary_path=None, root=None, **kwargs):
+    """
+    FeatureStore поверх локальной выгрузки. Кэш у каждой выгрузки свой
+    (подкаталог OSM_CACHE_DIR/extracts), чтобы не смешиваться с Overpass;
+    в ключ входит время изменения файлов — новая выгрузка даёт новый кэш.
+    """
+    source = ExtractSource(path, boundary_path)
+    if root is None:
+        raw = "|".join(
+            f"{p.resolve()}:{p.stat().st_mtime_ns}" for p in (Path(path), Path(boundary_path or path))
+        )
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+        root = Path(settings.OSM_CACHE_DIR) / "extracts" / digest
+    return FeatureStore(root, fetcher=source.features, geocoder=source.boundary, **kwargs)
@@ -0,0 +1,110 @@
+import numpy as np
+import shapely
+
+from .city_service import city_features_by_district
+from .concurrency import map_districts
+from .constants import DISTRICTS
+from .feature_store import features_from_place
+from .points import PointSet
+from .regions import per_city
+from .snapshot import current_snapshot
+
+SCHOOL_EXCLUDE = 'авто|муз|спорт|искусств|центр|дополн'
+DEFAULT_NAME = "Без названия"
+
+
+def _filter_schools(gdf):
+    # Только обычные школы: без автошкол, музыкальных, спортивных и т.п.
+    names = gdf['name'].fillna('').str.lower()
+    return gdf[names.str.contains('школа') & ~names.str.contains(SCHOOL_EXCLUDE)]
+
+
+FACILITY_TYPES = {
+    "schools": {"tags": {'amenity': 'school'}, "filter": _filter_schools},
+    "clinics": {"tags": {'amenity': 'clinic'}, "filter": None},
+}
+
+
+def district_label(object_type, district):
+    # Исторически get-schools отдаёт короткие названия районов Бишкека, а get-clinics —
+    # полные. Районы других регионов всегда с полным названием: короткие совпадают
+    if object_type == "schools" and district in DISTRICTS:
+        return district.split(',')[0]
+    return district
+
+
+def _extract_points(gdf):
+    # Центроиды всех геометрий одной операцией shapely 2 (у точки центроид — она сама)
+    points = shapely.centroid(np.asarray(gdf.geometry.values, dtype=object))
+    # Пустые и отсутствующие геометрии пропускаются: get_x/get_y на пустой точке падают
+    present = ~(shapely.is_missing(points) | shapely.is_empty(points))
+    lat = np.full(len(points), np.nan)
+    lon = np.full(len(points), np.nan)
+    lat[present] = shapely.get_y(points[present])
+    lon[present] = shapely.get_x(points[present])
+
+    # Пропуск NaN координат (битые геометрии)
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+
+    if 'name' in gdf.columns:
+        names = gdf['name'].astype(object)
+        names = names.where(names.notna(), DEFAULT_NAME).to_numpy()
+    else:
+        names = np.full(len(gdf), DEFAULT_NAME, dtype=object)
+
+    return {
+        "lat": lat[valid],
+        "lon": lon[valid],
+        "names": names[valid],
+    }
+
+
+def _facilities_from_gdf(object_type, gdf):
+    spec = FACILITY_TYPES[object_type]
+    if spec["filter"] is not None:
+        gdf = spec["filter"](gdf)
+    return _extract_points(gdf)
+
+
+def get_facilities(object_type, district):
+    """Объекты типа object_type в районе: массивы lat, lon и names."""
+    gdf = features_from_place(district, FACILITY_TYPES[object_type]["tags"])
+    return _facilities_from_gdf(object_type, gdf)
+
+
+def facilities_by_district(object_type, districts=DISTRICTS, mode="district"):
+    """
+    {район: массивы объектов или {'error': ...}}.
+
+    mode='district' — районы грузятся параллельно, ошибка в одном не мешает
+    остальным; mode='city' — одна выгрузка на город каждого региона и sjoin по районам.
+    Если есть снимок (manage.py build_snapshot) — данные берутся из него.
+    """
+    snapshot = current_snapshot()
+    if snapshot is not None and snapshot.has_all(districts, f"{object_type}_lat"):
+        return {district: facilities_from_snapshot(snapshot, object_type, district) for district in districts}
+
+    if mode == "city":
+        def city_facilities(names, city):
+            by_district = city_features_by_district(FACILITY_TYPES[object_type]["tags"], names, city=city)
+            return {
+                district: _facilities_from_gdf(object_type, gdf)
+                for district, gdf in by_district.items()
+            }
+
+        return per_city(districts, city_facilities)
+
+    return map_districts(lambda district: get_facilities(object_type, district), districts)
+
+
+def facilities_from_snapshot(snapshot, object_type, district):
+    return {
+        "lat": np.asarray(snapshot.array(district, f"{object_type}_lat")),
+        "lon": np.asarray(snapshot.array(district, f"{object_type}_lon")),
+        "names": np.asarray(snapshot.json(district, f"{object_type}_names"), dtype=object),
+    }
+
+
+def coordinates_payload(facilities):
+    # Столбцами: в JSON словари {lat, lon, name} собирает уже рендерер
+    return PointSet(facilities["lat"], facilities["lon"], name=facilities["names"])
@@ -0,0 +1,267 @@
+from itertools import repeat
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .constants import OBJECT_TYPES, RADIUS_METERS
+from .coverage_service import CoverageEngine
+from .facility_service import facilities_from_snapshot
+from .grid_service import grid_from_snapshot
+from .models import MapCluster, MapFeature
+from .points import PointSet
+from .population_service import PopulationPoints, bin_to_grid
+
+# Слои: объекты ("schools"), провальные клетки ("gaps_schools"), предлагаемые места ("sites_schools")
+LAYERS = tuple(OBJECT_TYPES) + tuple(f"gaps_{t}" for t in OBJECT_TYPES) + tuple(f"sites_{t}" for t in OBJECT_TYPES)
+# Клетка кластера — тайл на столько уровней мельче: 256 / 2² = 64 пикселя
+CLUSTER_CELL_SHIFT = 2
+MAX_ZOOM = 22
+# Окно карты больше стольких тайлов своего масштаба не принимается — иначе
+# на крупном масштабе запрос по рамке страны вернул бы из R-tree миллионы точек
+MAX_VIEWPORT_TILES = 1024
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10_000
+# Если в окне крупного масштаба больше стольких точек, отдаются кластеры
+# самого мелкого уровня пирамиды: иначе время запроса растёт с плотностью
+MAX_VIEWPORT_POINTS = 5_000
+# Последняя широта Web Mercator
+MAX_LATITUDE = 85.05112878
+
+RTREE_TABLE = "buildings_mapfeature_rtree"
+
+
+def _mercator(lat, lon):
+    """Доли Web Mercator в [0, 1): x — слева направо, y — сверху вниз."""
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    upper = np.nextafter(1.0, 0.0)
+    return np.clip(x, 0.0, upper), np.clip(y, 0.0, upper)
+
+
+def district_layers(snapshot, district, types, scale):
+    """
+    {слой: {"lat", "lon", "weight" | "name"}} района по снимку: объекты,
+    провальные клетки (вес — жители клетки) и предлагаемые места
+    (вес — обслуживаемые жители). scale — жителей на единицу веса здания.
+    """
+    grid = grid_from_snapshot(snapshot, district)
+    population = PopulationPoints(
+        np.asarray(snapshot.array(district, "buildings_x")),
+        np.asarray(snapshot.array(district, "buildings_y")),
+        np.asarray(snapshot.array(district, "buildings_weight")) * scale,
+    )
+    residents = bin_to_grid(grid, population)
+
+    layers = {}
+    for object_type in types:
+        facilities = facilities_from_snapshot(snapshot, object_type, district)
+        layers[object_type] = {"lat": facilities["lat"], "lon": facilities["lon"], "name": facilities["names"]}
+
+        distance = CoverageEngine(facilities["lat"], facilities["lon"]).nearest_distance_xy(grid.x, grid.y)
+        uncovered = distance > RADIUS_METERS
+        layers[f"gaps_{object_type}"] = {
+            "lat": grid.lat[uncovered], "lon": grid.lon[uncovered], "weight": residents[uncovered],
+        }
+
+        sites = PointSet.from_records(snapshot.json(district, f"gaps_{object_type}")["new_coordinates"])
+        layers[f"sites_{object_type}"] = {
+            "lat": sites.lat, "lon": sites.lon,
+            "weight": sites.fields.get("residents_served", np.zeros(len(sites))),
+        }
+    return layers
+
+
+def _spread_bits(v):
+    # Биты 16-битного числа через один: 0b1011 -> 0b1000101
+    v = v & 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    return (v | (v << 1)) & 0x55555555
+
+
+def _z_order(lat, lon):
+    """Порядок точек по кривой Мортона на решётке 2¹⁶ × 2¹⁶ Web Mercator."""
+    x, y = _mercator(lat, lon)
+    cx, cy = (x * 65536).astype(np.int64), (y * 65536).astype(np.int64)
+    return np.argsort(_spread_bits(cx) | (_spread_bits(cy) << 1), kind="stable")
+
+
+def replace_layer(layer, district, lat, lon, weight=None, name=None):
+    """
+    Заменяет точки слоя в районе; R-tree обновляют триггеры (миграция 0002).
+    Точки пишутся в порядке кривой Мортона: соседние на карте оказываются
+    рядом и в R-tree, и на страницах таблицы — вставка и чтение окна быстрее.
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    order = _z_order(lat, lon)
+    weight = np.zeros(len(lat)) if weight is None else np.asarray(weight, dtype=float)
+    names = repeat("") if name is None else (value or "" for value in np.asarray(name, dtype=object)[order])
+    rows = zip(
+        repeat(layer), repeat(district),
+        lat[order].tolist(), lon[order].tolist(), weight[order].tolist(), names,
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        MapFeature.objects.filter(layer=layer, district=district).delete()
+        cursor.executemany(
+            f"INSERT INTO {MapFeature._meta.db_table} (layer, district, lat, lon, weight, name) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+    return len(lat)
+
+
+def _group(cx, cy, columns):
+    """Сливает строки с одинаковой клеткой (cx, cy): столбцы суммируются."""
+    keys, inverse = np.unique((cx << 32) | cy, return_inverse=True)
+    return keys >> 32, keys & 0xFFFFFFFF, [np.bincount(inverse, weights=column) for column in columns]
+
+
+def rebuild_clusters(layer, max_zoom=None):
+    """
+    Пересобирает кластеры слоя для масштабов 0..max_zoom (по умолчанию
+    FEATURE_CLUSTER_MAX_ZOOM). Точки раскладываются по клеткам самого
+    крупного масштаба, каждый следующий уровень — слияние четвёрок клеток
+    предыдущего, так что проход по точкам один. Возвращает число кластеров.
+    """
+    if max_zoom is None:
+        max_zoom = settings.FEATURE_CLUSTER_MAX_ZOOM
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT lat, lon, weight FROM {MapFeature._meta.db_table} WHERE layer = %s", [layer])
+        lat, lon, weight = np.array(cursor.fetchall(), dtype=float).reshape(-1, 3).T
+
+    cells = 2 ** (max_zoom + CLUSTER_CELL_SHIFT)
+    x, y = _mercator(lat, lon)
+    cx, cy = (x * cells).astype(np.int64), (y * cells).astype(np.int64)
+    # Суммы, из которых считаются центры и веса кластеров
+    columns = [np.ones(len(lat)), lat, lon, weight]
+
+    rows = []
+    for zoom in range(max_zoom, -1, -1):
+        cx, cy, columns = _group(cx, cy, columns)
+        count, lat_sum, lon_sum, weight_sum = columns
+        rows.extend(zip(
+            repeat(layer), repeat(zoom), cx.tolist(), cy.tolist(),
+            (lat_sum / count).tolist(), (lon_sum / count).tolist(),
+            count.astype(np.int64).tolist(), weight_sum.tolist(),
+        ))
+        cx, cy = cx >> 1, cy >> 1
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        MapCluster.objects.filter(layer=layer).delete()
+        cursor.executemany(
+            f"INSERT INTO {MapCluster._meta.db_table} (layer, zoom, cx, cy, lat, lon, count, weight) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+    return len(rows)
+
+
+def _parse_cursor(cursor):
+    if cursor is None:
+        return 0
+    try:
+        after = int(cursor)
+        if after < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError("Некорректный cursor: передайте next_cursor из предыдущего ответа.")
+    return after
+
+
+def _clusters(layer, x, y, zoom, after, limit):
+    (cx0, cx1), (cy0, cy1) = _cell_range(x, y, zoom)
+    with connection.cursor() as cursor:
+        # Диапазон клеток — по индексу (layer, zoom, cx, cy)
+        cursor.execute(
+            f"SELECT id, lat, lon, count, weight FROM {MapCluster._meta.db_table} "
+            "WHERE layer = %s AND zoom = %s AND cx BETWEEN %s AND %s AND cy BETWEEN %s AND %s AND id > %s "
+            "ORDER BY id LIMIT %s",
+            [layer, zoom, cx0, cx1, cy0, cy1, after, limit],
+        )
+        return cursor.fetchall()
+
+
+def _points(layer, bbox, after, limit):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    with connection.cursor() as cursor:
+        # R-tree хранит float32 с округлением наружу — точная рамка проверяется по таблице
+        cursor.execute(
+            f"SELECT f.id, f.lat, f.lon, f.weight, f.name FROM {RTREE_TABLE} r "
+            # CROSS JOIN фиксирует порядок: сначала R-tree, потом строки по id.
+            # Иначе планировщик идёт по индексу layer через весь слой
+            f"CROSS JOIN {MapFeature._meta.db_table} f ON f.id = r.id "
+            "WHERE r.min_lon <= %s AND r.max_lon >= %s AND r.min_lat <= %s AND r.max_lat >= %s "
+            "AND r.id > %s AND f.layer = %s AND f.lon BETWEEN %s AND %s AND f.lat BETWEEN %s AND %s "
+            "ORDER BY r.id LIMIT %s",
+            [max_lon, min_lon, max_lat, min_lat, after, layer, min_lon, max_lon, min_lat, max_lat, limit],
+        )
+        return cursor.fetchall()
+
+
+def _cell_range(x, y, zoom):
+    cells = 2 ** (zoom + CLUSTER_CELL_SHIFT)
+    return (x * cells).astype(np.int64).tolist(), (y * cells).astype(np.int64).tolist()
+
+
+def _points_in_cells(layer, x, y, zoom):
+    """Сколько точек слоя в клетках кластеров zoom, накрывающих окно (оценка сверху)."""
+    (cx0, cx1), (cy0, cy1) = _cell_range(x, y, zoom)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COALESCE(SUM(count), 0) FROM {MapCluster._meta.db_table} "
+            "WHERE layer = %s AND zoom = %s AND cx BETWEEN %s AND %s AND cy BETWEEN %s AND %s",
+            [layer, zoom, cx0, cx1, cy0, cy1],
+        )
+        return cursor.fetchone()[0]
+
+
+def viewport(layer, bbox, zoom, cursor=None, limit=PAGE_SIZE):
+    """
+    Точки слоя в окне карты bbox (min_lon, min_lat, max_lon, max_lat) на масштабе zoom.
+
+    До FEATURE_CLUSTER_MAX_ZOOM — кластеры (центр, число точек, суммарный
+    вес) из заранее собранной пирамиды, крупнее — сами точки из R-tree,
+    если их в окне не больше MAX_VIEWPORT_POINTS (иначе — кластеры
+    самого мелкого уровня).
+    Страницы — по id (cursor — next_cursor предыдущей страницы).
+    Возвращает (PointSet, next_cursor или None, кластеры ли это).
+    """
+    if layer not in LAYERS:
+        raise ValueError(f"Неизвестный слой '{layer}'. Доступны: {', '.join(LAYERS)}.")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom должен быть от 0 до {MAX_ZOOM}.")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit должен быть от 1 до {MAX_PAGE_SIZE}.")
+    after = _parse_cursor(cursor)
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    x, y = _mercator([max_lat, min_lat], [min_lon, max_lon])
+    if (x[1] - x[0]) * (y[1] - y[0]) * 4 ** zoom > MAX_VIEWPORT_TILES:
+        raise ValueError(f"Рамка слишком велика для масштаба {zoom}: не больше {MAX_VIEWPORT_TILES} тайлов.")
+
+    cluster_zoom = settings.FEATURE_CLUSTER_MAX_ZOOM
+    clustered = zoom <= cluster_zoom or _points_in_cells(layer, x, y, cluster_zoom) > MAX_VIEWPORT_POINTS
+    if clustered:
+        rows = _clusters(layer, x, y, min(zoom, cluster_zoom), after, limit + 1)
+    else:
+        rows = _points(layer, bbox, after, limit + 1)
+    next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    columns = list(zip(*rows)) or [()] * 5
+    if clustered:
+        _, lat, lon, count, weight = columns
+        fields = {"count": np.array(count, dtype=np.int64), "weight": weight}
+    elif layer in OBJECT_TYPES:
+        _, lat, lon, _, name = columns
+        fields = {"name": np.array(name, dtype=object)}
+    else:
+        _, lat, lon, weight, _ = columns
+        fields = {"weight": weight}
+    if "weight" in fields:
+        # Вес — жители, как и в остальных ответах целым числом
+        fields["weight"] = np.rint(np.array(fields["weight"], dtype=float)).astype(np.int64)
+    return PointSet(lat, lon, **fields), next_cursor, clustered
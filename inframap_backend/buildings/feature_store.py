@@ -0,0 +1,184 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import geopandas as gpd
+import osmnx as ox
+import pandas as pd
+from django.conf import settings
+
+from .concurrency import upstream_slot
+from .instrumentation import count, stage
+from .response_cache import bump_data_version
+
+
+def _osm_features(place, tags):
+    return ox.features_from_place(place, tags)
+
+
+def _osm_boundary(place):
+    return ox.geocode_to_gdf(place)
+
+
+class FeatureStore:
+    """
+    Дисковый кэш выгрузок OSM, ключ — (место, теги).
+
+    GeoDataFrame сохраняется в GeoParquet, рядом лежит JSON с описанием
+    ключа и временем загрузки — по нему работают TTL и ручная инвалидация.
+    fetcher/geocoder подменяются в тестах, чтобы не ходить в сеть.
+    """
+
+    FEATURES = "features"
+    BOUNDARIES = "boundaries"
+
+    def __init__(self, root, ttl=None, fetcher=_osm_features, geocoder=_osm_boundary, on_update=None):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.fetcher = fetcher
+        self.geocoder = geocoder
+        self.on_update = on_update
+
+    @staticmethod
+    def key(kind, place, tags=None):
+        raw = json.dumps([kind, place, tags], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        return self.root / f"{key}.parquet", self.root / f"{key}.json"
+
+    def _is_fresh(self, meta_path):
+        if not meta_path.exists():
+            return False
+        if self.ttl is None:
+            return True
+        with open(meta_path, encoding="utf-8") as f:
+            fetched_at = json.load(f)["fetched_at"]
+        return time.time() - fetched_at < self.ttl
+
+    def _get(self, kind, place, tags, fetch):
+        key = self.key(kind, place, tags)
+        data_path, meta_path = self._paths(key)
+        if self._is_fresh(meta_path) and data_path.exists():
+            count("osm_cache.hit")
+            with stage("osm_cache_read"):
+                return gpd.read_parquet(data_path)
+
+        count("osm_cache.miss")
+        count(f"upstream.{kind}")
+        with upstream_slot(), stage(f"fetch_{kind}"):
+            gdf = fetch()
+        if self.on_update is not None:
+            self.on_update()
+        self._save(data_path, meta_path, gdf, {
+            "kind": kind,
+            "place": place,
+            "tags": tags,
+            "fetched_at": time.time(),
+            "rows": len(gdf),
+        })
+        return gdf
+
+    def _save(self, data_path, meta_path, gdf, meta):
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Запись через временный файл: параллельные запросы не увидят недописанный кэш
+        tmp_data = _tmp_path(data_path)
+        _parquet_safe(gdf).to_parquet(tmp_data)
+        os.replace(tmp_data, data_path)
+
+        tmp_meta = _tmp_path(meta_path)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, meta_path)
+
+    def features(self, place, tags):
+        return self._get(self.FEATURES, place, tags, lambda: self.fetcher(place, tags))
+
+    def boundary(self, place):
+        return self._get(self.BOUNDARIES, place, None, lambda: self.geocoder(place))
+
+    def entries(self):
+        if not self.root.exists():
+            return []
+        entries = []
+        for meta_path in sorted(self.root.glob("*.json")):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            meta["key"] = meta_path.stem
+            entries.append(meta)
+        return entries
+
+    def invalidate(self, place=None, tags=None):
+        """Удаляет записи по месту и/или тегам (без аргументов — весь кэш). Возвращает число записей."""
+        removed = 0
+        for meta in self.entries():
+            if place is not None and meta["place"] != place:
+                continue
+            if tags is not None and meta["tags"] != tags:
+                continue
+            for path in self._paths(meta["key"]):
+                path.unlink(missing_ok=True)
+            removed += 1
+        if removed and self.on_update is not None:
+            self.on_update()
+        return removed
+
+
+def _tmp_path(path):
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _as_text(value):
+    if value is None or isinstance(value, str) or (isinstance(value, float) and math.isnan(value)):
+        return value
+    return str(value)
+
+
+def _parquet_safe(gdf):
+    # В выгрузках OSM бывают object-колонки со смешанными типами (списки, числа),
+    # которые pyarrow не сериализует — такие значения приводятся к строкам
+    gdf = gdf.copy()
+    for column in gdf.columns:
+        if column != gdf.geometry.name and gdf[column].dtype == object:
+            gdf[column] = gdf[column].map(_as_text)
+    if isinstance(gdf.index, pd.MultiIndex):
+        gdf.index = gdf.index.set_names([n or f"level_{i}" for i, n in enumerate(gdf.index.names)])
+    return gdf
+
+
+_override = None
+
+
+@lru_cache(maxsize=1)
+def _settings_store():
+    # Новая выгрузка меняет версию данных — закэшированные ответы API становятся неактуальны
+    if settings.OSM_DATA_SOURCE != "overpass":
+        # Импорт здесь: extract_source сам зависит от этого модуля
+        from .extract_source import extract_store
+
+        # Локальный файл не устаревает сам по себе, поэтому без TTL
+        return extract_store(settings.OSM_DATA_SOURCE, settings.OSM_BOUNDARY_SOURCE, on_update=bump_data_version)
+    return FeatureStore(settings.OSM_CACHE_DIR, ttl=settings.OSM_CACHE_TTL, on_update=bump_data_version)
+
+
+def default_store():
+    return _override if _override is not None else _settings_store()
+
+
+def set_default_store(store):
+    """Подменяет хранилище для всего процесса (None — вернуть настройки по умолчанию)."""
+    global _override
+    _override = store
+
+
+def features_from_place(place, tags):
+    return default_store().features(place, tags)
+
+
+def geocode_to_gdf(place):
+    return default_store().boundary(place)
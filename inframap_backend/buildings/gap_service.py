@@ -0,0 +1,142 @@
+import numpy as np
+
+from .constants import METRICS, OBJECT_TYPES, RADIUS_METERS
+from .coverage_service import CoverageEngine, to_metric
+from .facility_service import district_label
+from .grid_service import STEP_METERS, district_grid
+from .instrumentation import stage
+from .network_service import load_network
+from .placement_service import greedy_placement
+from .points import PointSet
+from .population_service import bin_to_grid
+from .regions import default_registry, summarize
+from .snapshot import current_snapshot
+
+
+def nearest_distances(district, grid, facilities, radius, metric="euclidean"):
+    """Расстояние от каждой клетки решётки до ближайшего объекта: по прямой или по пешеходной сети."""
+    if metric == "network":
+        network = load_network(district)
+        x, y = to_metric(facilities["lat"], facilities["lon"])
+        # Дальше радиуса точное расстояние не нужно — Дейкстра останавливается раньше
+        node_distances = network.node_distances(x, y, limit=radius)
+        return network.point_distances(grid.x, grid.y, node_distances)
+
+    engine = CoverageEngine(facilities["lat"], facilities["lon"])
+    # Вся решётка района проверяется одним запросом к KD-дереву
+    return engine.nearest_distance_xy(grid.x, grid.y)
+
+
+def find_gaps(district, facilities, radius=RADIUS_METERS, max_new=None, step=STEP_METERS,
+              population=None, metric="euclidean", grid=None):
+    """
+    Провальные клетки района и предлагаемые места для новых объектов.
+
+    facilities — массивы lat/lon существующих объектов (см. facility_service).
+    population — PopulationPoints района; если задано, клетки взвешиваются
+    числом жителей и места для новых объектов ранжируются по числу людей.
+    metric='network' считает покрытие по пешеходной сети; зона охвата
+    новых объектов при расстановке по-прежнему оценивается по прямой.
+    grid — готовая решётка района (по умолчанию district_grid(district, step)).
+    """
+    if grid is None:
+        with stage("grid"):
+            grid = district_grid(district, step)
+    with stage(f"distances_{metric}"):
+        uncovered = nearest_distances(district, grid, facilities, radius, metric) > radius
+    gap_xy = grid.xy[uncovered]
+    gap_lat, gap_lon = grid.lat[uncovered], grid.lon[uncovered]
+
+    with stage("bin_population"):
+        residents = bin_to_grid(grid, population) if population is not None else None
+    gap_weights = residents[uncovered] if residents is not None else None
+
+    # Новые объекты ставятся в провальные клетки жадным max-coverage
+    with stage("placement"):
+        placement = greedy_placement(gap_xy, gap_xy, radius, max_new=max_new, weights=gap_weights)
+
+    chosen = np.asarray(placement["placements"], dtype=np.int64)
+    new_objects = PointSet(np.round(gap_lat[chosen], 6), np.round(gap_lon[chosen], 6))
+
+    result = {
+        "new_needed": len(new_objects),
+        "new_coordinates": new_objects,
+        "grid_cells": len(grid),
+        "gap_cells": int(np.count_nonzero(uncovered)),
+    }
+    if residents is None:
+        result.update({
+            "covered_gap_cells": int(placement["covered"]),
+            "remaining_gap_cells": int(placement["uncovered"]),
+            "coverage_gains": [int(g) for g in placement["gains"]],
+        })
+    else:
+        served = np.rint(np.asarray(placement["gains"], dtype=float)).astype(np.int64)
+        new_objects.fields["residents_served"] = served
+        result.update({
+            "residents": int(round(residents.sum())),
+            "residents_uncovered": int(round(placement["total"])),
+            "residents_covered_by_new": int(round(placement["covered"])),
+            "residents_remaining": int(round(placement["uncovered"])),
+        })
+    return result
+
+
+def precomputed_gaps(object_type, districts):
+    """
+    Результаты из снимка (manage.py build_snapshot) — они считаются с
+    параметрами по умолчанию: RADIUS_METERS, вес по населению, по прямой.
+    """
+    snapshot = current_snapshot()
+    name = f"gaps_{object_type}"
+    if snapshot is None or not snapshot.has_all(districts, name):
+        return None
+    result = {}
+    for district in districts:
+        gaps = snapshot.json(district, name)
+        gaps["new_coordinates"] = PointSet.from_records(gaps["new_coordinates"])
+        result[district] = gaps
+    return result
+
+
+def gap_params(params):
+    """
+    Параметры поиска провалов: {"type", "max_new", "weight", "metric"}
+    из query-параметров или тела задачи; ValueError — недопустимое значение.
+    """
+    object_type = params.get("type", "schools")
+    if object_type not in OBJECT_TYPES:
+        raise ValueError("Недопустимый тип. Используйте 'schools' или 'clinics'.")
+
+    max_new = params.get("max_new")
+    if max_new is not None:
+        try:
+            max_new = int(max_new)
+            if max_new < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError("max_new должен быть неотрицательным целым числом.")
+
+    weight = params.get("weight", "population")
+    if weight not in ("population", "cells"):
+        raise ValueError("Недопустимый вес. Используйте 'population' или 'cells'.")
+
+    metric = params.get("metric", "euclidean")
+    if metric not in METRICS:
+        raise ValueError("Недопустимая метрика. Используйте 'euclidean' или 'network'.")
+    return {"type": object_type, "max_new": max_new, "weight": weight, "metric": metric}
+
+
+def gaps_payload(object_type, weight, metric, by_district):
+    """Тело ответа find-gaps: результаты по подписям районов и итоги по регионам."""
+    return {
+        "type": object_type,
+        "radius_m": RADIUS_METERS,
+        "weight": weight,
+        "metric": metric,
+        "result": {
+            district_label(object_type, district): gaps
+            for district, gaps in by_district.items()
+        },
+        "regions": summarize(default_registry(), by_district),
+    }
@@ -0,0 +1,94 @@
+from functools import lru_cache
+
+import numpy as np
+import shapely
+
+from .coverage_service import METRIC_CRS, to_geographic
+from .feature_store import geocode_to_gdf
+from .snapshot import current_snapshot
+
+STEP_METERS = 500
+
+
+class DistrictGrid:
+    """
+    Регулярная решётка с шагом step (метры UTM), обрезанная по полигону района.
+
+    row/col — индексы точек в полной решётке по охватывающему прямоугольнику
+    с началом в (x0, y0); по ним удобно раскладывать данные по клеткам.
+    """
+
+    def __init__(self, x, y, row, col, x0, y0, step, shape):
+        self.x = x
+        self.y = y
+        self.row = row
+        self.col = col
+        self.x0 = x0
+        self.y0 = y0
+        self.step = step
+        self.shape = shape
+        self.lat, self.lon = to_geographic(x, y)
+        for array in (self.x, self.y, self.row, self.col, self.lat, self.lon):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def xy(self):
+        return np.column_stack([self.x, self.y])
+
+    def cell_index(self, x, y):
+        """Плоский индекс клетки полной решётки для точек (x, y); вне решётки — -1."""
+        col = np.floor((np.asarray(x) - self.x0) / self.step + 0.5).astype(np.int64)
+        row = np.floor((np.asarray(y) - self.y0) / self.step + 0.5).astype(np.int64)
+        rows, cols = self.shape
+        inside = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+        return np.where(inside, row * cols + col, -1)
+
+
+def build_grid(polygon, step=STEP_METERS):
+    """Решётка по полигону в метрической проекции; точки вне полигона отсекаются векторно."""
+    xmin, ymin, xmax, ymax = polygon.bounds
+    xs = np.arange(xmin, xmax + step, step)
+    ys = np.arange(ymin, ymax + step, step)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    rows, cols = np.indices(grid_x.shape)
+
+    shapely.prepare(polygon)
+    inside = shapely.contains_xy(polygon, grid_x, grid_y)
+    return DistrictGrid(
+        grid_x[inside], grid_y[inside], rows[inside], cols[inside],
+        xmin, ymin, step, grid_x.shape,
+    )
+
+
+def grid_from_snapshot(snapshot, district):
+    meta = snapshot.json(district, "grid")
+    return DistrictGrid(
+        np.asarray(snapshot.array(district, "grid_x")),
+        np.asarray(snapshot.array(district, "grid_y")),
+        np.asarray(snapshot.array(district, "grid_row")),
+        np.asarray(snapshot.array(district, "grid_col")),
+        meta["x0"], meta["y0"], meta["step"], tuple(meta["shape"]),
+    )
+
+
+def district_grid(district, step=STEP_METERS):
+    """Решётка района: из снимка (manage.py build_snapshot), если он есть, иначе строится."""
+    snapshot = current_snapshot()
+    if snapshot is not None and snapshot.has(district, "grid") and snapshot.manifest["step"] == step:
+        return _snapshot_grid(snapshot.version, district)
+    return _boundary_grid(district, step)
+
+
+@lru_cache(maxsize=64)
+def _snapshot_grid(version, district):
+    return grid_from_snapshot(current_snapshot(), district)
+
+
+@lru_cache(maxsize=64)
+def _boundary_grid(district, step):
+    """Решётка по границе района, кэшируется в процессе по (район, шаг)."""
+    boundary = geocode_to_gdf(district).to_crs(METRIC_CRS)
+    return build_grid(boundary.union_all(), step)
@@ -0,0 +1,265 @@
+import bisect
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+# Границы корзин гистограмм, мс
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# Сколько строк отчёта cProfile отдаётся на ?profile=1
+PROFILE_LINES = 40
+
+_trace = contextvars.ContextVar("inframap_trace", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам — верхняя граница корзины, куда он попал."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for upper, count in zip(BUCKETS_MS + (self.max_ms,), self.counts):
+            seen += count
+            if seen >= rank:
+                return float(min(upper, self.max_ms))
+        return self.max_ms
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5), 3),
+            "p95_ms": round(self.quantile(0.95), 3),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": {
+                **{f"le_{upper}": count for upper, count in zip(BUCKETS_MS, self.counts)},
+                "inf": self.counts[-1],
+            },
+        }
+
+
+class Metrics:
+    """
+    Метрики процесса: гистограммы длительности этапов и счётчики
+    (попадания в кэши, обращения к внешним сервисам). У каждого воркера свои.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.started_at = time.time()
+
+    def observe(self, stage, ms):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(ms)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def hit_ratios(self):
+        """Доля попаданий для каждого счётчика вида <кэш>.hit / <кэш>.miss."""
+        ratios = {}
+        for name, hits in self.counters.items():
+            if not name.endswith(".hit"):
+                continue
+            cache = name[:-len(".hit")]
+            lookups = hits + sum(
+                value for key, value in self.counters.items()
+                if key.startswith(f"{cache}.") and key != name
+            )
+            ratios[cache] = round(hits / lookups, 4) if lookups else 0.0
+        return ratios
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "stages": {name: h.summary() for name, h in sorted(self.stages.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "hit_ratios": self.hit_ratios(),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.started_at = time.time()
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """
+    Время этапов одного запроса: {этап: [мс, число вызовов]}.
+    profile — запрошен ли ?profile=1; profiler заполняет тот, кто выполняет view (run_profiled).
+    """
+
+    def __init__(self, profile=False):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.profile = profile
+        self.profiler = None
+
+    def add(self, stage, ms):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += ms
+            entry[1] += 1
+
+    def server_timing(self):
+        # Этапы в потоках map_districts идут параллельно, поэтому сумма
+        # по этапам может быть больше общего времени запроса
+        return ", ".join(
+            f'{stage};dur={ms:.1f};desc="{stage} x{count}"' if count > 1 else f"{stage};dur={ms:.1f}"
+            for stage, (ms, count) in self.stages.items()
+        )
+
+
+@contextmanager
+def stage(name):
+    """Замеряет блок: в гистограмму процесса и в Server-Timing текущего запроса."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        metrics.observe(name, ms)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(name, ms)
+
+
+def timed(name):
+    """Декоратор-версия stage()."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    metrics.count(name, n)
+
+
+def profiling_requested(request):
+    return settings.REQUEST_PROFILING and request.GET.get("profile") == "1"
+
+
+def run_profiled(func, *args, **kwargs):
+    """
+    Вызывает func под cProfile, если текущий запрос профилируется.
+    Должно выполняться в том потоке, где идёт работа view: cProfile
+    видит только свой поток.
+    """
+    trace = _trace.get()
+    if trace is None or not trace.profile:
+        return func(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        # Вложенный вызов (в потоке, где на самом деле работал view)
+        # завершается раньше внешнего — в отчёт идёт именно он
+        if trace.profiler is None:
+            trace.profiler = profiler
+
+
+def _profile_report(profiler):
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return out.getvalue()
+
+
+class ServerTimingMiddleware:
+    """
+    Заголовок Server-Timing по этапам запроса (stage/timed) и общее время.
+
+    ?profile=1 (если включён REQUEST_PROFILING) выполняет view под cProfile
+    и вместо тела отдаёт текстовый отчёт; исходный статус — в X-Profiled-Status.
+    cProfile видит только поток view: работа в потоках map_districts
+    в отчёт не попадает, её время видно по этапам в Server-Timing.
+
+    Работает и в синхронной, и в асинхронной цепочке middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trace = Trace(profile=profiling_requested(request))
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        try:
+            response = run_profiled(self.get_response, request)
+        finally:
+            _trace.reset(token)
+        return self._finish(request, response, trace, started)
+
+    async def __acall__(self, request):
+        trace = Trace(profile=profiling_requested(request))
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _trace.reset(token)
+        return self._finish(request, response, trace, started)
+
+    def _finish(self, request, response, trace, started):
+        total_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            metrics.observe(f"request:{match.route}", total_ms)
+
+        timing = trace.server_timing()
+        response["Server-Timing"] = f"{timing}, total;dur={total_ms:.1f}" if timing else f"total;dur={total_ms:.1f}"
+
+        if trace.profiler is None:
+            return response
+        profiled = HttpResponse(_profile_report(trace.profiler), content_type="text/plain; charset=utf-8")
+        profiled["Server-Timing"] = response["Server-Timing"]
+        profiled["X-Profiled-Status"] = str(response.status_code)
+        return profiled
@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import job_tasks
+from .gap_service import gap_params, gaps_payload, precomputed_gaps
+from .models import AnalysisJob
+from .population_service import (
+    _count_buildings, _group_districts, distribute_population, population_groups, population_scales,
+)
+from .regions import default_registry, districts_from_params
+from .renderers import PayloadEncoder
+from .response_cache import data_version
+
+# Как часто поток /stream/ перечитывает задачу
+STREAM_POLL_SECONDS = 0.5
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Задачи, которые ведёт этот процесс: им обновляется heartbeat_at
+_owned = set()
+_owned_lock = threading.Lock()
+
+
+def _process_pool():
+    # spawn, а не fork: процесс сервера многопоточный, а fork копирует
+    # чужие захваченные блокировки (пулы районов, кэши, соединения с БД)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.JOB_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=job_tasks.init_worker,
+            )
+        return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=1)
+def _coordinators():
+    # Потоки только раздают районы процессам и пишут прогресс в БД
+    return ThreadPoolExecutor(max_workers=settings.JOB_MAX_ACTIVE, thread_name_prefix="analysis-job")
+
+
+@lru_cache(maxsize=1)
+def _heartbeat():
+    thread = threading.Thread(target=_heartbeat_loop, name="analysis-job-heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(settings.JOB_HEARTBEAT_SECONDS)
+        with _owned_lock:
+            owned = list(_owned)
+        if not owned:
+            continue
+        try:
+            AnalysisJob.objects.filter(pk__in=owned, status__in=AnalysisJob.ACTIVE).update(heartbeat_at=timezone.now())
+        except DatabaseError:
+            # База занята — отметка обновится в следующий раз
+            pass
+
+
+class _Progress:
+    """Прогресс задачи в БД: expect(n) — сколько частей, step() — ещё одна готова."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.done = 0
+
+    def expect(self, total):
+        AnalysisJob.objects.filter(pk=self.job_id).update(progress_total=total)
+
+    def step(self):
+        self.done += 1
+        AnalysisJob.objects.filter(pk=self.job_id).update(progress_done=self.done)
+
+
+def fan_out(progress, func, districts, *args):
+    """
+    {район: func(*args, район)} в пуле процессов, районы параллельно.
+    Ошибка района — {'error': ...}, как у map_districts; падение процесса
+    пула проваливает задачу целиком, а пул пересоздаётся.
+    """
+    pool = _process_pool()
+    try:
+        futures = {pool.submit(func, *args, district): district for district in districts}
+        result = {}
+        for future in as_completed(futures):
+            try:
+                result[futures[future]] = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                result[futures[future]] = {'error': str(e)}
+            progress.step()
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise RuntimeError("Процесс расчёта аварийно завершился.")
+    return {district: result[district] for district in districts}
+
+
+def _find_gaps(params, progress):
+    districts = params["districts"]
+    default_params = params["max_new"] is None and params["weight"] == "population" and params["metric"] == "euclidean"
+    precomputed = precomputed_gaps(params["type"], districts) if default_params else None
+    if precomputed is not None:
+        return gaps_payload(params["type"], params["weight"], params["metric"], precomputed)
+
+    scales = {}
+    if params["weight"] == "population":
+        # Население нормируется по всему региону: сначала веса зданий всех его районов
+        groups = population_groups(districts)
+        needed = _group_districts(groups)
+        progress.expect(len(needed) + len(districts))
+        scales = population_scales(groups, fan_out(progress, job_tasks.building_weight, needed))
+    else:
+        progress.expect(len(districts))
+
+    by_district = fan_out(progress, job_tasks.district_gaps, districts, params, scales)
+    return gaps_payload(params["type"], params["weight"], params["metric"], by_district)
+
+
+def _estimate_population(params, progress):
+    districts = params["districts"]
+    groups = population_groups(districts)
+    needed = _group_districts(groups)
+    progress.expect(len(needed))
+    results = distribute_population(groups, fan_out(progress, _count_buildings, needed))
+
+    registry = default_registry()
+    return [{**results[district], "region": registry.region_of(district).key} for district in districts]
+
+
+# Виды задач: {kind: runner(params, progress) -> тело ответа как у обычного эндпоинта}
+RUNNERS = {
+    "find_gaps": _find_gaps,
+    "estimate_population": _estimate_population,
+}
+
+
+def parse_job(data):
+    """
+    Проверяет тело POST jobs/: {"kind", "params": {region, bbox, ...}}.
+    Возвращает (kind, params), в params — уже список районов; ValueError — ошибка.
+    """
+    if not isinstance(data, dict) or data.get("kind") not in RUNNERS:
+        raise ValueError(f"Ожидается JSON {{kind, params}}, kind — одно из: {', '.join(RUNNERS)}.")
+    raw = data.get("params") or {}
+    if not isinstance(raw, dict):
+        raise ValueError("params должен быть объектом.")
+
+    scope = {
+        name: ",".join(map(str, value)) if isinstance(value, list) else str(value)
+        for name, value in raw.items()
+        if name in ("region", "bbox") and value is not None
+    }
+    districts = districts_from_params(scope)
+    if not districts:
+        raise ValueError("В выбранной области нет районов.")
+
+    params = gap_params(raw) if data["kind"] == "find_gaps" else {}
+    return data["kind"], {**params, "districts": districts}
+
+
+def job_key(kind, params):
+    # Версия данных входит в ключ: после новой выгрузки OSM задача считается заново
+    raw = json.dumps({"kind": kind, "params": params, "version": data_version()}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _expire_lost(**filters):
+    # Задачи без отметки жизни вели процессы, которых уже нет
+    stale = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    AnalysisJob.objects.filter(status__in=AnalysisJob.ACTIVE, heartbeat_at__lt=stale, **filters).update(
+        status=AnalysisJob.FAILED,
+        error="Задача прервана: процесс сервера перезапущен.",
+        finished_at=timezone.now(),
+    )
+
+
+def submit(kind, params):
+    """
+    (задача, создана ли новая). Такая же задача в работе или готовая не
+    раньше JOB_RESULT_TTL секунд назад возвращается вместо новой — в том
+    числе запущенная другим процессом сервера.
+    """
+    key = job_key(kind, params)
+    _expire_lost(key=key)
+    fresh = timezone.now() - timedelta(seconds=settings.JOB_RESULT_TTL)
+    existing = (
+        AnalysisJob.objects
+        .filter(Q(status__in=AnalysisJob.ACTIVE) | Q(status=AnalysisJob.DONE, finished_at__gte=fresh), key=key)
+        .first()
+    )
+    if existing is not None:
+        return existing, False
+
+    try:
+        with transaction.atomic():
+            job = AnalysisJob.objects.create(kind=kind, params=params, key=key)
+    except IntegrityError:
+        # Ту же задачу только что создал параллельный запрос; к этому моменту
+        # она могла уже завершиться или упасть — берём последнюю с этим ключом
+        competing = AnalysisJob.objects.filter(key=key).order_by("-created_at").first()
+        if competing is None:
+            raise
+        return competing, False
+    _start(job)
+    return job, True
+
+
+def _start(job):
+    with _owned_lock:
+        _owned.add(job.pk)
+    _heartbeat()
+    _coordinators().submit(_run, job.pk)
+
+
+def _run(job_id):
+    try:
+        job = AnalysisJob.objects.get(pk=job_id)
+        AnalysisJob.objects.filter(pk=job_id).update(status=AnalysisJob.RUNNING, started_at=timezone.now())
+        try:
+            result = RUNNERS[job.kind](job.params, _Progress(job_id))
+        except Exception as e:
+            AnalysisJob.objects.filter(pk=job_id).update(
+                status=AnalysisJob.FAILED, error=str(e), finished_at=timezone.now(),
+            )
+        else:
+            AnalysisJob.objects.filter(pk=job_id).update(
+                status=AnalysisJob.DONE, result=result, finished_at=timezone.now(),
+            )
+    finally:
+        with _owned_lock:
+            _owned.discard(job_id)
+        # Соединение с БД у каждого потока своё
+        connections.close_all()
+
+
+def load_job(job_id):
+    """Задача по id (AnalysisJob.DoesNotExist — нет такой); потерянная помечается как упавшая."""
+    _expire_lost(pk=job_id)
+    return AnalysisJob.objects.get(pk=job_id)
+
+
+def job_payload(job, with_result=True):
+    payload = {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "progress": {"done": job.progress_done, "total": job.progress_total},
+        "params": job.params,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if job.status == AnalysisJob.FAILED:
+        payload["error"] = job.error
+    if with_result and job.status == AnalysisJob.DONE:
+        payload["result"] = job.result
+    return payload
+
+
+def _line(payload):
+    return json.dumps(payload, cls=PayloadEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _event(job_id, last):
+    """(строка NDJSON или None, если ничего не изменилось; состояние; задача завершена)."""
+    job = load_job(job_id)
+    state = (job.status, job.progress_done, job.progress_total)
+    finished = job.status not in AnalysisJob.ACTIVE
+    line = _line(job_payload(job, with_result=finished)) if state != last else None
+    return line, state, finished
+
+
+def job_events(job_id):
+    """
+    NDJSON-поток задачи: строка при каждом изменении статуса или прогресса,
+    последняя — с результатом или ошибкой.
+    """
+    last = None
+    while True:
+        line, last, finished = _event(job_id, last)
+        if line is not None:
+            yield line
+        if finished:
+            return
+        time.sleep(STREAM_POLL_SECONDS)
+
+
+async def ajob_events(job_id):
+    # То же для ASGI: синхронный генератор Django отдал бы только целиком, в конце
+    last = None
+    while True:
+        line, last, finished = await sync_to_async(_event)(job_id, last)
+        if line is not None:
+            yield line
+        if finished:
+            return
+        await asyncio.sleep(STREAM_POLL_SECONDS)
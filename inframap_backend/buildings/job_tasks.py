@@ -0,0 +1,43 @@
+import os
+
+import django
+
+from .constants import RADIUS_METERS
+from .facility_service import facilities_by_district
+from .gap_service import find_gaps
+from .population_service import PopulationPoints, raw_building_points
+
+# Части фоновых задач, которые выполняются в процессах пула (buildings.job_service).
+# Модуль импортируется в свежем процессе до django.setup(), поэтому моделей
+# и базы здесь нет: аргументы и результаты передаются через pickle
+
+
+def init_worker():
+    # Процесс пула стартует с чистого интерпретатора (spawn) — Django настраивается заново
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    django.setup()
+
+
+def building_weight(district):
+    """Суммарный вес жилых зданий района (см. population_service.population_scales)."""
+    points = raw_building_points([district])[district]
+    return points if 'error' in points else float(points["weight"].sum())
+
+
+def district_gaps(params, scales, district):
+    """find_gaps по одному району; scales — {район: жителей на единицу веса здания}."""
+    facilities = facilities_by_district(params["type"], [district])[district]
+    if 'error' in facilities:
+        return facilities
+
+    population = None
+    if params["weight"] == "population":
+        points = raw_building_points([district])[district]
+        if 'error' in points:
+            return {'error': f"Население: {points['error']}"}
+        population = PopulationPoints(points["x"], points["y"], points["weight"] * scales[district])
+
+    return find_gaps(
+        district, facilities, RADIUS_METERS, max_new=params["max_new"],
+        population=population, metric=params["metric"],
+    )
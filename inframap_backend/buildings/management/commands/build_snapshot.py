@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from buildings.concurrency import map_districts
+from buildings.coverage_service import METRIC_CRS
+from buildings.extract_source import extract_store
+from buildings.facility_service import FACILITY_TYPES, get_facilities
+from buildings.feature_store import geocode_to_gdf, set_default_store
+from buildings.gap_service import RADIUS_METERS, find_gaps
+from buildings.grid_service import STEP_METERS, build_grid, grid_from_snapshot
+from buildings.points import json_default
+from buildings.population_service import PopulationPoints, building_points, population_groups
+from buildings.regions import default_registry
+from buildings.response_cache import bump_data_version
+from buildings.snapshot import MANIFEST, Snapshot, current_snapshot, district_slug, publish
+
+
+def _load_inputs(district, types):
+    boundary = geocode_to_gdf(district).to_crs(METRIC_CRS).union_all()
+    return {
+        "boundary": boundary,
+        "facilities": {object_type: get_facilities(object_type, district) for object_type in types},
+        "buildings": building_points(district),
+    }
+
+
+def _input_hash(inputs, step):
+    digest = hashlib.sha1(f"step={step}".encode())
+    digest.update(inputs["boundary"].wkb)
+    for object_type, facilities in sorted(inputs["facilities"].items()):
+        digest.update(object_type.encode())
+        digest.update(np.ascontiguousarray(facilities["lat"]).tobytes())
+        digest.update(np.ascontiguousarray(facilities["lon"]).tobytes())
+        digest.update(json.dumps(facilities["names"].tolist(), ensure_ascii=False).encode())
+    for name in ("x", "y", "weight"):
+        digest.update(np.ascontiguousarray(inputs["buildings"][name]).tobytes())
+    return digest.hexdigest()
+
+
+# Файлы переиспользованных районов — жёсткие ссылки на прошлую версию,
+# поэтому запись всегда идёт через новый файл и os.replace, а не поверх
+
+def _save_array(directory, name, array):
+    tmp = directory / f"{name}.tmp.npy"
+    np.save(tmp, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(tmp, directory / f"{name}.npy")
+    return name
+
+
+def _save_json(directory, name, data):
+    tmp = directory / f"{name}.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=json_default)
+    os.replace(tmp, directory / f"{name}.json")
+    return name
+
+
+def _write_district(directory, inputs, step):
+    directory.mkdir(parents=True)
+    files = []
+    for object_type, facilities in inputs["facilities"].items():
+        files.append(_save_array(directory, f"{object_type}_lat", facilities["lat"]))
+        files.append(_save_array(directory, f"{object_type}_lon", facilities["lon"]))
+        files.append(_save_json(directory, f"{object_type}_names", facilities["names"].tolist()))
+
+    grid = build_grid(inputs["boundary"], step)
+    for name in ("x", "y", "row", "col"):
+        files.append(_save_array(directory, f"grid_{name}", getattr(grid, name)))
+    files.append(_save_json(directory, "grid", {
+        "x0": grid.x0, "y0": grid.y0, "step": grid.step, "shape": list(grid.shape),
+    }))
+
+    for name in ("x", "y", "weight"):
+        files.append(_save_array(directory, f"buildings_{name}", inputs["buildings"][name]))
+    return files
+
+
+def _link_district(source, target, files):
+    target.mkdir(parents=True)
+    for path in source.iterdir():
+        if path.stem not in files:
+            continue
+        try:
+            os.link(path, target / path.name)
+        except OSError:
+            shutil.copy2(path, target / path.name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает снимок предрасчитанных данных (объекты, решётки, население, провалы) "
+        "в SNAPSHOT_DIR/<версия>. Районы с неизменившимися входными данными переиспользуются "
+        "из предыдущего снимка."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--region", nargs="+", help="Регионы реестра (по умолчанию — DEFAULT_REGION)")
+        parser.add_argument("--types", nargs="+", choices=sorted(FACILITY_TYPES), default=sorted(FACILITY_TYPES))
+        parser.add_argument("--step", type=float, default=STEP_METERS, help="Шаг решётки, м")
+        parser.add_argument("--extract", help="Локальная выгрузка OSM вместо Overpass (.osm.pbf, GeoJSON и др.)")
+        parser.add_argument("--boundaries", help="Файл с границами районов, если их нет в выгрузке")
+        parser.add_argument("--full", action="store_true", help="Пересобрать все районы")
+        parser.add_argument("--keep", type=int, default=3, help="Сколько старых версий хранить")
+
+    def handle(self, *args, **options):
+        root = Path(settings.SNAPSHOT_DIR)
+        types = options["types"]
+        step = options["step"]
+
+        source = settings.OSM_DATA_SOURCE
+        if options["extract"]:
+            path = Path(options["extract"])
+            if not path.exists():
+                raise CommandError(f"Файл {path} не найден")
+            set_default_store(extract_store(path, options["boundaries"]))
+            source = str(path)
+
+        registry = default_registry()
+        try:
+            regions = [registry.region(key) for key in options["region"] or [registry.default]]
+        except ValueError as e:
+            raise CommandError(str(e))
+        names = list(dict.fromkeys(district for region in regions for district in region.districts))
+
+        previous = None if options["full"] else current_snapshot()
+        version = time.strftime("%Y%m%dT%H%M%S")
+        target = root / version
+        if target.exists():
+            raise CommandError(f"Версия {version} уже существует")
+
+        started = time.monotonic()
+        inputs = map_districts(lambda district: _load_inputs(district, types), names)
+
+        districts = {}
+        for district in names:
+            slug = district_slug(district)
+            previous_info = previous.manifest["districts"].get(district) if previous else None
+            district_inputs = inputs[district]
+
+            if 'error' in district_inputs:
+                if previous_info is None:
+                    raise CommandError(f"{district}: {district_inputs['error']}")
+                # Без свежих данных район переносится из прошлого снимка как есть
+                _link_district(previous.root / previous_info["slug"], target / slug, previous_info["files"])
+                districts[district] = {**previous_info, "status": "carried over", "error": district_inputs["error"]}
+                continue
+
+            input_hash = _input_hash(district_inputs, step)
+            if (
+                previous_info is not None
+                and previous_info["input_hash"] == input_hash
+                and set(types) <= set(previous_info["types"])
+            ):
+                _link_district(previous.root / previous_info["slug"], target / slug, previous_info["files"])
+                files, status = previous_info["files"], "reused"
+            else:
+                files, status = _write_district(target / slug, district_inputs, step), "rebuilt"
+            districts[district] = {
+                "slug": slug, "input_hash": input_hash, "types": types, "files": files, "status": status,
+            }
+
+        manifest = {
+            "version": version,
+            "created_at": time.time(),
+            "source": source,
+            "step": step,
+            "radius": RADIUS_METERS,
+            "types": types,
+            "districts": districts,
+        }
+        with open(target / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # Районы других регионов переносятся из прошлого снимка без изменений
+        if previous is not None:
+            for district, previous_info in previous.manifest["districts"].items():
+                if district in districts:
+                    continue
+                _link_district(previous.root / previous_info["slug"], target / previous_info["slug"], previous_info["files"])
+                districts[district] = {**previous_info, "status": "carried over"}
+
+        # Анализ провалов зависит от нормировки населения по всему региону,
+        # поэтому пересчитывается для всех его районов — это быстро по готовым решёткам
+        snapshot = Snapshot(target)
+        incomplete = {}
+        for group, population_total in population_groups(names):
+            total_weight = sum(float(np.sum(snapshot.array(d, "buildings_weight"))) for d in group)
+            scale = population_total / total_weight if total_weight > 0 else 0.0
+            for district in group:
+                directory = target / districts[district]["slug"]
+                grid = grid_from_snapshot(snapshot, district)
+                population = PopulationPoints(
+                    np.asarray(snapshot.array(district, "buildings_x")),
+                    np.asarray(snapshot.array(district, "buildings_y")),
+                    np.asarray(snapshot.array(district, "buildings_weight")) * scale,
+                )
+                # У перенесённого без свежих данных района может не быть
+                # объектов нового типа (--types) — его провалы не считаются
+                missing = [t for t in types if f"{t}_lat" not in districts[district]["files"]]
+                if missing:
+                    incomplete[district] = missing
+                for object_type in (t for t in types if t not in missing):
+                    facilities = {
+                        "lat": np.asarray(snapshot.array(district, f"{object_type}_lat")),
+                        "lon": np.asarray(snapshot.array(district, f"{object_type}_lon")),
+                    }
+                    gaps = find_gaps(district, facilities, RADIUS_METERS, grid=grid, population=population)
+                    name = _save_json(directory, f"gaps_{object_type}", gaps)
+                    if name not in districts[district]["files"]:
+                        districts[district]["files"].append(name)
+
+        with open(target / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        publish(root, version)
+        # Кэш ответов, задачи и поля расстояний привязаны к версии данных
+        bump_data_version()
+
+        for district, info in districts.items():
+            self.stdout.write(f"{district.split(',')[0]}: {info['status']}")
+        for district, missing in incomplete.items():
+            self.stdout.write(self.style.WARNING(
+                f"{district.split(',')[0]}: нет данных по {', '.join(missing)} — они загружаются "
+                f"из OSM при запросе; пересоберите снимок, когда район станет доступен"
+            ))
+        self._prune(root, version, options["keep"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {version} готов за {time.monotonic() - started:.1f} с: {target}"
+        ))
+
+    def _prune(self, root, current, keep):
+        versions = sorted(
+            p for p in root.iterdir()
+            if p.is_dir() and (p / MANIFEST).exists() and p.name != current
+        )
+        for path in versions[:max(0, len(versions) - keep)]:
+            shutil.rmtree(path, ignore_errors=True)
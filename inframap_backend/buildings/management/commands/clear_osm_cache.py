@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from buildings.feature_store import default_store
+
+
+class Command(BaseCommand):
+    help = "Удаляет записи дискового кэша OSM (по месту и/или тегам, без аргументов — все)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--place", help='Например: "Ленинский район, город Бишкек, Киргизия"')
+        parser.add_argument("--tags", help='JSON, например: \'{"amenity": "school"}\'')
+
+    def handle(self, *args, **options):
+        tags = None
+        if options["tags"]:
+            try:
+                tags = json.loads(options["tags"])
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Некорректный JSON в --tags: {e}")
+
+        removed = default_store().invalidate(place=options["place"], tags=tags)
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей: {removed}"))
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from buildings.constants import OBJECT_TYPES
+from buildings.feature_index import district_layers, rebuild_clusters, replace_layer
+from buildings.population_service import population_groups, population_scales
+from buildings.regions import default_registry
+from buildings.response_cache import bump_data_version
+from buildings.snapshot import current_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Заносит объекты, провальные клетки и предлагаемые места из текущего снимка "
+        "(manage.py build_snapshot) в пространственный индекс для /api/v1/features/ "
+        "и пересобирает кластеры изменённых слоёв."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--region", nargs="+", help="Регионы реестра (по умолчанию — DEFAULT_REGION)")
+        parser.add_argument("--types", nargs="+", choices=OBJECT_TYPES, default=list(OBJECT_TYPES))
+
+    def handle(self, *args, **options):
+        snapshot = current_snapshot()
+        if snapshot is None:
+            raise CommandError("Снимка нет — сначала manage.py build_snapshot")
+
+        registry = default_registry()
+        try:
+            regions = [registry.region(key) for key in options["region"] or [registry.default]]
+        except ValueError as e:
+            raise CommandError(str(e))
+        names = list(dict.fromkeys(district for region in regions for district in region.districts))
+        missing = [district for district in names if not snapshot.has(district, "grid")]
+        if missing:
+            raise CommandError(f"Нет в снимке {snapshot.version}: {'; '.join(missing)}")
+
+        started = time.monotonic()
+        groups = population_groups(names)
+        scales = population_scales(groups, {
+            district: float(snapshot.array(district, "buildings_weight").sum())
+            for group, _ in groups for district in group
+        })
+
+        layers = set()
+        for district in names:
+            counts = {}
+            for layer, points in district_layers(snapshot, district, options["types"], scales[district]).items():
+                counts[layer] = replace_layer(layer, district, **points)
+                layers.add(layer)
+            self.stdout.write(f"{district.split(',')[0]}: " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+
+        # Кластеры собираются по всему слою: клетка мелкого масштаба накрывает много районов
+        for layer in sorted(layers):
+            self.stdout.write(f"{layer}: {rebuild_clusters(layer)} кластеров")
+        bump_data_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Индекс по снимку {snapshot.version} обновлён за {time.monotonic() - started:.1f} с"
+        ))
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+# R-tree по координатам MapFeature: id совпадает с id точки, триггеры
+# держат его в согласии с таблицей при любой вставке и удалении
+RTREE_SQL = [
+    "CREATE VIRTUAL TABLE buildings_mapfeature_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat)",
+    """CREATE TRIGGER buildings_mapfeature_rtree_insert AFTER INSERT ON buildings_mapfeature BEGIN
+        INSERT INTO buildings_mapfeature_rtree VALUES (new.id, new.lon, new.lon, new.lat, new.lat);
+    END""",
+    """CREATE TRIGGER buildings_mapfeature_rtree_delete AFTER DELETE ON buildings_mapfeature BEGIN
+        DELETE FROM buildings_mapfeature_rtree WHERE id = old.id;
+    END""",
+]
+DROP_RTREE_SQL = [
+    "DROP TRIGGER IF EXISTS buildings_mapfeature_rtree_insert",
+    "DROP TRIGGER IF EXISTS buildings_mapfeature_rtree_delete",
+    "DROP TABLE IF EXISTS buildings_mapfeature_rtree",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # Модуль R-tree есть только у SQLite (в сборке Python он включён)
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer', models.CharField(max_length=32)),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('cx', models.IntegerField()),
+                ('cy', models.IntegerField()),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('count', models.PositiveIntegerField()),
+                ('weight', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['layer', 'zoom', 'cx', 'cy'], name='buildings_m_layer_fa38f3_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MapFeature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer', models.CharField(max_length=32)),
+                ('district', models.CharField(max_length=255)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('weight', models.FloatField(default=0)),
+                ('name', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['layer', 'district'], name='buildings_m_layer_b26e7a_idx')],
+            },
+        ),
+        migrations.RunPython(_run(RTREE_SQL), _run(DROP_RTREE_SQL)),
+    ]
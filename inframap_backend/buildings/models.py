@@ -1,3 +1,89 @@
+import uuid
+
 from django.db import models
+from django.db.models import Q
+
+from .renderers import PayloadEncoder
+
+
+class AnalysisJob(models.Model):
+    """
+    Фоновый расчёт (buildings.job_service): параметры, прогресс по районам
+    и готовый результат — он переживает перезапуск сервера.
+
+    key — хэш вида расчёта, параметров и версии данных: одинаковые задачи
+    не запускаются дважды, пока одна из них в работе (см. ограничение ниже).
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [(PENDING, "В очереди"), (RUNNING, "Выполняется"), (DONE, "Готово"), (FAILED, "Ошибка")]
+    ACTIVE = (PENDING, RUNNING)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=32)
+    params = models.JSONField()
+    key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True, encoder=PayloadEncoder)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Отметка жизни: обновляется, пока задача считается (см. JOB_STALE_SECONDS)
+    heartbeat_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["key"],
+                condition=Q(status__in=["pending", "running"]),
+                name="analysis_job_single_active",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
+
+
+class MapFeature(models.Model):
+    """
+    Точка слоя карты (buildings.feature_index): объект, провальная клетка
+    или предлагаемое место. Координаты продублированы в R-tree
+    buildings_mapfeature_rtree (см. миграцию 0002) — по нему идут запросы окна карты.
+    """
+
+    layer = models.CharField(max_length=32)
+    district = models.CharField(max_length=255)
+    lat = models.FloatField()
+    lon = models.FloatField()
+    # Жители клетки или обслуживаемые новым объектом; у объектов — 0
+    weight = models.FloatField(default=0)
+    name = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["layer", "district"])]
+
+
+class MapCluster(models.Model):
+    """
+    Кластер слоя на мелком масштабе: точки, попавшие в одну клетку
+    Web Mercator (cx, cy) уровня zoom + CLUSTER_CELL_SHIFT.
+    """
+
+    layer = models.CharField(max_length=32)
+    zoom = models.PositiveSmallIntegerField()
+    cx = models.IntegerField()
+    cy = models.IntegerField()
+    lat = models.FloatField()
+    lon = models.FloatField()
+    count = models.PositiveIntegerField()
+    weight = models.FloatField()
 
-# Create your models here.
+    class Meta:
+        indexes = [models.Index(fields=["layer", "zoom", "cx", "cy"])]
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import osmnx as ox
+from django.conf import settings
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import KDTree
+
+from .concurrency import upstream_slot
+from .coverage_service import to_metric
+from .instrumentation import count, stage
+from .response_cache import data_version
+
+# Вес рёбер "виртуальный источник -> объект" не делаем нулевым:
+# явные нули в разреженной матрице легко теряются при преобразованиях
+MIN_EDGE_METERS = 1e-3
+
+
+class StreetNetwork:
+    """
+    Пешеходный граф района в компактном виде: координаты узлов (метры UTM)
+    и CSR-матрица смежности с длинами рёбер в метрах.
+    """
+
+    def __init__(self, x, y, adjacency):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.adjacency = adjacency.tocsr()
+        self.tree = KDTree(np.column_stack([self.x, self.y]))
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def edges(self):
+        return self.adjacency.nnz
+
+    @classmethod
+    def from_arrays(cls, x, y, u, v, length):
+        n = len(x)
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        length = np.asarray(length, dtype=float)
+        # Из параллельных рёбер (в OSM их много) оставляем кратчайшее:
+        # при построении CSR дубликаты иначе сложились бы
+        order = np.lexsort((length, v, u))
+        u, v, length = u[order], v[order], length[order]
+        first = np.ones(len(u), dtype=bool)
+        first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+        adjacency = csr_matrix((length[first], (u[first], v[first])), shape=(n, n))
+        return cls(x, y, adjacency)
+
+    @classmethod
+    def from_graph(cls, graph):
+        nodes, edges = ox.graph_to_gdfs(graph, node_geometry=False, fill_edge_geometry=False)
+        x, y = to_metric(nodes["y"].to_numpy(), nodes["x"].to_numpy())
+        position = {osmid: i for i, osmid in enumerate(nodes.index)}
+        u = np.fromiter((position[n] for n in edges.index.get_level_values(0)), dtype=np.int64)
+        v = np.fromiter((position[n] for n in edges.index.get_level_values(1)), dtype=np.int64)
+        return cls.from_arrays(x, y, u, v, edges["length"].to_numpy(dtype=float))
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez_compressed(
+            tmp, x=self.x, y=self.y,
+            indptr=self.adjacency.indptr, indices=self.adjacency.indices, data=self.adjacency.data,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            n = len(f["x"])
+            adjacency = csr_matrix((f["data"], f["indices"], f["indptr"]), shape=(n, n))
+            return cls(f["x"], f["y"], adjacency)
+
+    def snap(self, x, y):
+        """Ближайший узел графа и расстояние до него по прямой."""
+        distance, node = self.tree.query(np.column_stack([np.ravel(x), np.ravel(y)]))
+        return node, distance
+
+    def node_distances(self, facility_x, facility_y, limit=np.inf):
+        """
+        Расстояние по сети от каждого узла до ближайшего объекта — один проход Дейкстры.
+
+        Объекты подключаются к графу через виртуальный узел-источник: ребро до
+        ближайшего к объекту узла имеет длину "подхода" по прямой. Узлы дальше
+        limit получают inf, что заметно ускоряет расчёт.
+        """
+        n = len(self)
+        if not len(facility_x):
+            return np.full(n, np.inf)
+
+        nodes, approach = self.snap(facility_x, facility_y)
+        # Несколько объектов у одного узла — оставляем самый короткий подход
+        order = np.lexsort((approach, nodes))
+        nodes, approach = nodes[order], approach[order]
+        first = np.ones(len(nodes), dtype=bool)
+        first[1:] = nodes[1:] != nodes[:-1]
+        nodes, approach = nodes[first], approach[first]
+
+        source = n
+        edges = self.adjacency.tocoo()
+        graph = csr_matrix(
+            (
+                np.concatenate([edges.data, np.maximum(approach, MIN_EDGE_METERS)]),
+                (
+                    np.concatenate([edges.row, np.full(len(nodes), source)]),
+                    np.concatenate([edges.col, nodes]),
+                ),
+            ),
+            shape=(n + 1, n + 1),
+        )
+        distances = dijkstra(graph, directed=True, indices=source, limit=limit)
+        return distances[:n]
+
+    def point_distances(self, x, y, node_distances):
+        """Расстояние по сети для произвольных точек: подход к ближайшему узлу + путь от него."""
+        node, approach = self.snap(x, y)
+        return (approach + node_distances[node]).reshape(np.shape(x))
+
+
+def _network_path(place, network_type, version):
+    digest = hashlib.sha1(f"{network_type}:{place}:{version}".encode("utf-8")).hexdigest()
+    return Path(settings.NETWORK_CACHE_DIR) / f"{digest}.npz"
+
+
+def load_network(place, network_type="walk"):
+    """
+    Граф района: из CSR-кэша на диске, при первом обращении — из OSM через osmnx.
+    Версия данных входит в ключ: после новой выгрузки OSM граф загружается заново.
+    """
+    return _load_network(place, network_type, data_version())
+
+
+@lru_cache(maxsize=16)
+def _load_network(place, network_type, version):
+    path = _network_path(place, network_type, version)
+    if path.exists():
+        with stage("network_read"):
+            return StreetNetwork.load(path)
+    count("upstream.network")
+    with upstream_slot(), stage("fetch_network"):
+        network = StreetNetwork.from_graph(ox.graph_from_place(place, network_type=network_type))
+    network.save(path)
+    return network
@@ -0,0 +1,92 @@
+import heapq
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.spatial import KDTree
+
+# Прирост меньше этого значения считается нулевым (погрешность float-вычитаний)
+EPSILON = 1e-9
+
+
+def greedy_placement(candidate_xy, demand_xy, radius, max_new=None, weights=None):
+    """
+    Жадное решение задачи максимального покрытия (max-coverage).
+
+    На каждом шаге выбирается кандидат, покрывающий больше всего ещё не
+    покрытого спроса. Прирост пересчитывается лениво: из кучи достаётся
+    лучший по старой оценке кандидат, и только его прирост уточняется.
+    Так как прирост со временем только убывает, уточнённое значение,
+    оставшееся наверху кучи, и есть максимум.
+
+    candidate_xy, demand_xy — массивы (n, 2) в метрах;
+    weights — вес каждой точки спроса (по умолчанию 1);
+    max_new — ограничение на число новых объектов (None — до полного покрытия).
+    """
+    candidate_xy = np.asarray(candidate_xy, dtype=float).reshape(-1, 2)
+    demand_xy = np.asarray(demand_xy, dtype=float).reshape(-1, 2)
+    if weights is None:
+        weights = np.ones(len(demand_xy))
+    else:
+        weights = np.asarray(weights, dtype=float)
+
+    total = float(weights.sum())
+    result = {
+        "placements": [],
+        "gains": [],
+        "covered": 0.0,
+        "total": total,
+        "uncovered": total,
+    }
+    if len(candidate_xy) == 0 or len(demand_xy) == 0 or max_new == 0:
+        return result
+
+    # Матрица инцидентности "кандидат -> точки спроса в радиусе охвата"
+    # и транспонированная к ней, обе в CSR
+    pairs = KDTree(candidate_xy).sparse_distance_matrix(
+        KDTree(demand_xy), radius, output_type="coo_matrix"
+    )
+    reach = csr_matrix(
+        (np.ones(pairs.nnz, dtype=bool), (pairs.row, pairs.col)),
+        shape=(len(candidate_xy), len(demand_xy)),
+    )
+    reached_by = reach.T.tocsr()
+    reached_by_counts = np.diff(reached_by.indptr)
+
+    covered = np.zeros(len(demand_xy), dtype=bool)
+    gain = np.asarray(reach @ weights, dtype=float).ravel()
+
+    # В куче (-прирост, индекс): при равном приросте побеждает меньший индекс.
+    # Текущий прирост хранится в gain, запись в куче может быть устаревшей.
+    heap = [(-g, i) for i, g in enumerate(gain) if g > EPSILON]
+    heapq.heapify(heap)
+
+    placements = []
+    gains = []
+    while heap and (max_new is None or len(placements) < max_new):
+        neg_gain, i = heapq.heappop(heap)
+        if -neg_gain != gain[i]:
+            if gain[i] > EPSILON:
+                heapq.heappush(heap, (-gain[i], i))
+            continue
+
+        row = reach.indices[reach.indptr[i]:reach.indptr[i + 1]]
+        newly = row[~covered[row]]
+        covered[newly] = True
+        placements.append(i)
+        gains.append(float(gain[i]))
+
+        # Уменьшаем прирост всех кандидатов, которые покрывали эти точки
+        counts = reached_by_counts[newly]
+        affected = np.concatenate(
+            [reached_by.indices[reached_by.indptr[j]:reached_by.indptr[j + 1]] for j in newly]
+        ) if len(newly) else np.empty(0, dtype=np.intp)
+        np.subtract.at(gain, affected, np.repeat(weights[newly], counts))
+
+    covered_total = float(weights[covered].sum())
+    result.update({
+        "placements": placements,
+        "gains": gains,
+        "covered": covered_total,
+        "uncovered": total - covered_total,
+    })
+    return result
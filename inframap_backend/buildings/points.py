@@ -0,0 +1,62 @@
+import hashlib
+
+import numpy as np
+
+
+class PointSet:
+    """
+    Точки в ответе API столбцами: lat/lon (float64) и дополнительные поля
+    (name, residents_served...) вместо списка словарей.
+
+    Словари собираются только при отдаче в JSON (records), двоичный формат
+    и NDJSON читают столбцы напрямую (см. buildings.renderers).
+    """
+
+    __slots__ = ("lat", "lon", "fields")
+
+    def __init__(self, lat, lon, **fields):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.fields = {name: np.asarray(values) for name, values in fields.items()}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __eq__(self, other):
+        return isinstance(other, PointSet) and self.to_list() == other.to_list()
+
+    def records(self, start=0, stop=None):
+        # tolist() отдаёт нативные float/str, без поштучной распаковки numpy-скаляров
+        columns = {"lat": self.lat[start:stop].tolist(), "lon": self.lon[start:stop].tolist()}
+        columns.update({name: values[start:stop].tolist() for name, values in self.fields.items()})
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+    def to_list(self):
+        return self.records()
+
+    def digest(self):
+        """Хэш содержимого — для ETag без сборки словарей."""
+        digest = hashlib.sha1(self.lat.tobytes())
+        digest.update(self.lon.tobytes())
+        for name, values in self.fields.items():
+            digest.update(name.encode("utf-8"))
+            digest.update(repr(values.tolist()).encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def from_records(cls, records):
+        """Обратно из списка словарей (например, из JSON снимка)."""
+        names = [name for name in (records[0] if records else {}) if name not in ("lat", "lon")]
+        return cls(
+            [r["lat"] for r in records],
+            [r["lon"] for r in records],
+            **{name: np.array([r[name] for r in records]) for name in names},
+        )
+
+
+def json_default(value):
+    """default= для json.dump: PointSet пишется списком словарей, как раньше."""
+    if isinstance(value, PointSet):
+        return value.to_list()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,32 +1,252 @@
-import osmnx as ox
-import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import KDTree
 
-def estimate_population(districts, total_population=1_300_000):
-    results = []
+from .city_service import city_features_by_district
+from .concurrency import map_districts
+from .coverage_service import METRIC_CRS
+from .feature_store import features_from_place
+from .instrumentation import stage, timed
+from .points import PointSet
+from .regions import default_registry, per_city
+from .snapshot import current_snapshot
+
+RESIDENTIAL_TAGS = {'building': 'residential'}
+TOTAL_POPULATION = 1_300_000
+
+
+def shares_within(buildings, boundary):
+    """
+    Здания, пересекающие boundary, и доля площади каждого внутри границы:
+    PointSet(точка на здании, share). Кандидаты — один предикатный запрос
+    к STRtree; целиком внутренние получают share 1 без геометрических
+    операций, пересечение строится только для пограничных.
+
+    Всё в EPSG:4326: на масштабе здания проекция почти линейна, и
+    отношение площадей от неё не зависит — перепроецировать не нужно.
+    """
+    geoms = np.asarray(buildings.geometry.values, dtype=object)
+    with stage("building_shares"):
+        hits = np.sort(shapely.STRtree(geoms).query(boundary, predicate="intersects"))
+        candidates = geoms[hits]
+        share = np.ones(len(candidates))
+        border = ~shapely.contains(boundary, candidates)
+        if border.any():
+            area = shapely.area(candidates[border])
+            inside = shapely.area(shapely.intersection(candidates[border], boundary))
+            # Точки и линии на границе площади не имеют — считаются целиком
+            share[border] = np.where(area > 0, inside / np.where(area > 0, area, 1.0), 1.0)
+        points = shapely.point_on_surface(candidates)
+    return PointSet(shapely.get_y(points), shapely.get_x(points), share=share)
+
+
+def _building_counts(buildings):
+    return {
+        "num_buildings": len(buildings),
+        "effective_buildings": round(float(buildings.fields["share"].sum()), 2),
+        "buildings": buildings,
+    }
+
+
+def _count_buildings(district):
+    # Граница — из реестра регионов: геокодируется один раз на процесс
+    boundary = default_registry().boundary(district)
+    buildings = features_from_place(district, RESIDENTIAL_TAGS)
+    return _building_counts(shares_within(buildings, boundary))
+
+
+def _count_buildings_city(districts, city):
+    # Здание уже отнесено к одному району по точке на нём — доля всегда 1
+    by_district = city_features_by_district(RESIDENTIAL_TAGS, districts, city=city)
+    result = {}
+    for district, gdf in by_district.items():
+        points = shapely.point_on_surface(np.asarray(gdf.to_crs("EPSG:4326").geometry.values, dtype=object))
+        result[district] = _building_counts(
+            PointSet(shapely.get_y(points), shapely.get_x(points), share=np.ones(len(points)))
+        )
+    return result
 
-    for district in districts:
-        try:
-            boundary = ox.geocode_to_gdf(district)
-            tags = {'building': 'residential'}
-            buildings = ox.features_from_place(district, tags)
-            buildings = gpd.clip(buildings, boundary)
-
-            results.append({
-                "district": district.split(",")[0],
-                "num_buildings": len(buildings)
-            })
-        except Exception as e:
-            results.append({
-                "district": district.split(",")[0],
-                "error": str(e)
-            })
-
-    total_buildings = sum(d['num_buildings'] for d in results if 'num_buildings' in d and d['num_buildings'] > 0)
-
-    for d in results:
-        if 'num_buildings' in d and total_buildings > 0:
-            d['estimated_population'] = int((d['num_buildings'] / total_buildings) * total_population)
-        else:
-            d['estimated_population'] = 0
 
+def population_groups(districts, total_population=None):
+    """
+    [(районы, население)]: total_population на все districts сразу или,
+    если не задано, население каждого региона реестра на все его районы —
+    даже если запрошена только часть (?bbox=), иначе доли районов раздуваются.
+    """
+    if total_population is not None:
+        return [(districts, total_population)]
+    return [
+        (region.districts, region.population or TOTAL_POPULATION)
+        for region in default_registry().group(districts)
+    ]
+
+
+def _group_districts(groups):
+    return list(dict.fromkeys(district for names, _ in groups for district in names))
+
+
+@timed("estimate_population")
+def estimate_population(districts, total_population=None, mode="district", with_buildings=False):
+    """
+    Население по числу жилых зданий: у каждого региона (см. population_groups)
+    своё. Здания всех районов считаются одним параллельным проходом.
+    with_buildings — добавить жителей каждого здания ("buildings": PointSet).
+    """
+    groups = population_groups(districts, total_population)
+    needed = _group_districts(groups)
+    if mode == "city":
+        counts = per_city(needed, _count_buildings_city)
+    else:
+        counts = map_districts(_count_buildings, needed)
+    results = distribute_population(groups, counts, with_buildings)
+    return [results[district] for district in districts]
+
+
+def distribute_population(groups, counts, with_buildings=False):
+    """
+    {район: {"district", "num_buildings", "effective_buildings", "estimated_population"}}:
+    население каждой группы делится пропорционально зданиям, пограничное
+    здание — по доле площади внутри района. counts — результаты
+    _count_buildings ({'error': ...} для неудачных районов) по всем районам групп.
+    """
+    results = {}
+    for district in _group_districts(groups):
+        results[district] = {"district": district.split(",")[0]}
+        results[district].update({k: v for k, v in counts[district].items() if k != "buildings"})
+
+    for names, population in groups:
+        group = [results[district] for district in names]
+        total_buildings = sum(d['effective_buildings'] for d in group if d.get('effective_buildings', 0) > 0)
+        per_building = population / total_buildings if total_buildings > 0 else 0.0
+
+        for district, d in zip(names, group):
+            if 'effective_buildings' in d and total_buildings > 0:
+                d['estimated_population'] = int(d['effective_buildings'] * per_building)
+            else:
+                d['estimated_population'] = 0
+            if with_buildings and 'buildings' in counts[district]:
+                buildings = counts[district]['buildings']
+                d['buildings'] = PointSet(
+                    buildings.lat, buildings.lon,
+                    population=np.round(buildings.fields["share"] * per_building, 2),
+                )
     return results
+
+
+class PopulationPoints:
+    """Жилые здания района: координаты (метры UTM) и оценка числа жителей каждого."""
+
+    def __init__(self, x, y, people):
+        self.x = x
+        self.y = y
+        self.people = people
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def total(self):
+        return float(self.people.sum())
+
+
+def building_weights(buildings, use_levels=True):
+    """
+    Относительный вес здания: площадь застройки (м²), при use_levels —
+    умноженная на этажность из building:levels (нет данных — 1 этаж).
+    """
+    area = shapely.area(np.asarray(buildings.geometry.values, dtype=object))
+    if use_levels and 'building:levels' in buildings.columns:
+        levels = pd.to_numeric(buildings['building:levels'], errors='coerce').to_numpy(dtype=float)
+        levels = np.where(np.isnan(levels) | (levels < 1), 1.0, levels)
+        area = area * levels
+    return area
+
+
+def building_points(district, use_levels=True):
+    """Внутренние точки жилых зданий района (метры UTM) и их относительные веса."""
+    buildings = features_from_place(district, RESIDENTIAL_TAGS)
+    with stage("building_points"):
+        buildings = buildings.to_crs(METRIC_CRS)
+        buildings = buildings[buildings.geometry.geom_type.isin(['Polygon', 'MultiPolygon'])]
+        points = shapely.point_on_surface(np.asarray(buildings.geometry.values, dtype=object))
+        return {
+            "x": shapely.get_x(points),
+            "y": shapely.get_y(points),
+            "weight": building_weights(buildings, use_levels),
+        }
+
+
+@timed("population_surface")
+def population_surface(districts, total_population=None, use_levels=True):
+    """
+    {район: PopulationPoints или {'error': ...}}.
+
+    Население каждой группы (см. population_groups) распределяется по всем
+    жилым зданиям её районов пропорционально площади (и этажности).
+    """
+    groups = population_groups(districts, total_population)
+    raw = raw_building_points(_group_districts(groups), use_levels)
+    scales = population_scales(groups, {
+        district: r if 'error' in r else float(r["weight"].sum())
+        for district, r in raw.items()
+    })
+
+    result = {}
+    for district in districts:
+        r = raw[district]
+        result[district] = r if 'error' in r else PopulationPoints(r["x"], r["y"], r["weight"] * scales[district])
+    return result
+
+
+def raw_building_points(districts, use_levels=True):
+    """{район: building_points или {'error': ...}} — из снимка, если он есть."""
+    snapshot = current_snapshot()
+    if use_levels and snapshot is not None and snapshot.has_all(districts, "buildings_weight"):
+        return {
+            district: {
+                name: np.asarray(snapshot.array(district, f"buildings_{name}"))
+                for name in ("x", "y", "weight")
+            }
+            for district in districts
+        }
+    return map_districts(lambda district: building_points(district, use_levels), districts)
+
+
+def population_scales(groups, weights):
+    """
+    {район: жителей на единицу веса здания}. weights — {район: суммарный вес
+    его зданий или {'error': ...}}; районы с ошибкой в сумму группы не входят.
+    """
+    scales = {}
+    for names, population in groups:
+        total_weight = sum(weights[d] for d in names if not isinstance(weights[d], dict))
+        scale = population / total_weight if total_weight > 0 else 0.0
+        scales.update({district: scale for district in names})
+    return scales
+
+
+def bin_to_grid(grid, population):
+    """
+    Число жителей в каждой клетке решётки (массив длины len(grid)).
+
+    Здание попадает в ближайший узел решётки — это одна векторная
+    арифметика и bincount. Если этот узел отсечён границей района,
+    здание относится к ближайшей клетке района по KD-дереву.
+    """
+    if not len(grid) or not len(population):
+        return np.zeros(len(grid))
+
+    rows, cols = grid.shape
+    position = np.full(rows * cols, -1, dtype=np.int64)
+    position[grid.row * cols + grid.col] = np.arange(len(grid))
+
+    cell = grid.cell_index(population.x, population.y)
+    target = np.where(cell >= 0, position[np.maximum(cell, 0)], -1)
+
+    missing = target < 0
+    if missing.any():
+        _, nearest = KDTree(grid.xy).query(np.column_stack([population.x[missing], population.y[missing]]))
+        target[missing] = nearest
+
+    return np.bincount(target, weights=population.people, minlength=len(grid))
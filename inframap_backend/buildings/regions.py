@@ -0,0 +1,277 @@
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from django.conf import settings
+
+from .concurrency import map_districts
+from .constants import REGIONS
+from .feature_store import geocode_to_gdf
+
+_override = None
+
+
+class Region:
+    """
+    Регион (город, область): его районы, место для выгрузки целиком
+    (city, для ?fetch=city) и население, которое распределяется по районам.
+    """
+
+    def __init__(self, key, districts, name=None, city=None, population=None):
+        self.key = key
+        self.districts = list(districts)
+        self.name = name or key
+        self.city = city
+        self.population = population
+
+
+def _boundary(district):
+    return shapely.union_all(geocode_to_gdf(district).to_crs("EPSG:4326").geometry.values)
+
+
+class RegionRegistry:
+    """
+    Реестр регионов и индекс STRtree по границам всех их районов.
+
+    Границы берутся из boundaries ({район: полигон в EPSG:4326}), остальные —
+    геокодером FeatureStore, параллельно и один раз: при первом запросе по
+    рамке или точкам. Поиск районов по bbox и точек по районам — запросы к
+    STRtree, без перебора полигонов, так что реестр может быть размером со страну.
+    """
+
+    def __init__(self, regions, default=None, boundaries=None):
+        self.regions = {region.key: region for region in regions}
+        self.default = default if default in self.regions else next(iter(self.regions))
+        self._region_of = {}
+        for region in regions:
+            for district in region.districts:
+                self._region_of.setdefault(district, region.key)
+        self._boundaries = dict(boundaries or {})
+        # {район: Future} — границы, которые сейчас геокодирует какой-то поток
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._tree = None
+
+    def region(self, key):
+        if key not in self.regions:
+            raise ValueError(f"Неизвестный регион '{key}'. Доступны: {', '.join(self.regions)}.")
+        return self.regions[key]
+
+    def region_of(self, district):
+        return self.regions[self._region_of[district]]
+
+    def group(self, districts):
+        """{регион: его районы из districts} в исходном порядке."""
+        groups = {}
+        for district in districts:
+            if district not in self._region_of:
+                raise ValueError(f"Район '{district}' не входит в реестр регионов.")
+            groups.setdefault(self._region_of[district], []).append(district)
+        return {self.regions[key]: names for key, names in groups.items()}
+
+    def boundary(self, district):
+        """
+        Граница района (EPSG:4326), подготовленная для предикатов shapely:
+        из boundaries или геокодером — один раз на процесс. Геокодирует
+        первый запросивший поток, остальные ждут его результат; блокировка
+        реестра на время обращения к геокодеру не держится.
+        """
+        with self._lock:
+            polygon = self._boundaries.get(district)
+            if polygon is not None:
+                shapely.prepare(polygon)
+                return polygon
+            future = self._pending.get(district)
+            owner = future is None
+            if owner:
+                future = self._pending[district] = Future()
+
+        if not owner:
+            return future.result()
+        try:
+            polygon = _boundary(district)
+            shapely.prepare(polygon)
+        except BaseException as e:
+            # Ошибка не запоминается: следующий запрос попробует снова
+            with self._lock:
+                del self._pending[district]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._boundaries[district] = polygon
+            del self._pending[district]
+        future.set_result(polygon)
+        return polygon
+
+    def _index(self):
+        if self._tree is not None:
+            return self._tree
+        names = list(self._region_of)
+        # Недостающие границы — параллельно и без блокировки (см. boundary)
+        fetched = map_districts(self.boundary, [name for name in names if name not in self._boundaries])
+        failed = [name for name, polygon in fetched.items() if isinstance(polygon, dict)]
+        if failed:
+            raise ValueError(f"Не удалось получить границы районов: {'; '.join(failed)}")
+
+        with self._lock:
+            if self._tree is None:
+                self._names = np.array(names, dtype=object)
+                self._polygons = np.array([self._boundaries[name] for name in names], dtype=object)
+                self._tree = shapely.STRtree(self._polygons)
+            return self._tree
+
+    def in_bbox(self, bbox):
+        """Районы, пересекающие рамку (min_lon, min_lat, max_lon, max_lat), в порядке реестра."""
+        tree = self._index()
+        hits = np.sort(tree.query(shapely.box(*bbox), predicate="intersects"))
+        return self._names[hits].tolist()
+
+    def locate(self, lon, lat):
+        """
+        Район каждой точки (None — вне реестра) одним запросом к STRtree.
+        Точка на границе районов достаётся первому из них по реестру.
+        """
+        tree = self._index()
+        points = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        point_index, district_index = tree.query(points, predicate="intersects")
+        order = np.lexsort((district_index, point_index))
+        point_index, district_index = point_index[order], district_index[order]
+        first = np.unique(point_index, return_index=True)[1]
+
+        result = np.full(len(points), None, dtype=object)
+        result[point_index[first]] = self._names[district_index[first]]
+        return result
+
+
+def parse_bbox(value):
+    try:
+        bbox = [float(part) for part in value.split(",")]
+    except ValueError:
+        bbox = []
+    if (len(bbox) != 4 or not (-180 <= bbox[0] < bbox[2] <= 180)
+            or not (-90 <= bbox[1] < bbox[3] <= 90)):
+        raise ValueError("bbox должен быть в виде min_lon,min_lat,max_lon,max_lat.")
+    return bbox
+
+
+def requested_districts(request, registry=None):
+    """
+    Районы запроса: ?region=ключ[,ключ...] и/или ?bbox=min_lon,min_lat,max_lon,max_lat
+    (районы, пересекающие рамку). Без параметров — регион по умолчанию.
+    """
+    return districts_from_params(request.query_params, registry)
+
+
+def districts_from_params(params, registry=None):
+    """Как requested_districts, но по словарю параметров (тело задачи и т. п.)."""
+    registry = registry or default_registry()
+    regions = params.get("region")
+    bbox = params.get("bbox")
+
+    if regions:
+        keys = [key.strip() for key in regions.split(",") if key.strip()]
+        districts = [district for key in keys for district in registry.region(key).districts]
+    elif not bbox:
+        return registry.regions[registry.default].districts
+    else:
+        districts = None
+
+    if bbox:
+        inside = registry.in_bbox(parse_bbox(bbox))
+        if districts is None:
+            return inside
+        inside = set(inside)
+        districts = [district for district in districts if district in inside]
+    return list(dict.fromkeys(districts))
+
+
+def per_city(districts, func, registry=None):
+    """
+    {район: результат} для режима fetch=city: func(районы, город) вызывается
+    по разу на регион; ошибка региона записывается всем его районам.
+    """
+    registry = registry or default_registry()
+    result = {}
+    for region, names in registry.group(districts).items():
+        try:
+            if region.city is None:
+                raise ValueError(f"Для региона '{region.key}' не задан город, используйте fetch=district.")
+            result.update(func(names, region.city))
+        except Exception as e:
+            result.update({district: {'error': str(e)} for district in names})
+    return {district: result[district] for district in districts}
+
+
+def summarize(registry, values):
+    """
+    Итоги по регионам: {регион: {"name", "districts", "errors", поле: сумма}}.
+
+    values — {район: словарь результата}; суммируются целые поля,
+    районы с 'error' только подсчитываются.
+    """
+    summary = {}
+    for region, districts in registry.group(values).items():
+        totals = {"name": region.name, "districts": len(districts), "errors": 0}
+        for district in districts:
+            value = values[district]
+            if 'error' in value:
+                totals["errors"] += 1
+                continue
+            for field, number in value.items():
+                if isinstance(number, (int, np.integer)) and not isinstance(number, bool):
+                    totals[field] = totals.get(field, 0) + int(number)
+        summary[region.key] = totals
+    return summary
+
+
+def _optional(row, column):
+    value = row.get(column)
+    # Пустые ячейки приходят как NaN
+    return None if value is None or value != value else value
+
+
+def read_regions_file(path):
+    """Регионы и границы районов из файла (см. REGIONS_FILE в settings)."""
+    gdf = gpd.read_file(path).to_crs("EPSG:4326")
+    regions = []
+    for key, rows in gdf.groupby("region", sort=False):
+        first = rows.iloc[0]
+        population = _optional(first, "population")
+        regions.append(Region(
+            str(key),
+            rows["district"].tolist(),
+            name=_optional(first, "region_name"),
+            city=_optional(first, "city"),
+            population=int(population) if population is not None else None,
+        ))
+    return regions, dict(zip(gdf["district"], gdf.geometry))
+
+
+@lru_cache(maxsize=1)
+def _settings_registry():
+    regions = {key: Region(key, **spec) for key, spec in REGIONS.items()}
+    boundaries = None
+    if settings.REGIONS_FILE:
+        file_regions, boundaries = read_regions_file(settings.REGIONS_FILE)
+        for region in file_regions:
+            # Незаполненные в файле поля встроенного региона сохраняются
+            builtin = regions.get(region.key)
+            if builtin is not None:
+                region.name = region.name if region.name != region.key else builtin.name
+                region.city = region.city or builtin.city
+                region.population = region.population or builtin.population
+            regions[region.key] = region
+    return RegionRegistry(list(regions.values()), default=settings.DEFAULT_REGION, boundaries=boundaries)
+
+
+def default_registry():
+    return _override if _override is not None else _settings_registry()
+
+
+def set_default_registry(registry):
+    """Подменяет реестр для всего процесса (None — вернуть настройки по умолчанию)."""
+    global _override
+    _override = registry
@@ -0,0 +1,175 @@
+import json
+import struct
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .instrumentation import timed
+
+# numpy и PointSet импортируются при рендеринге: модуль подключается из views,
+# а их импорт не должен тянуть геостек (см. buildings.warmup)
+POINTS_MAGIC = b"IMP1"
+# Координаты в двоичном формате — целые микроградусы (~0.1 м)
+COORDINATE_SCALE = 1_000_000
+# Сколько точек NDJSON собирается в один кусок потока
+NDJSON_CHUNK = 2000
+
+
+class PayloadEncoder(JSONEncoder):
+    """JSON-энкодер DRF, который разворачивает PointSet в привычный список {lat, lon, ...}."""
+
+    def default(self, obj):
+        from .points import PointSet
+
+        if isinstance(obj, PointSet):
+            return obj.to_list()
+        return super().default(obj)
+
+
+class PayloadJSONRenderer(JSONRenderer):
+    encoder_class = PayloadEncoder
+
+    @timed("serialize")
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+def split_points(data, on_points):
+    """
+    Копия data, в которой каждый PointSet заменён на on_points(index, points).
+    Возвращает копию и список PointSet в порядке обхода.
+    """
+    from .points import PointSet
+
+    found = []
+
+    def walk(value):
+        if isinstance(value, PointSet):
+            found.append(value)
+            return on_points(len(found) - 1, value)
+        if isinstance(value, dict):
+            return {key: walk(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [walk(item) for item in value]
+        return value
+
+    return walk(data), found
+
+
+def _delta_encode(degrees):
+    import numpy as np
+
+    scaled = np.rint(degrees * COORDINATE_SCALE).astype(np.int64)
+    return np.diff(scaled, prepend=0).astype("<i4")
+
+
+class PackedPointsRenderer(BaseRenderer):
+    """
+    Компактный двоичный формат (?format=points или Accept: application/x-inframap-points).
+
+        b"IMP1"            сигнатура и версия
+        uint32 LE          длина заголовка в байтах
+        заголовок          JSON (UTF-8): исходный ответ, где каждый набор точек заменён на
+                           {"$points": i, "count": n, "offset": o, "fields": {имя: [значения]}}
+        выравнивание       нулями до границы 4 байт
+        тело               для каждого набора: int32 LE lat[n], затем int32 LE lon[n] —
+                           микроградусы, дельта-кодирование (первое значение абсолютное);
+                           offset — смещение набора от начала тела в байтах
+
+    Дельты соседних точек малы, поэтому формат хорошо сжимается gzip.
+    Декодер — decodePackedPoints в infamap_frontend/src/services/pointsDecoder.js.
+    """
+
+    media_type = "application/x-inframap-points"
+    format = "points"
+    charset = None
+    render_style = "binary"
+
+    @timed("serialize")
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        offset = 0
+
+        def describe(index, points):
+            nonlocal offset
+            header = {
+                "$points": index,
+                "count": len(points),
+                "offset": offset,
+                "fields": {name: values.tolist() for name, values in points.fields.items()},
+            }
+            offset += 8 * len(points)
+            return header
+
+        header, found = split_points(data, describe)
+        raw = json.dumps(header, cls=PayloadEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        padding = b"\0" * (-(len(POINTS_MAGIC) + 4 + len(raw)) % 4)
+        chunks = [POINTS_MAGIC, struct.pack("<I", len(raw)), raw, padding]
+        for points in found:
+            chunks.append(_delta_encode(points.lat).tobytes())
+            chunks.append(_delta_encode(points.lon).tobytes())
+        return b"".join(chunks)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    NDJSON (?format=ndjson): первая строка — ответ, где наборы точек заменены на
+    {"$points": i, "count": n}, дальше по строке на точку: {"$points": i, "lat": ..., "lon": ..., ...}.
+
+    Отдаётся потоком (см. PointPayloadMixin): строки собираются кусками по
+    NDJSON_CHUNK точек, весь ответ целиком в памяти не строится.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def stream(self, data):
+        header, found = split_points(data, lambda index, points: {"$points": index, "count": len(points)})
+        yield self._line(header)
+        for index, points in enumerate(found):
+            for start in range(0, len(points), NDJSON_CHUNK):
+                records = points.records(start, start + NDJSON_CHUNK)
+                yield b"".join(self._line({"$points": index, **record}) for record in records)
+
+    @staticmethod
+    def _line(value):
+        return json.dumps(value, cls=PayloadEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(self.stream(data))
+
+
+class PointPayloadMixin:
+    """
+    Для APIView с наборами точек в ответе: JSON (по умолчанию), двоичный
+    формат и NDJSON по Accept или ?format=. NDJSON отдаётся StreamingHttpResponse.
+    """
+
+    renderer_classes = [PayloadJSONRenderer, BrowsableAPIRenderer, PackedPointsRenderer, NDJSONRenderer]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Формат выбирается по Accept: кэши браузера и прокси должны различать ответы
+        patch_vary_headers(response, ["Accept"])
+        renderer = getattr(response, "accepted_renderer", None)
+        if not (isinstance(response, Response) and isinstance(renderer, NDJSONRenderer)):
+            return response
+        if response.status_code != 200 or response.data is None:
+            return response
+
+        streaming = StreamingHttpResponse(
+            renderer.stream(response.data),
+            status=response.status_code,
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        for header, value in response.items():
+            if header.lower() != "content-type":
+                streaming[header] = value
+        return streaming
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .instrumentation import count, profiling_requested
+
+DATA_VERSION_KEY = "inframap:data-version"
+# Как часто ждущий запрос проверяет, не досчитал ли ответ другой воркер
+LOCK_POLL_SECONDS = 0.05
+
+# cache.add у FileBasedCache не атомарен (has_key + set), поэтому внутри
+# процесса захват блокировки дополнительно сериализуем
+_add_lock = threading.Lock()
+
+
+def data_version():
+    """Версия исходных данных: меняется при каждой новой выгрузке из OSM."""
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        version = settings.RESPONSE_CACHE_DATA_VERSION
+        cache.add(DATA_VERSION_KEY, version, None)
+    return version
+
+
+def bump_data_version():
+    cache.set(DATA_VERSION_KEY, uuid.uuid4().hex[:12], None)
+
+
+def request_fingerprint(request, kwargs):
+    """Хэш пути и нормализованных query-параметров (запрос DRF или обычный Django)."""
+    # Формат ответа (?format=) и ?profile= на данные не влияют
+    ignored = (api_settings.URL_FORMAT_OVERRIDE, "profile")
+    query = getattr(request, "query_params", request.GET)
+    params = sorted(
+        (key, sorted(values)) for key, values in query.lists()
+        if key not in ignored
+    )
+    raw = json.dumps([request.path, kwargs, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def cache_key(request, kwargs):
+    return f"inframap:response:{data_version()}:{request_fingerprint(request, kwargs)}"
+
+
+def _digest_default(value):
+    # PointSet и подобные хэшируются по массивам, без сборки словарей
+    digest = getattr(value, "digest", None)
+    return digest() if digest is not None else str(value)
+
+
+def _etag(data):
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=_digest_default)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(request, etag):
+    """
+    Совпадает ли If-None-Match с etag: список через запятую, '*' и слабое
+    сравнение — GZipMiddleware отдаёт ETag как W/"...", и браузер
+    присылает обратно именно его.
+    """
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = parse_etags(header)
+    if tags == ["*"]:
+        return True
+    return etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in tags}
+
+
+def _acquire(lock_key, timeout):
+    with _add_lock:
+        return cache.add(lock_key, 1, timeout)
+
+
+def _has_errors(data):
+    # Ошибка района ({'error': ...}) где-то внутри ответа: Overpass не ответил,
+    # геокодер упал. PointSet и прочие массивы не обходятся
+    if isinstance(data, dict):
+        return "error" in data or any(_has_errors(value) for value in data.values())
+    if isinstance(data, list):
+        return any(_has_errors(value) for value in data)
+    return False
+
+
+def _store(key, response, timeout, stale):
+    if _has_errors(response.data):
+        # Временный сбой источника не закрепляется на RESPONSE_CACHE_TIMEOUT:
+        # ответ живёт недолго и без stale, чтобы сбойный район скоро пересчитался
+        timeout, stale = min(timeout, settings.RESPONSE_CACHE_ERROR_TIMEOUT), 0
+    entry = {
+        "data": response.data,
+        "status": response.status_code,
+        "etag": _etag(response.data),
+        "fresh_until": time.time() + timeout,
+    }
+    cache.set(key, entry, timeout + stale)
+    return entry
+
+
+def _respond(request, entry, state):
+    # У каждого представления (json, points, ndjson) свой ETag
+    etag = entry["etag"]
+    renderer = getattr(request, "accepted_renderer", None)
+    if renderer is not None and renderer.format != "json":
+        etag = f'{etag[:-1]}-{renderer.format}"'
+
+    if etag_matches(request, etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry["data"], status=entry["status"])
+    response["ETag"] = etag
+    response["X-Cache"] = state
+    count(f"response_cache.{state.lower()}")
+    return response
+
+
+def cached_response(timeout=None, stale=None):
+    """
+    Кэш ответов для метода get() у APIView.
+
+    Ключ — путь, нормализованные query-параметры и версия данных.
+    - свежая запись отдаётся сразу;
+    - устаревшая (не старше stale секунд) отдаётся сразу, а пересчёт
+      запускается в фоне одним воркером (stale-while-revalidate);
+    - при промахе считает только один запрос, остальные ждут его результат
+      (single-flight через cache.add);
+    - ETag + If-None-Match -> 304 без тела.
+    Кэшируются только ответы 200; если у части районов {'error': ...} —
+    лишь на RESPONSE_CACHE_ERROR_TIMEOUT секунд.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            # Профилируется сам расчёт, а не чтение из кэша
+            if profiling_requested(request):
+                return method(self, request, *args, **kwargs)
+
+            fresh_for = settings.RESPONSE_CACHE_TIMEOUT if timeout is None else timeout
+            stale_for = settings.RESPONSE_CACHE_STALE if stale is None else stale
+            lock_for = settings.RESPONSE_CACHE_LOCK_TIMEOUT
+
+            key = cache_key(request, kwargs)
+            lock_key = f"{key}:lock"
+
+            def compute():
+                response = method(self, request, *args, **kwargs)
+                if response.status_code == 200:
+                    # Расчёт мог сам сменить версию данных (свежая выгрузка OSM
+                    # вызывает bump_data_version) — ключ берётся уже после него
+                    return _store(cache_key(request, kwargs), response, fresh_for, stale_for), response
+                return None, response
+
+            entry = cache.get(key)
+            if entry is not None:
+                if time.time() < entry["fresh_until"]:
+                    return _respond(request, entry, "HIT")
+                if _acquire(lock_key, lock_for):
+                    def refresh():
+                        try:
+                            compute()
+                        finally:
+                            cache.delete(lock_key)
+
+                    threading.Thread(target=refresh, daemon=True).start()
+                return _respond(request, entry, "STALE")
+
+            deadline = time.monotonic() + lock_for
+            locked = _acquire(lock_key, lock_for)
+            while not locked and time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_SECONDS)
+                entry = cache.get(key)
+                if entry is not None:
+                    return _respond(request, entry, "HIT")
+                locked = _acquire(lock_key, lock_for)
+
+            try:
+                # Пока ждали блокировку, ответ мог досчитать другой воркер
+                entry = cache.get(key) if locked else None
+                if entry is not None:
+                    return _respond(request, entry, "HIT")
+                entry, response = compute()
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            if entry is None:
+                return response
+            return _respond(request, entry, "MISS")
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,286 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial import KDTree
+
+from .constants import OBJECT_TYPES, RADIUS_METERS
+from .coverage_service import CoverageEngine, to_metric
+from .facility_service import facilities_by_district
+from .grid_service import district_grid
+from .instrumentation import stage
+from .population_service import bin_to_grid, population_surface
+from .regions import default_registry
+from .response_cache import data_version
+
+# Удаляемый объект ищется среди существующих в пределах стольких метров
+MATCH_METERS = 50
+MAX_SCENARIOS = 50
+MAX_CHANGES = 1000
+MAX_RADII = 10
+MAX_RADIUS_METERS = 20_000
+# Сколько исходных состояний (тип объектов × набор районов) держать в памяти
+BASE_CACHE_SIZE = 8
+
+# {(версия данных, тип, режим загрузки, районы): {район: BaseCoverage или {'error': ...}}}
+_bases = OrderedDict()
+_bases_lock = threading.Lock()
+
+
+class BaseCoverage:
+    """
+    Исходное покрытие района: решётка, жители по клеткам и поле расстояний
+    от каждой клетки до ближайшего существующего объекта (как в find_gaps).
+
+    Сценарий меняет покрытие только в радиусе добавленных и удалённых
+    объектов, поэтому evaluate пересчитывает лишь эти клетки.
+    """
+
+    def __init__(self, grid, facilities, residents):
+        self.grid = grid
+        self.grid_xy = grid.xy
+        self.grid_tree = KDTree(self.grid_xy)
+        self.engine = CoverageEngine(facilities["lat"], facilities["lon"])
+        self.distance = self.engine.nearest_distance_xy(grid.x, grid.y)
+        self.residents = residents
+
+    def baseline(self, radius):
+        covered = self.distance <= radius
+        return {
+            "cells": len(self.grid),
+            "cells_covered": int(np.count_nonzero(covered)),
+            "residents": int(round(self.residents.sum())),
+            "residents_covered": int(round(self.residents[covered].sum())),
+        }
+
+    def match(self, xy):
+        """Индекс существующего объекта в MATCH_METERS от точки или None."""
+        if self.engine.tree is None:
+            return None
+        distance, index = self.engine.tree.query(xy)
+        return int(index) if distance <= MATCH_METERS else None
+
+    def _distances(self, cells, added_xy, removed):
+        xy = self.grid_xy[cells]
+        result = np.full(len(cells), np.inf)
+        facility_count = len(self.engine)
+        if facility_count > len(removed):
+            # Среди k ближайших есть хотя бы один неудалённый объект
+            k = min(facility_count, len(removed) + 1)
+            distances, indices = self.engine.tree.query(xy, k=k)
+            distances, indices = distances.reshape(len(xy), k), indices.reshape(len(xy), k)
+            result = np.where(np.isin(indices, removed), np.inf, distances).min(axis=1)
+        if len(added_xy):
+            result = np.minimum(result, KDTree(added_xy).query(xy)[0])
+        return result
+
+    def evaluate(self, added_xy, removed, radii):
+        """
+        {радиус: изменения покрытия} при добавлении added_xy (метры) и
+        удалении объектов с индексами removed. Клетки дальше max(radii) от
+        изменённых объектов не трогаются: их покрытие измениться не может.
+        """
+        removed = np.asarray(sorted(set(removed)), dtype=np.intp)
+        changed = np.vstack([added_xy, self.engine.facility_xy[removed]])
+        if not len(changed):
+            return {radius: _delta() for radius in radii}
+
+        neighbours = self.grid_tree.query_ball_point(changed, max(radii))
+        cells = np.unique(np.concatenate([np.asarray(n, dtype=np.intp) for n in neighbours]))
+        before = self.distance[cells]
+        after = self._distances(cells, added_xy, removed)
+        residents = self.residents[cells]
+
+        result = {}
+        for radius in radii:
+            was, now = before <= radius, after <= radius
+            gained, lost = now & ~was, was & ~now
+            result[radius] = _delta(
+                int(np.count_nonzero(gained)), int(np.count_nonzero(lost)),
+                int(round(residents[gained].sum())), int(round(residents[lost].sum())),
+            )
+        return result
+
+
+def _delta(cells_gained=0, cells_lost=0, residents_gained=0, residents_lost=0):
+    return {
+        "cells_newly_covered": cells_gained,
+        "cells_newly_uncovered": cells_lost,
+        "residents_newly_covered": residents_gained,
+        "residents_newly_uncovered": residents_lost,
+    }
+
+
+def _build_bases(object_type, districts, mode):
+    facilities = facilities_by_district(object_type, districts, mode=mode)
+    population = population_surface(districts)
+    bases = {}
+    for district in districts:
+        if 'error' in facilities[district]:
+            bases[district] = facilities[district]
+        elif isinstance(population[district], dict):
+            bases[district] = {'error': f"Население: {population[district]['error']}"}
+        else:
+            grid = district_grid(district)
+            bases[district] = BaseCoverage(grid, facilities[district], bin_to_grid(grid, population[district]))
+    return bases
+
+
+def base_coverages(object_type, districts, mode="district"):
+    """
+    {район: BaseCoverage или {'error': ...}} — в памяти процесса до смены
+    версии данных. Состояние с ошибками не кэшируется: следующий запрос
+    попробует загрузить данные заново.
+    """
+    key = (data_version(), object_type, mode, tuple(districts))
+    with _bases_lock:
+        if key in _bases:
+            _bases.move_to_end(key)
+            return _bases[key]
+
+    with stage(f"scenario_base_{object_type}"):
+        bases = _build_bases(object_type, districts, mode)
+    if not any(isinstance(base, dict) for base in bases.values()):
+        with _bases_lock:
+            _bases[key] = bases
+            while len(_bases) > BASE_CACHE_SIZE:
+                _bases.popitem(last=False)
+    return bases
+
+
+def _points(items, name):
+    points = []
+    for item in items:
+        try:
+            object_type = item.get("type")
+            points.append((object_type if object_type is None else str(object_type), float(item["lat"]), float(item["lon"])))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f"{name}: ожидаются объекты {{type, lat, lon}}.")
+    return points
+
+
+def parse_request(data):
+    """
+    Проверяет тело запроса сценариев; возвращает (types, radii, scenarios),
+    где scenario — {"name", "add": [(type, lat, lon)], "remove": [...]}.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("scenarios"), list) or not data["scenarios"]:
+        raise ValueError("Ожидается JSON с непустым списком scenarios.")
+    if len(data["scenarios"]) > MAX_SCENARIOS:
+        raise ValueError(f"Не больше {MAX_SCENARIOS} сценариев в запросе.")
+
+    scenarios = []
+    for index, scenario in enumerate(data["scenarios"]):
+        if not isinstance(scenario, dict):
+            raise ValueError("Каждый сценарий — объект {name, add, remove}.")
+        scenarios.append({
+            "name": str(scenario.get("name", index + 1)),
+            "add": _points(scenario.get("add", []), "add"),
+            "remove": _points(scenario.get("remove", []), "remove"),
+        })
+    if sum(len(s["add"]) + len(s["remove"]) for s in scenarios) > MAX_CHANGES:
+        raise ValueError(f"Не больше {MAX_CHANGES} изменений в запросе.")
+
+    changed_types = {t for s in scenarios for t, _, _ in s["add"] + s["remove"]}
+    types = data.get("types") or sorted(changed_types - {None}) or ["schools"]
+    if (not isinstance(types, list) or not all(t in OBJECT_TYPES for t in types)
+            or not changed_types - {None} <= set(types)):
+        raise ValueError("Недопустимый тип. Используйте 'schools' или 'clinics' (в types и у каждого изменения).")
+    if None in changed_types and len(types) > 1:
+        raise ValueError("У изменений нужно указать type, если в запросе несколько типов.")
+
+    radii = data.get("radii") or [RADIUS_METERS]
+    try:
+        radii = sorted({float(radius) for radius in radii})
+    except (TypeError, ValueError):
+        raise ValueError("radii должен быть списком чисел.")
+    if len(radii) > MAX_RADII or not all(0 < radius <= MAX_RADIUS_METERS for radius in radii):
+        raise ValueError(f"До {MAX_RADII} радиусов, каждый от 0 до {MAX_RADIUS_METERS} м.")
+    return types, radii, scenarios
+
+
+def _locate(points, districts):
+    """Район каждой точки (только из districts) и её координаты в метрах."""
+    if not points:
+        return [], np.empty((0, 2))
+    lat = np.array([lat for _, lat, _ in points])
+    lon = np.array([lon for _, _, lon in points])
+    located = default_registry().locate(lon, lat)
+    inside = set(districts)
+    for (_, lat_, lon_), district in zip(points, located):
+        if district not in inside:
+            raise ValueError(f"Точка ({lat_:g}, {lon_:g}) вне выбранных районов.")
+    x, y = to_metric(lat, lon)
+    return list(located), np.column_stack([x, y])
+
+
+def run_scenarios(types, radii, scenarios, districts, mode="district"):
+    """
+    Изменения покрытия по сценариям относительно текущих объектов.
+
+    Добавленный объект обслуживает клетки своего района — как в find-gaps,
+    где покрытие района считается по его объектам. Возвращает
+    {"baseline": {тип: {радиус: ...}}, "scenarios": [{"name", "totals", "districts"}]}.
+    """
+    bases = {object_type: base_coverages(object_type, districts, mode) for object_type in types}
+    for object_type, by_district in bases.items():
+        for district, base in by_district.items():
+            if isinstance(base, dict):
+                raise RuntimeError(f"{district}: {base['error']}")
+
+    baseline = {
+        object_type: {
+            _key(radius): _sum(base.baseline(radius) for base in bases[object_type].values())
+            for radius in radii
+        }
+        for object_type in types
+    }
+
+    results = []
+    with stage("scenario_eval"):
+        for scenario in scenarios:
+            # Изменения раскладываются по (тип, район)
+            changes = {}
+            for kind in ("add", "remove"):
+                located, xy = _locate(scenario[kind], districts)
+                for (object_type, _, _), district, point in zip(scenario[kind], located, xy):
+                    object_type = object_type or types[0]
+                    entry = changes.setdefault((object_type, district), {"add": [], "remove": []})
+                    if kind == "add":
+                        entry["add"].append(point)
+                        continue
+                    index = bases[object_type][district].match(point)
+                    if index is None:
+                        raise ValueError(f"Не найден объект {object_type} в {MATCH_METERS} м от удаляемой точки.")
+                    entry["remove"].append(index)
+
+            per_district = {}
+            for (object_type, district), entry in changes.items():
+                added = np.array(entry["add"]).reshape(-1, 2)
+                deltas = bases[object_type][district].evaluate(added, entry["remove"], radii)
+                per_district.setdefault(district, {})[object_type] = {
+                    _key(radius): delta for radius, delta in deltas.items()
+                }
+
+            totals = {
+                object_type: {
+                    _key(radius): _sum(d[object_type][_key(radius)] for d in per_district.values() if object_type in d)
+                    for radius in radii
+                }
+                for object_type in types
+            }
+            results.append({"name": scenario["name"], "totals": totals, "districts": per_district})
+    return {"baseline": baseline, "scenarios": results}
+
+
+def _key(radius):
+    # Ключи JSON — строки: "1500", "750.5"
+    return f"{radius:g}"
+
+
+def _sum(items):
+    total = {}
+    for item in items:
+        for key, value in item.items():
+            total[key] = total.get(key, 0) + value
+    return total or _delta()
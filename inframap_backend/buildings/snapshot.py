@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+
+
+def district_slug(district):
+    return hashlib.sha1(district.encode("utf-8")).hexdigest()[:16]
+
+
+class Snapshot:
+    """
+    Версионированный снимок предрасчитанных данных (manage.py build_snapshot).
+
+    Каталог версии: manifest.json и по подкаталогу на район с .npy-массивами
+    (объекты, решётка, здания) и JSON с результатами анализа провалов.
+    Массивы открываются через memmap: воркеры делят их через page cache.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        with open(self.root / MANIFEST, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def has(self, district, name):
+        info = self.manifest["districts"].get(district)
+        return info is not None and name in info["files"]
+
+    def has_all(self, districts, name):
+        return all(self.has(district, name) for district in districts)
+
+    def _path(self, district, filename):
+        return self.root / self.manifest["districts"][district]["slug"] / filename
+
+    def array(self, district, name):
+        key = (district, name)
+        if key not in self._arrays:
+            with self._lock:
+                if key not in self._arrays:
+                    array = np.load(self._path(district, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+                    self._arrays[key] = array
+        return self._arrays[key]
+
+    def json(self, district, name):
+        with open(self._path(district, f"{name}.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def preload(self):
+        """Открывает все массивы заранее — вызывается при старте воркера."""
+        for district, info in self.manifest["districts"].items():
+            for name in info["files"]:
+                if (self.root / info["slug"] / f"{name}.npy").exists():
+                    self.array(district, name)
+        return self
+
+
+_current = {"stat": None, "version": None, "snapshot": None}
+_current_lock = threading.Lock()
+
+
+def current_snapshot():
+    """
+    Снимок, на который указывает SNAPSHOT_DIR/CURRENT, или None.
+    CURRENT перечитывается, только когда меняется сам файл (publish
+    подменяет его через os.replace — меняются inode и время изменения),
+    на остальных запросах — один stat.
+    """
+    root = Path(settings.SNAPSHOT_DIR)
+    try:
+        stat = (root / CURRENT).stat()
+    except FileNotFoundError:
+        return None
+    key = (str(root), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _current["stat"] != key:
+        with _current_lock:
+            if _current["stat"] != key:
+                try:
+                    version = (root / CURRENT).read_text(encoding="utf-8").strip()
+                except FileNotFoundError:
+                    return None
+                # Та же версия в том же каталоге — уже открытые массивы остаются
+                if _current["version"] != (root, version):
+                    path = root / version
+                    _current["snapshot"] = Snapshot(path) if (path / MANIFEST).exists() else None
+                    _current["version"] = (root, version)
+                _current["stat"] = key
+    return _current["snapshot"]
+
+
+def publish(root, version):
+    """Атомарно переключает CURRENT на новую версию."""
+    root = Path(root)
+    tmp = root / f"{CURRENT}.{os.getpid()}.tmp"
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, root / CURRENT)
@@ -1,3 +1,1195 @@
-from django.test import TestCase
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from scipy.spatial import KDTree
+import shapely
+from shapely.geometry import Point
+
+from benchmarks.fixtures import SyntheticCity, installed
+
+from . import (
+    concurrency, extract_source, facility_service, feature_store, gap_service, job_service, network_service, regions,
+)
+from .city_service import tags_mask
+from .concurrency import map_districts
+from .constants import DISTRICTS
+from .coverage_service import CoverageEngine, to_geographic, to_metric
+from .distance_field import get_distance_field
+from .extract_source import ExtractSource
+from .facility_service import facilities_by_district
+from .feature_index import rebuild_clusters, replace_layer, viewport
+from .feature_store import FeatureStore
+from .grid_service import build_grid
+from .job_service import load_job, submit
+from .models import AnalysisJob
+from .network_service import StreetNetwork
+from .placement_service import greedy_placement
+from .points import PointSet
+from .renderers import NDJSONRenderer, PackedPointsRenderer, PayloadJSONRenderer
+from .population_service import PopulationPoints, bin_to_grid, shares_within
+from .regions import Region, RegionRegistry, requested_districts, set_default_registry
+from .response_cache import bump_data_version, cached_response, data_version
+from .scenario_service import BaseCoverage
+from .snapshot import MANIFEST, current_snapshot, publish
+
+
+# Тесты не трогают файловый кэш ответов разработчика (CACHES по умолчанию)
+_test_caches = override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "inframap-tests"},
+})
+
+
+def setUpModule():
+    _test_caches.enable()
+
+
+def tearDownModule():
+    _test_caches.disable()
+
+
+class StubFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, place, tags):
+        self.calls.append((place, tags))
+        return gpd.GeoDataFrame(
+            {"name": ["Школа №1", None], "levels": [3, "5"]},
+            geometry=[Point(74.6, 42.87), Point(74.61, 42.88)],
+            crs="EPSG:4326",
+        )
+
+
+class FeatureStoreTests(SimpleTestCase):
+    place = "Ленинский район, город Бишкек, Киргизия"
+    tags = {"amenity": "school"}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fetcher = StubFetcher()
+
+    def store(self, ttl=None):
+        return FeatureStore(self.tmp.name, ttl=ttl, fetcher=self.fetcher)
+
+    def test_second_call_is_served_from_disk(self):
+        first = self.store().features(self.place, self.tags)
+        second = self.store().features(self.place, self.tags)
+
+        self.assertEqual(len(self.fetcher.calls), 1)
+        self.assertEqual(len(second), len(first))
+        self.assertEqual(second.crs, first.crs)
+        self.assertEqual(second["name"].iloc[0], "Школа №1")
+
+    def test_key_depends_on_tags(self):
+        store = self.store()
+        store.features(self.place, self.tags)
+        store.features(self.place, {"amenity": "clinic"})
+
+        self.assertEqual(len(self.fetcher.calls), 2)
+
+    def test_expired_entry_is_refetched(self):
+        self.store(ttl=3600).features(self.place, self.tags)
+        self.store(ttl=0).features(self.place, self.tags)
+
+        self.assertEqual(len(self.fetcher.calls), 2)
+
+    def test_invalidate_by_place(self):
+        store = self.store()
+        store.features(self.place, self.tags)
+        store.features("Октябрьский район, город Бишкек, Киргизия", self.tags)
+
+        self.assertEqual(store.invalidate(place=self.place), 1)
+        store.features(self.place, self.tags)
+        self.assertEqual(len(self.fetcher.calls), 3)
+        self.assertEqual(len(store.entries()), 2)
+
+
+class MapDistrictsTests(SimpleTestCase):
+    def setUp(self):
+        # Свой маленький пул, чтобы очередь возникала на паре районов
+        self.release = threading.Event()
+        settings_override = override_settings(DISTRICT_FETCH_WORKERS=2)
+        settings_override.enable()
+        concurrency._executor.cache_clear()
+
+        def cleanup():
+            self.release.set()
+            concurrency._executor().shutdown(wait=True)
+            concurrency._executor.cache_clear()
+            settings_override.disable()
+
+        self.addCleanup(cleanup)
+
+    def fetch(self, district):
+        if district == "bad":
+            raise ValueError("нет границы")
+        if district.startswith("hung"):
+            self.release.wait(5)
+        return district.upper()
+
+    def test_failed_and_hung_districts_do_not_affect_others(self):
+        started = time.monotonic()
+        result = map_districts(self.fetch, ["a", "bad", "hung", "b"], timeout=0.3)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(result["a"], "A")
+        self.assertEqual(result["b"], "B")
+        self.assertEqual(result["bad"], {"error": "нет границы"})
+        self.assertIn("Превышено время ожидания", result["hung"]["error"])
+        self.assertEqual(list(result), ["a", "bad", "hung", "b"])
+
+    def test_time_in_queue_does_not_count(self):
+        def slow(district):
+            time.sleep(0.3)
+            return district
+
+        # 2 потока на 4 района: вторая пара стартует через 0.3 с и заканчивает к 0.6 с
+        result = map_districts(slow, ["a", "b", "c", "d"], timeout=0.5)
+        self.assertEqual(result, {"a": "a", "b": "b", "c": "c", "d": "d"})
+
+    def test_district_without_a_free_thread_is_dropped_from_queue(self):
+        calls = []
+
+        def fetch(district):
+            calls.append(district)
+            return self.fetch(district)
+
+        result = map_districts(fetch, ["hung", "hung2", "a"], timeout=0.3)
+        self.assertIn("Превышено время ожидания", result["hung"]["error"])
+        self.assertIn("Нет свободного потока", result["a"]["error"])
+        self.assertNotIn("a", calls)
+
+
+class SlowView(APIView):
+    calls = 0
+    delay = 0.0
+
+    @cached_response(timeout=60, stale=60)
+    def get(self, request):
+        type(self).calls += 1
+        time.sleep(self.delay)
+        if request.query_params.get("fail"):
+            return Response({"error": "нет данных"}, status=400)
+        if request.query_params.get("district_error"):
+            return Response({"districts": {"A": {"count": 1}, "B": {"error": "Overpass не ответил"}}})
+        if request.query_params.get("bump") and type(self).calls == 1:
+            bump_data_version()
+        return Response({"type": request.query_params.get("type"), "call": type(self).calls})
+
+
+class StaleView(APIView):
+    calls = 0
+
+    # timeout=0: запись сразу устаревает, но ещё минуту отдаётся как stale
+    @cached_response(timeout=0, stale=60)
+    def get(self, request):
+        type(self).calls += 1
+        return Response({"call": type(self).calls})
+
+
+class ResponseCacheMixin:
+    def setUp(self):
+        cache.clear()
+        SlowView.calls = 0
+        SlowView.delay = 0.0
+        StaleView.calls = 0
+        self.factory = APIRequestFactory()
+
+    def get(self, query="", **headers):
+        response = SlowView.as_view()(self.factory.get(f"/api/v1/slow/{query}", **headers))
+        response.render()
+        return response
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.get("?type=schools&max_new=3")
+        second = self.get("?max_new=3&type=schools")
+
+        self.assertEqual(SlowView.calls, 1)
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.data, second.data)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.get("?type=schools")["ETag"]
+        response = self.get("?type=schools", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_errors_are_not_cached(self):
+        self.get("?fail=1")
+        self.get("?fail=1")
+
+        self.assertEqual(SlowView.calls, 2)
+
+    def test_partial_errors_are_cached_briefly(self):
+        with override_settings(RESPONSE_CACHE_ERROR_TIMEOUT=0):
+            self.get("?district_error=1")
+            self.get("?district_error=1")
+        self.assertEqual(SlowView.calls, 2)
+
+    def test_version_bumped_by_the_view_is_used_for_the_entry(self):
+        # Как после свежей выгрузки OSM внутри расчёта (on_update=bump_data_version)
+        states = [self.get("?bump=1")["X-Cache"] for _ in range(3)]
+        self.assertEqual(states, ["MISS", "HIT", "HIT"])
+
+    def test_data_version_change_invalidates(self):
+        self.get("?type=schools")
+        bump_data_version()
+        self.get("?type=schools")
+
+        self.assertEqual(SlowView.calls, 2)
+
+    def test_concurrent_misses_compute_once(self):
+        SlowView.delay = 0.3
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(self.get("?type=clinics")))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(SlowView.calls, 1)
+        self.assertEqual({r.data["call"] for r in responses}, {1})
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        view = StaleView.as_view()
+        request = lambda: view(self.factory.get("/api/v1/stale/"))
+        request()
+
+        stale = request()
+        self.assertEqual(stale["X-Cache"], "STALE")
+        self.assertEqual(stale.data["call"], 1)
+
+        # Фоновое обновление подменяет запись в кэше
+        deadline = time.monotonic() + 2
+        while request().data["call"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(request().data["call"], 2)
+
+
+class LocMemResponseCacheTests(ResponseCacheMixin, SimpleTestCase):
+    pass
+
+
+class FileResponseCacheTests(ResponseCacheMixin, SimpleTestCase):
+    def setUp(self):
+        # Фоновое обновление может дописывать файл кэша во время очистки
+        tmp = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": tmp.name,
+            }
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
+
+
+def legacy_extract_points(gdf):
+    # Прежний _extract_points — построчно через iterrows
+    lats, lons, names = [], [], []
+    for _, row in gdf.iterrows():
+        try:
+            geom = row.geometry
+            point = geom if geom.geom_type == 'Point' else geom.centroid
+            lat, lon = point.y, point.x
+
+            if np.isnan(lat) or np.isnan(lon):
+                continue
+
+            name = row.get('name')
+            if name is None or isinstance(name, float) and np.isnan(name):
+                name = facility_service.DEFAULT_NAME
+
+            lats.append(lat)
+            lons.append(lon)
+            names.append(name)
+        except Exception:
+            continue
+    return {
+        "lat": np.asarray(lats, dtype=float),
+        "lon": np.asarray(lons, dtype=float),
+        "names": np.asarray(names, dtype=object),
+    }
+
+
+class ExtractPointsTests(SimpleTestCase):
+    def assertSameAsLegacy(self, gdf):
+        expected, actual = legacy_extract_points(gdf), facility_service._extract_points(gdf)
+        np.testing.assert_allclose(actual["lat"], expected["lat"])
+        np.testing.assert_allclose(actual["lon"], expected["lon"])
+        self.assertEqual(actual["names"].tolist(), expected["names"].tolist())
+        return actual
+
+    def test_matches_iterrows_loop(self):
+        gdf = gpd.GeoDataFrame({"name": ["Школа №1", None, np.nan, "Поликлиника", "пустая", "без геометрии"]}, geometry=[
+            Point(74.6, 42.87),
+            shapely.box(74.60, 42.80, 74.62, 42.81),
+            shapely.Polygon([(74.5, 42.8), (74.53, 42.8), (74.5, 42.84)]),
+            shapely.MultiPolygon([shapely.box(74.7, 42.9, 74.71, 42.91), shapely.box(74.72, 42.9, 74.74, 42.91)]),
+            Point(),
+            None,
+        ], crs="EPSG:4326")
+        actual = self.assertSameAsLegacy(gdf)
+        self.assertEqual(actual["names"].tolist(), ["Школа №1", "Без названия", "Без названия", "Поликлиника"])
+
+        self.assertSameAsLegacy(gdf.drop(columns="name"))
+        empty = self.assertSameAsLegacy(gdf.iloc[:0])
+        self.assertEqual(len(empty["lat"]), 0)
+
+
+class CityFetchModeTests(SimpleTestCase):
+    """fetch=city: одна выгрузка на город и sjoin по районам против отдельных запросов по районам."""
+
+    boundaries = {
+        "Западный район": shapely.box(74.5, 42.8, 74.6, 42.9),
+        "Восточный район": shapely.box(74.6, 42.8, 74.7, 42.9),
+    }
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.clinics = gpd.GeoDataFrame({"amenity": "clinic", "name": [
+            "центр", "у границы с запада", "у границы с востока", "за городом", "через границу", "на границе",
+        ]}, geometry=[
+            Point(74.55, 42.85), Point(74.5999, 42.85), Point(74.6001, 42.81), Point(75.0, 42.85),
+            shapely.box(74.59, 42.82, 74.65, 42.83), Point(74.6, 42.87),
+        ], crs="EPSG:4326")
+        registry = RegionRegistry([Region("test", list(self.boundaries), city="город Тест")])
+        store = FeatureStore(tmp.name, fetcher=self.fetch, geocoder=self.geocode)
+        for patch in (mock.patch.object(feature_store, "_override", store), mock.patch.object(regions, "_override", registry)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        # Снимок разработчика (cache/snapshots) не должен подменить выгрузку
+        settings_override = override_settings(SNAPSHOT_DIR=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def geocode(self, place):
+        return gpd.GeoDataFrame(geometry=[self.boundaries[place]], crs="EPSG:4326")
+
+    def fetch(self, place, tags):
+        # Как Overpass: для района — всё, что пересекает его границу, для города — всё
+        features = self.clinics[tags_mask(self.clinics, tags)]
+        if place in self.boundaries:
+            features = features[features.intersects(self.boundaries[place])]
+        return features.reset_index(drop=True)
+
+    def names(self, mode, selected=None):
+        result = facilities_by_district("clinics", list(self.boundaries), mode=mode)
+        return {
+            district: sorted(name for name in facilities["names"] if selected is None or name in selected)
+            for district, facilities in result.items()
+        }
+
+    def test_points_are_assigned_like_district_mode(self):
+        inside = {"центр", "у границы с запада", "у границы с востока", "за городом"}
+        self.assertEqual(self.names("city", inside), {
+            "Западный район": ["у границы с запада", "центр"],
+            "Восточный район": ["у границы с востока"],
+        })
+        self.assertEqual(self.names("city", inside), self.names("district", inside))
+
+    def test_border_objects_land_in_exactly_one_district(self):
+        city = self.names("city")
+        # Здание через границу — по своей внутренней точке, точка на границе — первому району
+        self.assertEqual(city["Восточный район"], ["у границы с востока", "через границу"])
+        self.assertIn("на границе", city["Западный район"])
+        self.assertEqual(sum(len(names) for names in city.values()), len(self.clinics) - 1)
+
+
+class ExtractBoundaryTests(SimpleTestCase):
+    def setUp(self):
+        # Два города, в каждом свой «Ленинский район», как в национальной выгрузке
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "boundaries.geojson"
+        gpd.GeoDataFrame({
+            "name": ["Бишкек", "Ош", "Ленинский район", "Ленинский район", "Свердловский район"],
+            "admin_level": ["4", "4", "9", "9", "9"],
+            "boundary": "administrative",
+        }, geometry=[
+            shapely.box(74.4, 42.7, 74.8, 43.0), shapely.box(72.7, 40.4, 72.9, 40.6),
+            shapely.box(74.5, 42.8, 74.6, 42.9), shapely.box(72.75, 40.45, 72.8, 40.5),
+            shapely.box(74.6, 42.8, 74.7, 42.9),
+        ], crs="EPSG:4326").to_file(self.path, driver="GeoJSON")
+        self.source = ExtractSource(self.path)
+
+    def test_same_named_districts_are_told_apart_by_parent(self):
+        found = self.source.boundary("Ленинский район, город Бишкек, Киргизия")
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found.geometry.iloc[0].bounds, (74.5, 42.8, 74.6, 42.9))
+        self.assertEqual(len(self.source.boundary("Свердловский район, Киргизия")), 1)
+
+    def test_ambiguous_name_is_an_error(self):
+        for place in ("Ленинский район", "Ленинский район, Киргизия"):
+            with self.assertRaisesRegex(ValueError, "2 границ"):
+                self.source.boundary(place)
+        with self.assertRaises(ValueError):
+            self.source.boundary("Свердловский район, город Ош")
+
+
+OSM_FIXTURE = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="tests">
+  <node id="1" version="1" lat="42.80" lon="74.50"/>
+  <node id="2" version="1" lat="42.80" lon="74.52"/>
+  <node id="3" version="1" lat="42.82" lon="74.52"/>
+  <node id="4" version="1" lat="42.82" lon="74.50"/>
+  <node id="5" version="1" lat="42.810" lon="74.510"/>
+  <node id="6" version="1" lat="42.810" lon="74.511"/>
+  <node id="7" version="1" lat="42.811" lon="74.511"/>
+  <node id="8" version="1" lat="42.811" lon="74.510"/>
+  <node id="9" version="1" lat="42.815" lon="74.515">
+    <tag k="amenity" v="school"/>
+  </node>
+  <node id="10" version="1" lat="42.900" lon="74.900">
+    <tag k="amenity" v="school"/>
+  </node>
+  <way id="100" version="1">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="1"/>
+    <tag k="boundary" v="administrative"/>
+    <tag k="admin_level" v="9"/>
+    <tag k="name" v="Тестовый район"/>
+  </way>
+  <way id="101" version="1">
+    <nd ref="5"/><nd ref="6"/><nd ref="7"/><nd ref="8"/><nd ref="5"/>
+    <tag k="building" v="residential"/>
+  </way>
+</osm>
+"""
+
+
+class ExtractFeatureTests(SimpleTestCase):
+    """Чтение объектов из выгрузки: потоком, с where/bbox, .osm — через GeoPackage."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        # Мелкие пачки, чтобы результат собирался из нескольких
+        patcher = mock.patch.object(extract_source, "BATCH_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_features_are_streamed_with_where_and_bbox(self):
+        path = self.tmp / "extract.geojson"
+        write_extract(path, [3, 1, 2, 4])
+        source = ExtractSource(path, workdir=self.tmp / "work")
+        with mock.patch.object(extract_source.pyogrio, "open_arrow", wraps=extract_source.pyogrio.open_arrow) as open_arrow:
+            found = source.features(DISTRICTS[3], {"building": True})
+
+        self.assertEqual(len(found), 4)
+        self.assertTrue((found["building"] == "residential").all())
+        kwargs = open_arrow.call_args.kwargs
+        self.assertEqual(kwargs["where"], '("building" IS NOT NULL)')
+        self.assertEqual(kwargs["batch_size"], 2)
+        np.testing.assert_allclose(kwargs["bbox"], (74.56, 42.80, 74.58, 42.82))
+        self.assertEqual(len(source.features(DISTRICTS[1], {"building": True})), 1)
+        self.assertTrue(source.features(DISTRICTS[1], {"amenity": "school"}).empty)
+
+    def test_osm_is_converted_once_per_file_version(self):
+        path = self.tmp / "extract.osm"
+        path.write_text(OSM_FIXTURE, encoding="utf-8")
+        source = ExtractSource(path, workdir=self.tmp / "work")
+        with mock.patch.object(extract_source, "convert_osm", wraps=extract_source.convert_osm) as convert:
+            buildings = source.features("Тестовый район", {"building": True})
+            schools = source.features("Тестовый район", {"amenity": "school"})
+            self.assertEqual(convert.call_count, 1)
+
+            # Новая версия выгрузки — новая конвертация
+            stat = path.stat()
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            source = ExtractSource(path, workdir=self.tmp / "work")
+            source.features("Тестовый район", {"building": True})
+            self.assertEqual(convert.call_count, 2)
+
+        self.assertEqual(len(buildings), 1)
+        np.testing.assert_allclose(buildings.geometry.iloc[0].bounds, (74.510, 42.810, 74.511, 42.811))
+        self.assertEqual(list(schools["amenity"]), ["school"])
+        converted = sorted((self.tmp / "work").glob("*.gpkg"))
+        self.assertEqual(len(converted), 2)
+        self.assertEqual(list((self.tmp / "work").glob("*.tmp.gpkg")), [])
+        db = sqlite3.connect(converted[0])
+        self.addCleanup(db.close)
+        indexes = {name for name, in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' OR name LIKE 'rtree_%'"
+        )}
+        self.assertIn("multipolygons_building", indexes)
+        self.assertIn("multipolygons_amenity", indexes)
+        self.assertIn("rtree_multipolygons_geom", indexes)
+        self.assertIn("rtree_points_geom", indexes)
+
+
+class ConditionalGetTests(SimpleTestCase):
+    """Через весь стек middleware: GZip превращает ETag в слабый W/"..."."""
+
+    url = "/api/v1/estimate-population/"
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("buildings.population_service.estimate_population", side_effect=lambda districts, **_: [
+            {"district": district, "num_buildings": 1000, "estimated_population": 100_000} for district in districts
+        ])
+        self.estimate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        return self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip", **headers)
+
+    def test_weak_etag_from_gzip_returns_304(self):
+        first = self.get()
+        self.assertEqual(first["Content-Encoding"], "gzip")
+        etag = first["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+
+        for header in (etag, etag.removeprefix("W/"), f'"other", {etag}', "*"):
+            response = self.get(HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304, header)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='W/"other"').status_code, 200)
+        self.assertEqual(self.estimate.call_count, 1)
+
+    def test_negotiated_formats_vary_on_accept(self):
+        etags = set()
+        for accept in ("application/json", "application/x-inframap-points", "application/x-ndjson"):
+            response = self.get(HTTP_ACCEPT=accept)
+            self.assertTrue(response["Content-Type"].startswith(accept))
+            self.assertIn("Accept", [v.strip() for v in response["Vary"].split(",")], accept)
+            etags.add(response["ETag"])
+            not_modified = self.get(HTTP_ACCEPT=accept, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertIn("Accept", not_modified["Vary"])
+        self.assertEqual(len(etags), 3)
+
+
+class FindGapZonesParamsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_params_are_taken_by_name(self):
+        # Порядок ключей в словаре параметров не должен ничего менять
+        parse = gap_service.gap_params
+        with mock.patch.object(gap_service, "gap_params", lambda params: dict(reversed(parse(params).items()))), \
+                mock.patch.object(gap_service, "precomputed_gaps", return_value={}) as precomputed, \
+                mock.patch.object(gap_service, "gaps_payload", return_value={}) as payload:
+            response = self.client.get("/api/v1/find-gaps/", {"type": "clinics"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(precomputed.call_args.args[0], "clinics")
+        self.assertEqual(payload.call_args.args[:3], ("clinics", "population", "euclidean"))
+
+
+class ProfilingTests(SimpleTestCase):
+    url = "/api/v1/estimate-population/?profile=1"
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("buildings.population_service.estimate_population", return_value=[])
+        self.estimate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_profile_parameter_is_ignored_unless_enabled(self):
+        for _ in range(2):
+            response = self.client.get(self.url)
+            self.assertEqual(response["Content-Type"], "application/json")
+        # Без REQUEST_PROFILING запрос идёт через кэш как обычно
+        self.assertEqual(self.estimate.call_count, 1)
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_profile_report_when_enabled(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertEqual(response["X-Profiled-Status"], "200")
+
+
+class RegionRegistryTests(SimpleTestCase):
+    def setUp(self):
+        # Два региона по два района-квадрата 1°×1° в ряд: A1 A2 B1 B2
+        names = ["A1", "A2", "B1", "B2"]
+        boundaries = {name: shapely.box(i, 0, i + 1, 1) for i, name in enumerate(names)}
+        self.registry = RegionRegistry(
+            [Region("a", names[:2]), Region("b", names[2:])], default="b", boundaries=boundaries,
+        )
+        self.factory = APIRequestFactory()
+
+    def districts(self, query=""):
+        request = APIView().initialize_request(self.factory.get(f"/?{query}"))
+        return requested_districts(request, self.registry)
+
+    def test_locate_points(self):
+        located = self.registry.locate([0.5, 2.5, 1.0, 9.0], [0.5, 0.5, 0.5, 0.5])
+        # Точка на общей границе A1 и A2 достаётся первому району по реестру
+        self.assertEqual(located.tolist(), ["A1", "B1", "A1", None])
+
+    def test_geocoding_does_not_block_the_registry(self):
+        registry = RegionRegistry([Region("a", ["A1", "A2"])], boundaries={"A1": shapely.box(0, 0, 1, 1)})
+        release, calls = threading.Event(), []
+
+        def slow_boundary(district):
+            calls.append(district)
+            release.wait(5)
+            return shapely.box(1, 0, 2, 1)
+
+        with mock.patch("buildings.regions._boundary", side_effect=slow_boundary):
+            threads = [threading.Thread(target=registry.in_bbox, args=((0, 0, 2, 1),))]
+            threads[0].start()
+            while not calls:
+                time.sleep(0.01)
+            # Пока индекс ждёт геокодер, известная граница отдаётся сразу
+            started = time.monotonic()
+            registry.boundary("A1")
+            self.assertLess(time.monotonic() - started, 0.5)
+
+            # Второй запрос той же границы ждёт первый, а не геокодирует заново
+            threads.append(threading.Thread(target=registry.boundary, args=("A2",)))
+            threads[1].start()
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(calls, ["A2"])
+        self.assertEqual(registry.in_bbox((1.5, 0.2, 1.8, 0.8)), ["A2"])
+
+    def test_requested_districts(self):
+        self.assertEqual(self.districts(), ["B1", "B2"])
+        self.assertEqual(self.districts("region=a,b"), ["A1", "A2", "B1", "B2"])
+        self.assertEqual(self.districts("bbox=1.5,0.2,2.5,0.8"), ["A2", "B1"])
+        self.assertEqual(self.districts("region=b&bbox=1.5,0.2,2.5,0.8"), ["B1"])
+        for query in ("region=c", "bbox=1,2,3", "bbox=3,0,1,1"):
+            with self.assertRaises(ValueError):
+                self.districts(query)
+
+
+class BuildingSharesTests(SimpleTestCase):
+    def test_matches_clip(self):
+        rng = np.random.default_rng(2)
+        boundary = shapely.Polygon([(0, 0), (1, 0), (1, 0.6), (0.5, 1), (0, 0.6)])
+        x, y = rng.uniform(-0.1, 1.1, 500), rng.uniform(-0.1, 1.1, 500)
+        buildings = gpd.GeoDataFrame(geometry=shapely.box(x, y, x + 0.03, y + 0.02), crs="EPSG:4326")
+
+        shares = shares_within(buildings, boundary)
+        clipped = gpd.clip(buildings, boundary)
+        self.assertEqual(len(shares), len(clipped))
+        self.assertAlmostEqual(shares.fields["share"].sum(), shapely.area(clipped.geometry.values).sum() / (0.03 * 0.02))
+        self.assertTrue(((shares.fields["share"] > 0) & (shares.fields["share"] <= 1)).all())
+
+
+class DistanceFieldTests(SimpleTestCase):
+    # Район ~4×4.5 км у Бишкека, две школы внутри
+    district = shapely.box(74.50, 42.80, 74.55, 42.84)
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(DISTANCE_FIELD_DIR=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch(
+            "buildings.distance_field.facilities_by_district",
+            return_value={"A": {"lat": np.array([42.81, 42.83]), "lon": np.array([74.51, 74.54])}},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        set_default_registry(RegionRegistry([Region("a", ["A"])], boundaries={"A": self.district}))
+        self.addCleanup(set_default_registry, None)
+
+    def test_summary_is_masked_to_region_and_follows_data_version(self):
+        field = get_distance_field("schools", "a", resolution=100)
+        everything = field.coverage_summary(1e9)
+        area_km2 = gpd.GeoSeries([self.district], crs="EPSG:4326").to_crs("EPSG:32643").area.iloc[0] / 1e6
+        # Без маски в сумму попал бы и запас в 2 км вокруг района
+        self.assertAlmostEqual(everything["covered_km2"], area_km2, delta=area_km2 * 0.02)
+        self.assertEqual(everything["uncovered_km2"], 0)
+
+        self.assertIs(get_distance_field("schools", "a", resolution=100), field)
+        bump_data_version()
+        self.assertNotEqual(get_distance_field("schools", "a", resolution=100).version, field.version)
+
+    def test_missing_boundary_is_503(self):
+        set_default_registry(RegionRegistry([Region("a", ["A"])]))
+        with mock.patch("buildings.regions._boundary", side_effect=ValueError("геокодер недоступен")):
+            summary = self.client.get("/api/v1/coverage-summary/?region=a")
+            tile = self.client.get("/api/v1/coverage-tiles/schools/12/2894/1514.png?region=a")
+        self.assertEqual(summary.status_code, 503)
+        self.assertIn("геокодер недоступен", summary.json()["error"])
+        self.assertEqual(tile.status_code, 503)
+        self.assertEqual(self.client.get("/api/v1/coverage-summary/?region=nope").status_code, 400)
+
+
+class BuildSnapshotTests(SimpleTestCase):
+    def test_new_type_with_carried_over_district(self):
+        city = SyntheticCity(2, buildings_per_district=200)
+        broken = city.districts[1]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        def get_facilities(object_type, district):
+            if district == broken:
+                raise RuntimeError("Overpass не ответил")
+            return facility_service.get_facilities(object_type, district)
+
+        with installed(city), override_settings(SNAPSHOT_DIR=tmp.name):
+            call_command("build_snapshot", types=["schools"], stdout=StringIO())
+            version = data_version()
+            # Имя версии снимка — время с точностью до секунды
+            time.sleep(1.1)
+            out = StringIO()
+            with mock.patch("buildings.management.commands.build_snapshot.get_facilities", get_facilities):
+                call_command("build_snapshot", types=["clinics", "schools"], stdout=out)
+
+            snapshot = current_snapshot()
+            self.assertEqual(snapshot.manifest["districts"][broken]["status"], "carried over")
+            self.assertTrue(snapshot.has(city.districts[0], "gaps_clinics"))
+            self.assertTrue(snapshot.has(broken, "gaps_schools"))
+            self.assertFalse(snapshot.has(broken, "gaps_clinics"))
+            self.assertIn("нет данных по clinics", out.getvalue())
+            # Новый снимок сбрасывает кэш ответов
+            self.assertNotEqual(data_version(), version)
+
+    def test_current_is_reread_only_when_it_changes(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        for version in ("v1", "v2"):
+            (root / version).mkdir()
+            (root / version / MANIFEST).write_text(json.dumps({"version": version, "districts": {}}), encoding="utf-8")
+        publish(root, "v1")
+
+        with override_settings(SNAPSHOT_DIR=tmp.name), \
+                mock.patch.object(Path, "read_text", autospec=True, side_effect=Path.read_text) as read:
+            first = current_snapshot()
+            self.assertEqual(first.version, "v1")
+            self.assertIs(current_snapshot(), first)
+            self.assertEqual(read.call_count, 1)
+
+            publish(root, "v2")
+            self.assertEqual(current_snapshot().version, "v2")
+            self.assertEqual(read.call_count, 2)
+
+
+class ScenarioTests(SimpleTestCase):
+    def test_incremental_delta_matches_full_recompute(self):
+        rng = np.random.default_rng(1)
+        grid = build_grid(shapely.box(480_000, 4_730_000, 490_000, 4_738_000), step=250)
+        x = rng.uniform(480_000, 490_000, 12)
+        y = rng.uniform(4_730_000, 4_738_000, 12)
+        lat, lon = to_geographic(x, y)
+        residents = rng.uniform(0, 100, len(grid))
+        base = BaseCoverage(grid, {"lat": lat, "lon": lon}, residents)
+
+        added = np.array([[482_000.0, 4_731_000.0], [489_000.0, 4_737_500.0]])
+        removed = [0, 5, 5]
+        radii = [500, 1500]
+        deltas = base.evaluate(added, removed, radii)
+
+        keep = np.setdiff1d(np.arange(12), removed)
+        facilities = np.vstack([np.column_stack([x[keep], y[keep]]), added])
+        after = KDTree(facilities).query(grid.xy)[0]
+        for radius in radii:
+            was, now = base.distance <= radius, after <= radius
+            self.assertEqual(deltas[radius]["cells_newly_covered"], np.count_nonzero(now & ~was))
+            self.assertEqual(deltas[radius]["cells_newly_uncovered"], np.count_nonzero(was & ~now))
+            self.assertEqual(deltas[radius]["residents_newly_uncovered"], round(residents[was & ~now].sum()))
+
+
+def decode_packed_points(raw):
+    """Тот же разбор, что decodePackedPoints в infamap_frontend/src/services/pointsDecoder.js."""
+    assert raw[:4] == b"IMP1"
+    header_length = int.from_bytes(raw[4:8], "little")
+    header = json.loads(raw[8:8 + header_length].decode("utf-8"))
+    body_start = -(-(8 + header_length) // 4) * 4
+
+    def deltas(offset, count):
+        values = np.frombuffer(raw, dtype="<i4", count=count, offset=body_start + offset)
+        return (np.cumsum(values, dtype=np.int64) / 1e6).tolist()
+
+    def expand(value):
+        if isinstance(value, list):
+            return [expand(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "$points" in value:
+            count, offset, fields = value["count"], value["offset"], value["fields"]
+            lat, lon = deltas(offset, count), deltas(offset + count * 4, count)
+            return [
+                {"lat": lat[i], "lon": lon[i], **{name: column[i] for name, column in fields.items()}}
+                for i in range(count)
+            ]
+        return {key: expand(item) for key, item in value.items()}
+
+    return expand(header)
+
+
+def decode_ndjson(raw):
+    lines = [json.loads(line) for line in raw.decode("utf-8").splitlines()]
+    points = {}
+    for line in lines[1:]:
+        points.setdefault(line.pop("$points"), []).append(line)
+
+    def expand(value):
+        if isinstance(value, list):
+            return [expand(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "$points" in value:
+            return points.get(value["$points"], [])
+        return {key: expand(item) for key, item in value.items()}
+
+    return expand(lines[0])
+
+
+class PointRenderersTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(6)
+        lat, lon = rng.uniform(42.8, 42.9, 2500), rng.uniform(74.5, 74.7, 2500)
+        self.data = {
+            "total_count": 2503,
+            "districts": {
+                "Ленинский район": {"coordinates": PointSet(lat, lon, residents_served=rng.integers(0, 900, 2500))},
+                "Октябрьский район": {"coordinates": PointSet(
+                    [42.87, -33.9, 0.0], [74.59, 151.2, -179.999999], name=np.array(["Школа №1", "", "ё"]),
+                )},
+                "Пустой": {"coordinates": PointSet([], []), "error": None},
+            },
+        }
+        self.expected = json.loads(PayloadJSONRenderer().render(self.data))
+
+    def assertSamePoints(self, decoded, tolerance):
+        for district, item in self.expected["districts"].items():
+            got = decoded["districts"][district]["coordinates"]
+            self.assertEqual(len(got), len(item["coordinates"]))
+            for want, point in zip(item["coordinates"], got):
+                self.assertEqual(point.keys(), want.keys())
+                self.assertAlmostEqual(point["lat"], want["lat"], delta=tolerance)
+                self.assertAlmostEqual(point["lon"], want["lon"], delta=tolerance)
+                self.assertEqual({k: v for k, v in point.items() if k not in ("lat", "lon")},
+                                 {k: v for k, v in want.items() if k not in ("lat", "lon")})
+        self.assertEqual(decoded["total_count"], self.expected["total_count"])
+        self.assertIsNone(decoded["districts"]["Пустой"]["error"])
+
+    def test_packed_round_trip(self):
+        raw = PackedPointsRenderer().render(self.data)
+        # После выравнивания заголовка — ровно по 8 байт на точку
+        body_start = -(-(8 + int.from_bytes(raw[4:8], "little")) // 4) * 4
+        self.assertEqual(len(raw) - body_start, 8 * self.data["total_count"])
+        # Микроградусы: погрешность — половина единицы
+        self.assertSamePoints(decode_packed_points(raw), 0.5e-6 + 1e-12)
+
+    def test_ndjson_round_trip(self):
+        self.assertSamePoints(decode_ndjson(NDJSONRenderer().render(self.data)), 0)
+
+
+@mock.patch("buildings.job_service._start")
+class AnalysisJobTests(TestCase):
+    params = {"districts": ["A1", "A2"]}
+
+    def test_identical_jobs_are_deduplicated(self, start):
+        first, created = submit("estimate_population", self.params)
+        second, created_again = submit("estimate_population", self.params)
+        other, _ = submit("estimate_population", {"districts": ["A1"]})
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(second.pk, first.pk)
+        self.assertNotEqual(other.pk, first.pk)
+        self.assertEqual(start.call_count, 2)
+
+        AnalysisJob.objects.filter(pk=first.pk).update(status=AnalysisJob.DONE, finished_at=timezone.now())
+        self.assertEqual(submit("estimate_population", self.params)[0].pk, first.pk)
+
+    def test_lost_job_is_restarted(self, start):
+        lost, _ = submit("estimate_population", self.params)
+        AnalysisJob.objects.filter(pk=lost.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+        job, created = submit("estimate_population", self.params)
+        self.assertTrue(created)
+        self.assertNotEqual(job.pk, lost.pk)
+        self.assertEqual(AnalysisJob.objects.get(pk=lost.pk).status, AnalysisJob.FAILED)
+
+    def test_competing_job_already_finished(self, start):
+        # Параллельный запрос создал ту же задачу, и она успела упасть до нашего чтения
+        competing = AnalysisJob.objects.create(
+            kind="estimate_population", params=self.params, key=job_service.job_key("estimate_population", self.params),
+            status=AnalysisJob.FAILED, finished_at=timezone.now(),
+        )
+        with mock.patch.object(AnalysisJob.objects, "create", side_effect=IntegrityError("analysis_job_single_active")):
+            job, created = submit("estimate_population", self.params)
+        self.assertFalse(created)
+        self.assertEqual(job.pk, competing.pk)
+        start.assert_not_called()
+
+
+def write_extract(path, buildings_per_district):
+    """
+    Выгрузка-фикстура GeoJSON: районы Бишкека квадратами 0.02° в ряд
+    и по buildings_per_district[i] жилых домов в каждом.
+    """
+    names, levels, tags, geometries = [], [], [], []
+    for i, (district, count) in enumerate(zip(DISTRICTS, buildings_per_district)):
+        x0 = 74.50 + 0.02 * i
+        names.append(district.split(",")[0])
+        levels.append("9")
+        tags.append({"boundary": "administrative", "building": None})
+        geometries.append(shapely.box(x0, 42.80, x0 + 0.02, 42.82))
+        for j in range(count):
+            x, y = x0 + 0.002 + 0.003 * j, 42.81
+            names.append(None)
+            levels.append(None)
+            tags.append({"boundary": None, "building": "residential"})
+            geometries.append(shapely.box(x, y, x + 0.0005, y + 0.0005))
+    gpd.GeoDataFrame(
+        {"name": names, "admin_level": levels, **pd.DataFrame(tags).to_dict("list")},
+        geometry=geometries, crs="EPSG:4326",
+    ).to_file(path, driver="GeoJSON")
+
+
+class AnalysisJobPoolTests(TransactionTestCase):
+    """Задача целиком: координатор, spawn-пул процессов с job_tasks и запись результата."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        extract = Path(tmp.name) / "extract.geojson"
+        write_extract(extract, [3, 1, 2, 4])
+        # Процессы пула стартуют заново (spawn) и берут настройки из окружения
+        env = {
+            "OSM_DATA_SOURCE": str(extract),
+            "OSM_CACHE_DIR": str(Path(tmp.name) / "osm"),
+            "SNAPSHOT_DIR": str(Path(tmp.name) / "snapshots"),
+            "CACHE_BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "JOB_PROCESSES": "2",
+        }
+        for patch in (mock.patch.dict(os.environ, env), mock.patch.object(job_service, "_pool", None)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        settings_override = override_settings(
+            OSM_DATA_SOURCE=env["OSM_DATA_SOURCE"], OSM_CACHE_DIR=Path(env["OSM_CACHE_DIR"]),
+            SNAPSHOT_DIR=Path(env["SNAPSHOT_DIR"]), JOB_PROCESSES=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        feature_store._settings_store.cache_clear()
+        self.addCleanup(feature_store._settings_store.cache_clear)
+        self.addCleanup(lambda: job_service._pool and job_service._pool.shutdown(wait=True))
+
+    def test_estimate_population_through_process_pool(self):
+        job, created = submit("estimate_population", {"districts": DISTRICTS})
+        self.assertTrue(created)
+        deadline = time.monotonic() + 120
+        while job.status in AnalysisJob.ACTIVE and time.monotonic() < deadline:
+            time.sleep(0.2)
+            job = load_job(job.pk)
+
+        self.assertEqual(job.status, AnalysisJob.DONE, job.error)
+        self.assertEqual((job.progress_done, job.progress_total), (4, 4))
+        self.assertEqual(
+            [(row["num_buildings"], row["estimated_population"], row["region"]) for row in job.result],
+            [(3, 390_000, "bishkek"), (1, 130_000, "bishkek"), (2, 260_000, "bishkek"), (4, 520_000, "bishkek")],
+        )
+
+
+class FeatureIndexTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.lat = rng.uniform(42.80, 42.90, 500)
+        self.lon = rng.uniform(74.50, 74.60, 500)
+        replace_layer("gaps_schools", "A", self.lat[:300], self.lon[:300], np.ones(300))
+        replace_layer("gaps_schools", "B", self.lat[300:], self.lon[300:], np.ones(200))
+        rebuild_clusters("gaps_schools", max_zoom=13)
+
+    def test_clusters_cover_all_points(self):
+        features, next_cursor, clustered = viewport("gaps_schools", (74.4, 42.7, 74.7, 43.0), 10)
+        self.assertTrue(clustered)
+        self.assertIsNone(next_cursor)
+        self.assertEqual(features.fields["count"].sum(), 500)
+        self.assertEqual(features.fields["weight"].sum(), 500)
+
+    def test_pages_return_points_in_bbox_once(self):
+        bbox = (74.52, 42.82, 74.57, 42.86)
+        inside = (self.lon >= bbox[0]) & (self.lon <= bbox[2]) & (self.lat >= bbox[1]) & (self.lat <= bbox[3])
+
+        seen, cursor = [], None
+        while True:
+            features, cursor, clustered = viewport("gaps_schools", bbox, 16, cursor, limit=7)
+            self.assertFalse(clustered)
+            seen.extend(zip(features.lat.tolist(), features.lon.tolist()))
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(zip(self.lat[inside].tolist(), self.lon[inside].tolist())))
+
+        # Повторная загрузка района заменяет его точки, а не добавляет
+        replace_layer("gaps_schools", "B", [], [])
+        features, _, _ = viewport("gaps_schools", bbox, 16, limit=1000)
+        self.assertEqual(len(features), np.count_nonzero(inside[:300]))
+
+
+HEAVY_MODULES = ("numpy", "osmnx", "geopandas", "scipy", "shapely")
+
+# Настройка Django и разбор всех urls в чистом интерпретаторе
+RESOLVE_URLS = """
+import json, os, sys
+import django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+from django.urls import get_resolver, resolve
+get_resolver().url_patterns
+for path in ("/api/v1/get-schools/", "/api/v1/find-gaps/", "/api/v1/coverage-tiles/schools/12/1/2.png"):
+    resolve(path)
+print(json.dumps(sorted(name for name in %r if name in sys.modules)))
+"""
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_url_resolution_does_not_import_geo_stack(self):
+        output = subprocess.run(
+            [sys.executable, "-c", RESOLVE_URLS % (HEAVY_MODULES,)],
+            cwd=Path(__file__).resolve().parent.parent,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "core.settings"},
+            check=True, capture_output=True, text=True,
+        ).stdout
+        self.assertEqual(json.loads(output.strip().splitlines()[-1]), [])
+
+
+class CoverageEngineTests(SimpleTestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        lat, lon = rng.uniform(42.80, 42.90, 40), rng.uniform(74.50, 74.65, 40)
+        grid_lat, grid_lon = rng.uniform(42.78, 42.92, (30, 20)), rng.uniform(74.48, 74.67, (30, 20))
+        engine = CoverageEngine(lat, lon)
+
+        fx, fy = to_metric(lat, lon)
+        gx, gy = to_metric(grid_lat, grid_lon)
+        expected = np.hypot(gx[..., None] - fx, gy[..., None] - fy).min(axis=-1)
+        np.testing.assert_allclose(engine.nearest_distance(grid_lat, grid_lon), expected)
+        np.testing.assert_array_equal(engine.uncovered_mask(grid_lat, grid_lon, 1000), expected > 1000)
+        self.assertTrue(np.isinf(CoverageEngine([], []).nearest_distance(grid_lat, grid_lon)).all())
+
+
+class GreedyPlacementTests(SimpleTestCase):
+    @staticmethod
+    def naive(candidates, demand, radius, max_new, weights):
+        # Прежний цикл: на каждом шаге прирост всех кандидатов считается заново
+        reach = np.linalg.norm(candidates[:, None] - demand[None], axis=-1) <= radius
+        covered = np.zeros(len(demand), dtype=bool)
+        placements = []
+        while len(placements) < max_new:
+            gain = (reach & ~covered) @ weights
+            best = int(np.argmax(gain))
+            if gain[best] <= 1e-9:
+                break
+            placements.append(best)
+            covered |= reach[best]
+        return placements, weights[covered].sum()
+
+    def test_matches_naive_loop(self):
+        rng = np.random.default_rng(4)
+        step = np.arange(0, 3000, 250.0)
+        candidates = np.column_stack([c.ravel() for c in np.meshgrid(step, step)])
+        demand = rng.uniform(0, 3000, (300, 2))
+        for weights in (np.ones(len(demand)), rng.integers(1, 6, len(demand)).astype(float)):
+            placements, covered = self.naive(candidates, demand, 600, 15, weights)
+            result = greedy_placement(candidates, demand, 600, max_new=15, weights=weights)
+            self.assertEqual(result["placements"], placements)
+            self.assertAlmostEqual(result["covered"], covered)
+            self.assertAlmostEqual(result["uncovered"], weights.sum() - covered)
+
+
+class DistrictGridTests(SimpleTestCase):
+    # Г-образный район: часть охватывающего прямоугольника вне границы
+    polygon = shapely.Polygon([(0, 0), (4000, 0), (4000, 1500), (1500, 1500), (1500, 3000), (0, 3000)])
+
+    def test_points_are_masked_to_boundary(self):
+        grid = build_grid(self.polygon, step=250)
+        xs, ys = np.meshgrid(np.arange(0, 4250, 250.0), np.arange(0, 3250, 250.0))
+        inside = [self.polygon.contains(Point(x, y)) for x, y in zip(xs.ravel(), ys.ravel())]
+
+        self.assertEqual(len(grid), sum(inside))
+        self.assertTrue(shapely.contains_xy(self.polygon, grid.x, grid.y).all())
+        self.assertEqual(grid.shape, xs.shape)
+        np.testing.assert_array_equal(grid.x, xs[grid.row, grid.col])
+        np.testing.assert_array_equal(grid.cell_index(grid.x, grid.y), grid.row * grid.shape[1] + grid.col)
+
+    def test_population_is_conserved(self):
+        rng = np.random.default_rng(5)
+        grid = build_grid(self.polygon, step=250)
+        # Часть зданий в вырезанном углу и за краем района
+        x, y = rng.uniform(-300, 4300, 2000), rng.uniform(-300, 3300, 2000)
+        people = rng.uniform(0, 50, len(x))
+
+        binned = bin_to_grid(grid, PopulationPoints(x, y, people))
+        self.assertAlmostEqual(binned.sum(), people.sum())
+        nearest = np.hypot(x[:, None] - grid.x, y[:, None] - grid.y).argmin(axis=1)
+        np.testing.assert_allclose(binned, np.bincount(nearest, weights=people, minlength=len(grid)))
+
+
+class StreetNetworkTests(SimpleTestCase):
+    def setUp(self):
+        # Квартальная сетка 10×10 узлов с шагом 100 м, улицы в обе стороны
+        rows, cols = np.divmod(np.arange(100), 10)
+        right = np.flatnonzero(cols < 9)
+        up = np.flatnonzero(rows < 9)
+        u = np.concatenate([right, right + 1, up, up + 10])
+        v = np.concatenate([right + 1, right, up + 10, up])
+        self.network = StreetNetwork.from_arrays(cols * 100.0, rows * 100.0, u, v, np.full(len(u), 100.0))
+        self.rows, self.cols = rows, cols
+
+    def test_limit_cuts_off_only_far_nodes(self):
+        # Объект в 30 м от угла (0, 0): расстояние — подход плюс путь по кварталам
+        expected = 30 + 100.0 * (self.rows + self.cols)
+        full = self.network.node_distances([-30.0], [0.0])
+        np.testing.assert_allclose(full, expected)
+
+        limited = self.network.node_distances([-30.0], [0.0], limit=530)
+        near = expected <= 530
+        np.testing.assert_allclose(limited[near], expected[near])
+        self.assertTrue(np.isinf(limited[~near]).all())
+        self.assertTrue(np.isinf(self.network.node_distances([], [])).all())
+
+    def test_cached_graph_follows_data_version(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(NETWORK_CACHE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(network_service._load_network.cache_clear)
+        cache.clear()
+
+        with mock.patch.object(network_service.ox, "graph_from_place") as fetch, \
+                mock.patch.object(StreetNetwork, "from_graph", return_value=self.network):
+            first = network_service.load_network("Район")
+            self.assertIs(network_service.load_network("Район"), first)
+            network_service._load_network.cache_clear()
+            self.assertEqual(len(network_service.load_network("Район")), len(self.network))
+            self.assertEqual(fetch.call_count, 1)
+
+            # Новая выгрузка OSM: ни память процесса, ни файл на диске не подходят
+            bump_data_version()
+            network_service.load_network("Район")
+            self.assertEqual(fetch.call_count, 2)
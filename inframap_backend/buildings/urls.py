@@ -3,10 +3,19 @@ from django.urls import path
 
 from .views import *
 
+
 app_name = 'buildings'
 urlpatterns = [
 	path('get-schools/', GetSchools.as_view(), name='School List'),
 	path('get-clinics/', ClinicsByDistrictAPI.as_view(), name='clinics_api'),
 	path('find-gaps/', FindGapZones.as_view(), name='Find School Gaps'),
 	path('estimate-population/', PopulationEstimateView.as_view(), name='Population Estimate'),
-]
\ No newline at end of file
+	path('scenarios/', CoverageScenarioView.as_view(), name='Coverage Scenarios'),
+	path('jobs/', AnalysisJobsView.as_view(), name='Analysis Jobs'),
+	path('jobs/<uuid:job_id>/', AnalysisJobView.as_view(), name='Analysis Job'),
+	path('jobs/<uuid:job_id>/stream/', AnalysisJobStreamView.as_view(), name='Analysis Job Stream'),
+	path('features/', MapFeaturesView.as_view(), name='Map Features'),
+	path('coverage-tiles/<str:object_type>/<int:z>/<int:x>/<int:y>.<str:fmt>', CoverageTileView.as_view(), name='Coverage Tiles'),
+	path('coverage-summary/', CoverageSummaryView.as_view(), name='Coverage Summary'),
+	path('metrics/', MetricsView.as_view(), name='Metrics'),
+]
@@ -1,219 +1,357 @@
-from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
-import osmnx as ox
-import numpy as np
-import math
-import requests
-from shapely.geometry import Point
-from geopy.distance import distance as geo_distance
-import numpy as np
-import requests
-from scipy.spatial import KDTree
-from django.core.cache import cache
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from geopy.distance import geodesic
-import os
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+
+from .constants import OBJECT_TYPES, RADIUS_METERS
+from .instrumentation import metrics, stage
+from .renderers import PointPayloadMixin
+from .response_cache import cached_response, etag_matches
+
+# Сервисы (numpy, geopandas, osmnx, scipy, shapely) импортируются внутри
+# методов: разбор urls, manage.py и миграции не тянут геостек.
+# Серверные процессы загружают его заранее — см. buildings.warmup
+
+
+def request_scope(request):
+    """(режим загрузки, районы запроса); ValueError — некорректные fetch/region/bbox."""
+    from .city_service import fetch_mode
+    from .regions import requested_districts
+
+    return fetch_mode(request), requested_districts(request)
+
+
+def facilities_response(request, object_type):
+    from .facility_service import coordinates_payload, district_label, facilities_by_district
+    from .regions import default_registry, summarize
+
+    try:
+        mode, districts = request_scope(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
 
-class GetSchools(APIView):
+    by_label = {}
+    by_district = {}
+    total_count = 0
+
+    with stage("facilities"):
+        facilities_of = facilities_by_district(object_type, districts, mode=mode)
+
+    for district, facilities in facilities_of.items():
+        if 'error' in facilities:
+            by_district[district] = facilities
+        else:
+            coords = coordinates_payload(facilities)
+            by_district[district] = {
+                'count': len(coords),
+                'coordinates': coords
+            }
+            total_count += len(coords)
+        by_label[district_label(object_type, district)] = by_district[district]
+
+    return Response({
+        'total_count': total_count,
+        'districts': by_label,
+        'regions': summarize(default_registry(), by_district),
+    })
+
+
+class GetSchools(PointPayloadMixin, APIView):
+    @cached_response()
     def get(self, request):
-        districts = [
-            "Октябрьский район, город Бишкек, Киргизия",
-            "Свердловский район, город Бишкек, Киргизия",
-            "Ленинский район, город Бишкек, Киргизия",
-            "Первомайский район, город Бишкек, Киргизия"
-        ]
-
-        tags = {'amenity': 'school'}
-        result = {}
-        total_count = 0
-
-        for district in districts:
-            try:
-                gdf = ox.features_from_place(district, tags)
-                names = gdf['name'].fillna('').str.lower()
-                schools = gdf[
-                    names.str.contains('школа') &
-                    ~names.str.contains('авто|муз|спорт|искусств|центр|дополн')
-                ]
-
-                coords = []
-                for _, row in schools.iterrows():
-                    try:
-                        geom = row.geometry
-                        if geom.geom_type == 'Point':
-                            point = geom
-                        else:
-                            point = geom.centroid
-
-                        coords.append({
-                            'lat': point.y,
-                            'lon': point.x,
-                            'name': row.get('name', 'Без названия')
-                        })
-                    except Exception:
-                        continue
-
-                district_name = district.split(',')[0]
-
-                result[district_name] = {
-                    'count': len(coords),
-                    'coordinates': coords
-                }
-
-                total_count += len(coords)
-
-            except Exception as e:
-                result[district_name] = {'error': str(e)}
+        return facilities_response(request, "schools")
+
+
+class ClinicsByDistrictAPI(PointPayloadMixin, APIView):
+    @cached_response()
+    def get(self, request):
+        return facilities_response(request, "clinics")
+
+
+
+class FindGapZones(PointPayloadMixin, APIView):
+    @cached_response()
+    def get(self, request):
+        from .facility_service import facilities_by_district
+        from .gap_service import find_gaps, gap_params, gaps_payload, precomputed_gaps
+        from .concurrency import map_districts
+        from .population_service import population_surface
+
+        try:
+            params = gap_params(request.query_params)
+            object_type, max_new = params["type"], params["max_new"]
+            weight, metric = params["weight"], params["metric"]
+            mode, districts = request_scope(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        def respond(by_district):
+            return Response(gaps_payload(object_type, weight, metric, by_district))
+
+        if max_new is None and weight == "population" and metric == "euclidean":
+            precomputed = precomputed_gaps(object_type, districts)
+            if precomputed is not None:
+                return respond(precomputed)
+
+        with stage("facilities"):
+            all_districts_data = facilities_by_district(object_type, districts, mode=mode)
+        if not all_districts_data:
+            return Response({"error": f"Нет данных по районам для {object_type}"}, status=400)
+
+        population = population_surface(districts) if weight == "population" else {}
+
+        def district_gaps(district):
+            facilities = all_districts_data[district]
+            if 'error' in facilities:
+                return facilities
+            district_population = population.get(district)
+            if isinstance(district_population, dict):
+                return {'error': f"Население: {district_population['error']}"}
+            with stage("find_gaps"):
+                return find_gaps(
+                    district, facilities, RADIUS_METERS, max_new=max_new,
+                    population=district_population, metric=metric,
+                )
+
+        # Районы считаются параллельно в общем пуле: решётки и граф сети
+        # подгружаются по сети, а numpy/scipy отпускают GIL
+        return respond(map_districts(district_gaps, list(all_districts_data)))
+    
+
+class PopulationEstimateView(PointPayloadMixin, APIView):
+    """
+    Оценка населения по районам; ?buildings=1 — ещё и жители каждого
+    жилого здания (пограничное — по доле площади внутри района).
+    """
+
+    @cached_response()
+    def get(self, request):
+        from .population_service import estimate_population
+        from .regions import default_registry
+
+        try:
+            mode, districts = request_scope(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        with_buildings = request.query_params.get("buildings") in ("1", "true")
+        data = estimate_population(districts, mode=mode, with_buildings=with_buildings)
+        registry = default_registry()
+        for district, item in zip(districts, data):
+            item["region"] = registry.region_of(district).key
+        return Response(data)
+
+
+class CoverageScenarioView(APIView):
+    """
+    Сценарии "что будет, если": POST {"types", "radii", "scenarios": [{"name",
+    "add": [{type, lat, lon}], "remove": [...]}]}, районы — ?region=/?bbox=.
+    Ответ — изменения покрытия (клетки и жители) по каждому сценарию, типу
+    и радиусу. Исходное покрытие кэшируется, сценарий пересчитывает только
+    клетки рядом с изменёнными объектами.
+    """
+
+    def post(self, request):
+        from .scenario_service import parse_request, run_scenarios
+
+        try:
+            mode, districts = request_scope(request)
+            types, radii, scenarios = parse_request(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if not districts:
+            return Response({"error": "В выбранной области нет районов."}, status=400)
+
+        try:
+            result = run_scenarios(types, radii, scenarios, districts, mode)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        except RuntimeError as e:
+            return Response({"error": f"Нет исходных данных: {e}"}, status=503)
 
         return Response({
-            'total_count': total_count,
-            'districts': result
+            "types": types,
+            "radii": radii,
+            **result,
         })
 
 
-class ClinicsByDistrictAPI(APIView):
-    def get(self, request):
-        districts = [
-            "Октябрьский район, город Бишкек, Киргизия",
-            "Свердловский район, город Бишкек, Киргизия",
-            "Ленинский район, город Бишкек, Киргизия",
-            "Первомайский район, город Бишкек, Киргизия"
-        ]
-
-        tags = {'amenity': 'clinic'}
-        result = {}
-        total_count = 0
-
-        for district in districts:
-            try:
-                gdf = ox.features_from_place(district, tags)
+class AnalysisJobsView(APIView):
+    """
+    Фоновый расчёт: POST {"kind": "find_gaps" | "estimate_population",
+    "params": {"region", "bbox", "type", "max_new", "weight", "metric"}}.
+    Ответ 202 с id задачи (200 — если такая же задача уже готова); районы
+    считаются параллельно в пуле процессов, по отдельности (fetch=district).
+    Прогресс и результат — jobs/<id>/, поток NDJSON — jobs/<id>/stream/.
+    """
+
+    def post(self, request):
+        from .job_service import job_payload, parse_job, submit
+        from .models import AnalysisJob
+
+        try:
+            kind, params = parse_job(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        job, _ = submit(kind, params)
+        response = Response(job_payload(job), status=202 if job.status in AnalysisJob.ACTIVE else 200)
+        response["Location"] = reverse("buildings:Analysis Job", args=[job.pk])
+        return response
 
-                coords = []
-                for _, row in gdf.iterrows():
-                    try:
-                        point = row.geometry.centroid
-                        lat, lon = point.y, point.x
 
-                        # Пропуск NaN координат
-                        if np.isnan(lat) or np.isnan(lon):
-                            continue
+class AnalysisJobView(APIView):
+    def get(self, request, job_id):
+        from .job_service import job_payload, load_job
+        from .models import AnalysisJob
 
-                        name = row.get('name')
-                        if name is None or isinstance(name, float) and np.isnan(name):
-                            name = "Без названия"
+        try:
+            job = load_job(job_id)
+        except AnalysisJob.DoesNotExist:
+            return Response({"error": "Задача не найдена."}, status=404)
+        return Response(job_payload(job))
 
-                        coords.append({
-                            'lat': lat,
-                            'lon': lon,
-                            'name': name
-                        })
-                    except Exception:
-                        continue
 
-                result[district] = {
-                    'count': len(coords),
-                    'coordinates': coords
-                }
+class AnalysisJobStreamView(APIView):
+    """
+    NDJSON: строка при каждом изменении статуса или прогресса задачи,
+    последняя — с результатом (или ошибкой). Соединение держится до конца расчёта.
+    """
 
-                total_count += len(coords)
+    def get(self, request, job_id):
+        from .job_service import ajob_events, job_events, load_job
+        from .models import AnalysisJob
 
-            except Exception as e:
-                result[district] = {'error': str(e)}
+        try:
+            load_job(job_id)
+        except AnalysisJob.DoesNotExist:
+            return Response({"error": "Задача не найдена."}, status=404)
+
+        # Под ASGI поток должен быть асинхронным, иначе Django соберёт его целиком
+        events = ajob_events if isinstance(request._request, ASGIRequest) else job_events
+        response = StreamingHttpResponse(events(job_id), content_type="application/x-ndjson; charset=utf-8")
+        response["Cache-Control"] = "no-cache"
+        return response
+
+
+class MapFeaturesView(PointPayloadMixin, APIView):
+    """
+    Слой карты в окне: ?layer=schools|gaps_schools|sites_schools...&bbox=min_lon,min_lat,max_lon,max_lat&zoom=
+    На мелком масштабе — кластеры {lat, lon, count, weight}, на крупном —
+    точки; страницы по ?limit= и ?cursor= (next_cursor из ответа).
+    Данные — из индекса manage.py index_features.
+    """
+
+    @cached_response()
+    def get(self, request):
+        from .feature_index import PAGE_SIZE, viewport
+        from .regions import parse_bbox
+
+        params = request.query_params
+        try:
+            if "bbox" not in params or "zoom" not in params:
+                raise ValueError("Нужны параметры bbox и zoom.")
+            try:
+                zoom, limit = int(params["zoom"]), int(params.get("limit", PAGE_SIZE))
+            except ValueError:
+                raise ValueError("zoom и limit должны быть целыми числами.")
+            layer = params.get("layer", "schools")
+            with stage("viewport"):
+                features, next_cursor, clustered = viewport(
+                    layer, parse_bbox(params["bbox"]), zoom, params.get("cursor"), limit,
+                )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
         return Response({
-            'total_count': total_count,
-            'districts': result
+            "layer": layer,
+            "zoom": zoom,
+            "clustered": clustered,
+            "count": len(features),
+            "features": features,
+            "next_cursor": next_cursor,
         })
-from rest_framework.views import APIView
-from rest_framework.response import Response
-import requests
-from geopy.distance import geodesic
-import numpy as np
 
-RADIUS_METERS = 1500  # Радиус охвата
-STEP_DEGREES = 0.0045  # ~500 метров
 
-class FindGapZones(APIView):
+def distance_field_or_error(request, object_type):
+    """(поле расстояний региона ?region=, None) или (None, ответ с ошибкой)."""
+    from .distance_field import get_distance_field
+
+    try:
+        return get_distance_field(object_type, request.query_params.get("region")), None
+    except ValueError as e:
+        return None, Response({"error": str(e)}, status=400)
+    except RuntimeError as e:
+        return None, Response({"error": f"Нет исходных данных: {e}"}, status=503)
+
+
+class CoverageTileView(APIView):
+    """
+    XYZ-тайлы предрасчитанного поля расстояний региона ?region=: .png —
+    покрытие для ?radius=, .bin — сырые расстояния (uint16, метры), порог
+    применяет клиент. Поле пересчитывается при смене версии данных.
+    """
+
+    def get(self, request, object_type, z, x, y, fmt):
+        from .distance_field import render_binary_tile, render_png_tile
+
+        if object_type not in OBJECT_TYPES:
+            return Response({"error": "Недопустимый тип. Используйте 'schools' или 'clinics'."}, status=400)
+        if fmt not in ("png", "bin"):
+            return Response({"error": "Недопустимый формат тайла. Используйте 'png' или 'bin'."}, status=400)
+        if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return Response({"error": "Тайл вне диапазона."}, status=400)
+        try:
+            radius = float(request.query_params.get("radius", RADIUS_METERS))
+        except ValueError:
+            return Response({"error": "radius должен быть числом."}, status=400)
+
+        field, error = distance_field_or_error(request, object_type)
+        if error is not None:
+            return error
+        etag = f'"{field.version}-{radius:g}"' if fmt == "png" else f'"{field.version}"'
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        elif fmt == "png":
+            response = HttpResponse(render_png_tile(field, z, x, y, radius), content_type="image/png")
+        else:
+            response = HttpResponse(render_binary_tile(field, z, x, y), content_type="application/octet-stream")
+
+        response["ETag"] = etag
+        response["Cache-Control"] = f"public, max-age={settings.DISTANCE_TILE_MAX_AGE}"
+        return response
+
+
+class CoverageSummaryView(APIView):
+    """Покрытая и непокрытая площадь внутри границы региона ?region= для радиусов ?radius=."""
+
     def get(self, request):
         object_type = request.query_params.get("type", "schools")
-        if object_type not in ["schools", "clinics"]:
+        if object_type not in OBJECT_TYPES:
             return Response({"error": "Недопустимый тип. Используйте 'schools' или 'clinics'."}, status=400)
-
         try:
-            base_url = os.getenv("INTERNAL_SERVER_URL", "http://127.0.0.1:8000")
-            endpoint = f"/api/v1/get-{object_type}/"
-            response = requests.get(f"{base_url}{endpoint}")
-            if response.status_code != 200:
-                return Response({"error": f"Не удалось получить данные о {object_type}"}, status=500)
-            data = response.json()
-        except requests.RequestException as e:
-            return Response({"error": f"Ошибка при запросе данных: {str(e)}"}, status=500)
-
-        all_districts_data = data.get("districts", {})
-        if not all_districts_data:
-            return Response({"error": f"Нет данных по районам для {object_type}"}, status=400)
-
-        result = {}
-
-        for district_name, district_info in all_districts_data.items():
-            coords = district_info.get("coordinates", [])
-            if not coords:
-                result[district_name] = {
-                    "message": f"Нет {object_type} для анализа"
-                }
-                continue
-
-            all_coords = [(c["lat"], c["lon"]) for c in coords]
-
-            min_lat = min(c[0] for c in all_coords)
-            max_lat = max(c[0] for c in all_coords)
-            min_lon = min(c[1] for c in all_coords)
-            max_lon = max(c[1] for c in all_coords)
-
-            lat_range = np.arange(min_lat, max_lat + STEP_DEGREES, STEP_DEGREES)
-            lon_range = np.arange(min_lon, max_lon + STEP_DEGREES, STEP_DEGREES)
-
-            gap_zones = []
-            for lat in lat_range:
-                for lon in lon_range:
-                    point = (lat, lon)
-                    if all(geodesic(point, school).meters > RADIUS_METERS for school in all_coords):
-                        gap_zones.append({"lat": round(lat, 6), "lon": round(lon, 6)})
-
-            new_objects = []
-            covered_points = list(all_coords)
-
-            while gap_zones:
-                new_obj = gap_zones[0]
-                new_objects.append(new_obj)
-                covered_points.append((new_obj["lat"], new_obj["lon"]))
-                gap_zones = [
-                    zone for zone in gap_zones
-                    if geodesic((zone["lat"], zone["lon"]), (new_obj["lat"], new_obj["lon"])).meters > RADIUS_METERS
-                ]
-
-            result[district_name] = {
-                "new_needed": len(new_objects),
-                "new_coordinates": new_objects
-            }
+            radii = [float(r) for r in request.query_params.get("radius", str(RADIUS_METERS)).split(",")]
+        except ValueError:
+            return Response({"error": "radius должен быть числом или списком чисел через запятую."}, status=400)
 
+        field, error = distance_field_or_error(request, object_type)
+        if error is not None:
+            return error
         return Response({
             "type": object_type,
-            "radius_m": RADIUS_METERS,
-            "result": result
+            "resolution_m": field.resolution,
+            "version": field.version,
+            "coverage": [field.coverage_summary(radius) for radius in radii],
         })
-    
-from .population_service import estimate_population
 
-class PopulationEstimateView(APIView):
+
+class MetricsView(APIView):
+    """
+    Метрики этого процесса (у каждого воркера свои): гистограммы времени
+    этапов, счётчики обращений к OSM и кэшам, доли попаданий.
+    """
+
     def get(self, request):
-        districts = [
-            "Октябрьский район, Бишкек, Кыргызстан",
-            "Ленинский район, Бишкек, Кыргызстан",
-            "Первомайский район, Бишкек, Кыргызстан",
-            "Свердловский район, Бишкек, Кыргызстан"
-        ]
-        data = estimate_population(districts)
-        return Response(data)
+        return Response(metrics.snapshot())
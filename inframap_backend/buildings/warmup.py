@@ -0,0 +1,18 @@
+from django.conf import settings
+
+
+def warm_up():
+    """
+    Загружает геостек и снимок заранее. Вызывается из core.asgi и core.wsgi:
+    с gunicorn --preload это происходит один раз в мастере, и воркеры
+    получают всё через fork. manage.py, миграции и разбор urls сюда не заходят.
+    """
+    if settings.GEO_PRELOAD:
+        from . import distance_field, facility_service, gap_service, population_service  # noqa: F401
+
+    if settings.SNAPSHOT_PRELOAD:
+        from .snapshot import current_snapshot
+
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            snapshot.preload()
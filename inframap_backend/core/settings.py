@@ -49,6 +49,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Сжатие ответов (в т.ч. потоковых NDJSON) — первым, чтобы видеть итоговое тело
+    'django.middleware.gzip.GZipMiddleware',
+    # Server-Timing по этапам запроса и ?profile=1 (buildings.instrumentation)
+    'buildings.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,7 +89,7 @@ WSGI_APPLICATION = 'core.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv("SQLITE_PATH", BASE_DIR / 'db.sqlite3'),
     }
 }
 
@@ -142,3 +146,100 @@ CORS_ALLOW_CREDENTIALS = True
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Дисковый кэш выгрузок OSM (buildings.feature_store)
+
+OSM_CACHE_DIR = Path(os.getenv("OSM_CACHE_DIR", BASE_DIR / 'cache' / 'osm'))
+OSM_CACHE_TTL = int(os.getenv("OSM_CACHE_TTL", 7 * 24 * 3600))
+
+# Источник данных OSM (buildings.extract_source): 'overpass' — Overpass/Nominatim,
+# иначе путь к локальной выгрузке (.osm.pbf, GeoJSON, FlatGeobuf...).
+# OSM_BOUNDARY_SOURCE — отдельный файл с границами районов, если их нет в выгрузке
+
+OSM_DATA_SOURCE = os.getenv("OSM_DATA_SOURCE", "overpass")
+OSM_BOUNDARY_SOURCE = os.getenv("OSM_BOUNDARY_SOURCE") or None
+
+# Параллельная загрузка районов (buildings.concurrency)
+
+DISTRICT_FETCH_WORKERS = int(os.getenv("DISTRICT_FETCH_WORKERS", 8))
+DISTRICT_FETCH_TIMEOUT = float(os.getenv("DISTRICT_FETCH_TIMEOUT", 60))
+# Не больше стольких одновременных запросов к Overpass/Nominatim на процесс
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", 4))
+
+# 'district' — отдельный запрос к OSM на каждый район, 'city' — один запрос
+# на весь город с распределением объектов по районам (buildings.city_service)
+
+OSM_FETCH_MODE = os.getenv("OSM_FETCH_MODE", "district")
+
+# ?profile=1 — отчёт cProfile вместо ответа (buildings.instrumentation).
+# Только явно, REQUEST_PROFILING=1, и не на публичном сервере: отчёт раскрывает
+# устройство кода, а профилируемый запрос идёт мимо кэша ответов
+
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "0") == "1"
+
+# Предрасчитанные поля расстояний и тайлы покрытия (buildings.distance_field)
+
+DISTANCE_FIELD_DIR = Path(os.getenv("DISTANCE_FIELD_DIR", BASE_DIR / 'cache' / 'fields'))
+DISTANCE_FIELD_RESOLUTION = int(os.getenv("DISTANCE_FIELD_RESOLUTION", 50))
+DISTANCE_TILE_MAX_AGE = int(os.getenv("DISTANCE_TILE_MAX_AGE", 3600))
+
+# Кэш пешеходных графов районов в CSR-виде (buildings.network_service)
+
+NETWORK_CACHE_DIR = Path(os.getenv("NETWORK_CACHE_DIR", BASE_DIR / 'cache' / 'networks'))
+
+# Кэш ответов API и версия данных (buildings.response_cache). Кэш должен быть
+# общим для всех процессов: версию данных меняют и manage.py (index_features,
+# build_snapshot), и другие воркеры. По умолчанию — файловый кэш на этой
+# машине; для нескольких машин — общий (например,
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...).
+# LocMemCache виден только своему процессу и годится лишь для одного воркера
+# без фоновых команд
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv("CACHE_LOCATION", str(BASE_DIR / 'cache' / 'responses')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv("CACHE_MAX_ENTRIES", 10000))},
+    }
+}
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 600))
+RESPONSE_CACHE_STALE = int(os.getenv("RESPONSE_CACHE_STALE", 3600))
+# Ответ, где у части районов ошибка, живёт не дольше этого
+RESPONSE_CACHE_ERROR_TIMEOUT = int(os.getenv("RESPONSE_CACHE_ERROR_TIMEOUT", 30))
+RESPONSE_CACHE_LOCK_TIMEOUT = int(os.getenv("RESPONSE_CACHE_LOCK_TIMEOUT", 120))
+RESPONSE_CACHE_DATA_VERSION = os.getenv("RESPONSE_CACHE_DATA_VERSION", "1")
+
+# Снимки предрасчитанных данных (manage.py build_snapshot, buildings.snapshot)
+
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", BASE_DIR / 'cache' / 'snapshots'))
+SNAPSHOT_PRELOAD = os.getenv("SNAPSHOT_PRELOAD", "1") == "1"
+
+# Серверные точки входа (core.asgi, core.wsgi) заранее импортируют геостек
+# (buildings.warmup); manage.py и разбор urls грузят его только при первом расчёте
+
+GEO_PRELOAD = os.getenv("GEO_PRELOAD", "1") == "1"
+
+# Реестр регионов (buildings.regions). REGIONS_FILE — файл с границами районов
+# (GeoJSON, GeoPackage, FlatGeobuf...) с колонками region, district и
+# необязательными region_name, city, population; дополняет встроенный
+# реестр buildings.constants.REGIONS. Запросы без ?region=/?bbox= идут по DEFAULT_REGION
+
+REGIONS_FILE = os.getenv("REGIONS_FILE") or None
+DEFAULT_REGION = os.getenv("DEFAULT_REGION", "bishkek")
+
+# Фоновые задачи (buildings.job_service): районы считаются в пуле из
+# JOB_PROCESSES процессов, одновременно ведётся не больше JOB_MAX_ACTIVE задач
+# на процесс сервера. Задача без отметки жизни дольше JOB_STALE_SECONDS
+# считается потерянной (сервер перезапущен), готовый результат повторно
+# отдаётся JOB_RESULT_TTL секунд
+JOB_PROCESSES = int(os.getenv("JOB_PROCESSES", os.cpu_count() or 2))
+JOB_MAX_ACTIVE = int(os.getenv("JOB_MAX_ACTIVE", 16))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 5))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 120))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 24 * 3600))
+
+# Пространственный индекс результатов для запросов по окну карты
+# (buildings.feature_index, manage.py index_features): до FEATURE_CLUSTER_MAX_ZOOM
+# включительно отдаются кластеры, крупнее — сами точки
+FEATURE_CLUSTER_MAX_ZOOM = int(os.getenv("FEATURE_CLUSTER_MAX_ZOOM", 13))
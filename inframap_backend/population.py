@@ -1,16 +1,13 @@
 import osmnx as ox
 import geopandas as gpd
 
+from buildings.constants import REGIONS
+
 # Общая численность населения
-total_population = 1_300_000
-
-# Названия районов Бишкека (можно расширить)
-districts = [
-    "Октябрьский район, Бишкек, Кыргызстан",
-    "Ленинский район, Бишкек, Кыргызстан",
-    "Первомайский район, Бишкек, Кыргызстан",
-    "Свердловский район, Бишкек, Кыргызстан"
-]
+total_population = REGIONS["bishkek"]["population"]
+
+# Названия районов Бишкека — те же, что в API (buildings.constants)
+districts = REGIONS["bishkek"]["districts"]
 
 results = []
 